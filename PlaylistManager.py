@@ -1,8 +1,17 @@
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 from dotenv import load_dotenv
 from spotipy.oauth2 import SpotifyOAuth
 from datetime import datetime
 import spotipy, pickle, re, time
+from app.http_pool import instrument
+from app.matching import LibraryIndex, find_duplicates, meta_rows
+from app.metrics import counted
+from app.pagination import MAX_WORKERS, fetch_items
+from app.liked_sync import sync_saved_tracks
+from app.playlist_writer import sync_playlist
+from app.tracks import Track, TrackTable
 load_dotenv()
 
 
@@ -23,6 +32,16 @@ Cant mute when on phone: HTTP Error for PUT to https://api.spotify.com/v1/me/pla
 """
 
 
+def load_pickled_tracks(path):
+    """
+    Loads a track list saved by `dump_tracks`. Pickles written before tracks
+    became `Track` records hold (id, artist, title) tuples; those are upgraded.
+    """
+    with open(path, 'rb') as f:
+        tracks = pickle.load(f)
+    return [Track(t[0], name=t[2], artists=t[1]) if isinstance(t, tuple) else t for t in tracks]
+
+
 class Cleaner:
     """
     Main functions:
@@ -57,7 +76,7 @@ class Cleaner:
             user-read-playback-position \
             user-modify-playback-state \
             "
-        self.sp = spotipy.Spotify(auth_manager=SpotifyOAuth(scope=scopes))
+        self.sp = instrument(spotipy.Spotify(auth_manager=SpotifyOAuth(scope=scopes)))
         self.user_id = self.sp.current_user()['id']
         if not debug:
             self.driver()
@@ -102,6 +121,7 @@ class Cleaner:
             print()
             self.driver()
 
+    @counted('merge_playlists')
     def merge_playlists(self, sources):
         """
         Creates new merged playlist without crossovers. 
@@ -114,24 +134,34 @@ class Cleaner:
         Returns playlist name
         """
         sources = self.validate_sources(sources)
-        pnames = [self.sp.playlist(id)['name'] for id in sources]
-        pname = " + ".join(pnames)
+        # One concurrent round of playlist objects gives both the names and
+        # the first page of tracks of every source.
+        with ThreadPoolExecutor(max_workers=max(1, min(len(sources), MAX_WORKERS))) as pool:
+            playlists = [f.result() for f in [pool.submit(contextvars.copy_context().run, self.sp.playlist, pid)
+                                              for pid in sources]]
+        pname = " + ".join(p['name'] for p in playlists)
         if not (new_pl := self.create_pl(pname)):
             print("Aborted")
             return
 
-        songs = self.get_tracks(sources)
-        title_counts = Counter(t for *_, t in songs)
-        uniques, seen = [], set()
-        for i, a, t in songs:
-            key = (a, t)
-            if title_counts[t] == 1 or key not in seen:
-                uniques.append(i)
-                seen.add(key)
+        # Remaining pages of every source download concurrently; dedup (by id,
+        # then by artist/title) streams through the sources in order.
+        uniques, seen_ids, seen_keys = [], set(), set()
+        with ThreadPoolExecutor(max_workers=max(1, min(len(sources), MAX_WORKERS))) as pool:
+            for tracks in [pool.submit(contextvars.copy_context().run, self.get_playlist_tracks, p) for p in playlists]:
+                for t in tracks.result():
+                    if t.id in seen_ids:
+                        continue
+                    seen_ids.add(t.id)
+                    if (key := (t.artist, t.name)) in seen_keys:
+                        continue
+                    seen_keys.add(key)
+                    uniques.append(t.id)
 
         self.add_tracks(new_pl, uniques)
         return pname
 
+    @counted('clean_out_playlist')
     def clean_out_playlist(self, playlist, to_return=[]):
         """
         Creates new playlist with already-saved tracks removed.
@@ -143,23 +173,19 @@ class Cleaner:
         Returns name of new playlist, or list if there are 2 (another backed up)
         """
         pid = self.validate_sources([playlist])[0]
-        name = self.sp.playlist(pid)['name']
+        source = self.sp.playlist(pid)
+        name = source['name']
         pname1 = "Cleaned: " + name
         if not (new_pl := self.create_pl(pname1)):
             print("Aborted")
             return
         to_return.append(pname1)
-        pl_tracks, al_tracks = self.get_tracks(pid), self.get_tracks(everything=True, excepted=pid)
-        t_counts_pl, t_counts_al = Counter(t for *_, t in pl_tracks), Counter(t for *_, t in al_tracks)
-        potential_saved = set(t_counts_pl) & set(t_counts_al)
-        uniques, seen, already_saved = [], set(), []
-        seen = {(a, t) for _, a, t in al_tracks if t in potential_saved}
-        for i, a, t in pl_tracks:
-            if t in potential_saved and (a, t) in seen:
-                already_saved.append(i)
-            else:
-                uniques.append(i)
-                seen.add((a, t))
+        pl_tracks, al_tracks = TrackTable(self.get_playlist_tracks(source)).tracks, self.get_tracks(everything=True, excepted=pid)
+        index = LibraryIndex()
+        index.add_source('library', meta_rows(al_tracks))
+        flags = index.classify(meta_rows(pl_tracks))
+        uniques = [t.id for t, saved in zip(pl_tracks, flags) if not saved]
+        already_saved = [t.id for t, saved in zip(pl_tracks, flags) if saved]
 
         self.add_tracks(new_pl, uniques)
         if (n_rem := len(already_saved)) == 0:
@@ -175,6 +201,7 @@ class Cleaner:
             to_return.append(pname2)
         return to_return[0] if len(to_return)==1 else to_return
     
+    @counted('save_queue')
     def save_queue(self):
         """
         Saves current queue to playlist. Spotify only allows up to 100 queued songs
@@ -245,7 +272,7 @@ class Cleaner:
             pid: playlist id
             fn: filename without extension
         """
-        ids, *_ = zip(*self.get_tracks(pid))
+        ids = [t.id for t in self.get_tracks(pid)]
         with open(fn+".txt", "w+") as f:
             for id in ids:
                 f.write(id+'\n')
@@ -272,27 +299,21 @@ class Cleaner:
                 prev_unix = int(dt.timestamp()*1000 - 1e8) 
                 try:
                     if item['context']['uri'].endswith(pid):
-                        id, artist, title = track['id'], track['artists'][0]['name'], track['name']
-                        listened_songs.append((id, artist, title))
+                        if t := Track.from_api(track):
+                            listened_songs.append(t)
                 except:
                     continue
-        # for i,a,t in listened_songs:
-        #     print(f"Listened to {t} by {a} ({i})")
-        return [i[0] for i in listened_songs]
+        # for t in listened_songs:
+        #     print(f"Listened to {t.name} by {t.artist} ({t.id})")
+        return [t.id for t in listened_songs]
 
     def check_playlist_for_duplicates(self, playlist):
         pid = self.validate_sources([playlist])[0]
         pl_tracks = self.get_tracks(pid)
-        dupes, seen, t_counts = [], set(), Counter(t for _, _, t in pl_tracks)
-        for i, a, t in pl_tracks:
-            if t_counts[t] > 1:
-                if (a, t) not in seen:
-                    seen.add((a, t))
-                else:
-                    dupes.append((i,a,t))
+        dupes = [pl_tracks[n] for n in find_duplicates(meta_rows(pl_tracks))]
         if dupes:
-            for i, a, t in dupes:
-                print(f"{t} by {a} ({i})")
+            for t in dupes:
+                print(f"{t.name} by {t.artist} ({t.id})")
             return dupes
         else:
             print("No duplicates!")
@@ -308,7 +329,7 @@ class Cleaner:
         """
         pid = self.validate_sources([playlist])[0]
         pl_tracks = self.get_tracks(pid)
-        unique_ids = [i[0] for i in pl_tracks if i[0] not in ids]
+        unique_ids = [t.id for t in pl_tracks if t.id not in ids]
         n_removed = len(pl_tracks) - len(unique_ids)
         pname = f"{n_removed} removed: {self.sp.playlist(pid)['name']}"
         if not (new_pl := self.create_pl(pname)):
@@ -324,21 +345,20 @@ class Cleaner:
         pname = "Liked songs as playlist"
         pid = self.create_pl(pname, return_existing=True)
         n = self.sp.playlist(pid)['tracks']['total']
-        songs = [i[0] for i in self.get_tracks()]
-        self.sp.playlist_replace_items(pid, [])
-        self.add_tracks(pid, songs)
+        songs = [t.id for t in sync_saved_tracks(self.sp, self.user_id)]
+        sync_playlist(self.sp, pid, [f"spotify:track:{i}" for i in songs])
         return len(songs)-n
 
     def manage_others(self, others="others"):
         # songs = self.get_tracks(others)
         songs = self.load_tracks(fn="others")
 
-        moved, a_songs, a_counts = [], {}, Counter(a for _, a, _ in songs)
-        for i, a, _ in songs:
-            if a in a_songs:
-                a_songs[a].append(i)
+        moved, a_songs, a_counts = [], {}, Counter(t.artist for t in songs)
+        for t in songs:
+            if t.artist in a_songs:
+                a_songs[t.artist].append(t.id)
             else:
-                a_songs[a] = [i]
+                a_songs[t.artist] = [t.id]
         my_saved_pls = {i[1]: i[0] for i in self.get_my_playlists(only_mine=True)}
         for a, n in a_counts.most_common():
             if n > 7:
@@ -346,7 +366,7 @@ class Cleaner:
                 pname = f"{a} - others"
                 if pname in my_saved_pls:
                     pid = my_saved_pls[pname]
-                    if {i for i, *_ in self.get_tracks(pid)} == set(ids):
+                    if {t.id for t in self.get_tracks(pid)} == set(ids):
                         print(f"Identical playlist already exists for {a}")
                         continue
                 else:
@@ -354,7 +374,7 @@ class Cleaner:
                 self.sp.playlist_replace_items(pid, [])
                 self.add_tracks(pid, ids)
                 print(f"Created playlist for {a} with {n} songs")
-        leftover_ids = [i for i, _, _ in songs if i not in moved]
+        leftover_ids = [t.id for t in songs if t.id not in moved]
         pname = "smaller others"
         pid = self.create_pl(pname, return_existing=True)
         self.sp.playlist_replace_items(pid, [])
@@ -389,10 +409,10 @@ class Cleaner:
         Prints track information in alphabetical order by title.
 
         Parameters:
-            info: set of tuples describing tracks
+            info: collection of Track records
         """
-        for id, artist, title in sorted(info, key=lambda x: x[2].lower()):
-            print(f"{title} - {artist} ({id})")
+        for t in sorted(info, key=lambda t: t.name.lower()):
+            print(f"{t.name} - {t.artist} ({t.id})")
 
     def dump_tracks(self, fn='tracks', tracks=None, **kwargs):
         """
@@ -400,7 +420,7 @@ class Cleaner:
 
         Parameters:
             fn: filename without extension
-            tracks: list of tuples describing tracks (id, artist, title)
+            tracks: list of Track records
             **kwargs: passed directly to get_tracks (e.g., sources, everything, liked_songs)
         """
         with open(fn+'.pkl', 'wb') as f:
@@ -417,7 +437,7 @@ class Cleaner:
         Parameters:
             fn: filename without extension
         """
-        return pickle.load(open(fn+'.pkl', 'rb'))
+        return load_pickled_tracks(fn+'.pkl')
 
     def load_playlist_from_profile(self):
         """
@@ -447,10 +467,24 @@ class Cleaner:
                 items += source["items"]
         return items
 
+    # Helper
+    def get_playlist_tracks(self, playlist):
+        """
+        Returns list of Track records for a full playlist object, reusing the
+        first page of tracks embedded in it.
+
+        Parameters:
+            playlist: playlist object as returned by sp.playlist
+        """
+        items = fetch_items(lambda offset: self.sp.playlist_items(playlist['id'], limit=100, offset=offset),
+                            100, self.sp.next, first=playlist['tracks'])
+        tracks = (Track.from_api(item['track']) for item in items)
+        return [t for t in tracks if t and t.artist]
+
     # Helper
     def get_tracks(self, sources=None, fn=None, excepted=[], everything=False, liked_songs=False, only_mine=True):
         """
-        Returns list of tuples describing track (id, artist, title).
+        Returns list of Track records.
         Excludes episodes, local files, and duplicate IDs.
             - If sources is empty, defaults to liked songs
             - If everything is True, includes liked songs and all playlists created by the user
@@ -466,27 +500,22 @@ class Cleaner:
             liked_songs : boolean
         """
         if fn is not None:
-            with open(fn+".pkl", "rb") as f:
-                return pickle.load(f)
+            return load_pickled_tracks(fn+".pkl")
         else:
             sources, excepted = self.validate_sources(sources), self.validate_sources(excepted)
             
             if sources:
                 track_pages = [self.sp.playlist(id)['tracks'] for id in [id_keep for id_keep in sources if id_keep not in excepted]]
                 if liked_songs:
-                    track_pages.append(self.sp.current_user_saved_tracks())
+                    track_pages.append(self.sp.current_user_saved_tracks(limit=50))
             else:
-                track_pages = [self.sp.current_user_saved_tracks()]
+                track_pages = [self.sp.current_user_saved_tracks(limit=50)]
                 if everything:
                     other_pls = [i[0] for i in self.get_my_playlists(only_mine) if i[0] not in excepted]
                     track_pages += [self.sp.playlist(id)['tracks'] for id in other_pls]
                 
-            items, info = self.get_all(track_pages), {}
-            for track in items:
-                if track['track'] and track['track']['id'] and track["track"]['artists'][0]['name']:
-                    info[track["track"]["id"]] = (track["track"]['artists'][0]['name'], track["track"]['name'])
-            info = [(id, artist, title) for id, (artist, title) in info.items()]
-            return info
+            tracks = (Track.from_api(item['track']) for item in self.get_all(track_pages))
+            return TrackTable(t for t in tracks if t and t.artist).tracks
 
     # Helper
     def get_pid(self, playlist_name, to_return=[]):
@@ -584,14 +613,14 @@ class Cleaner:
         Sorts songs by popularity (0-100) on Spotify and writes to most_listened.txt
 
         Parameters:
-            songs: list of tuples describing tracks (id, artist, title)
+            songs: list of Track records
             source: playlist id or name to fetch songs from if songs is None
         """
         if songs is None:
             songs = self.get_tracks(source)
         most_listened = []
         z=0
-        for i, *_ in songs:
+        for i in (t.id for t in songs):
             if z%50==0:
                 time.sleep(0.2)
                 print(f"Processed {z} songs")
@@ -606,6 +635,7 @@ class Cleaner:
         return [i for i, _ in most_listened]
 
 
-# sp = Cleaner(debug=False)
-sp = Cleaner(debug=True)
-sp.load_playlist_from_profile()
\ No newline at end of file
+if __name__ == '__main__':
+    # sp = Cleaner(debug=False)
+    sp = Cleaner(debug=True)
+    sp.load_playlist_from_profile()
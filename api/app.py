@@ -1,6 +1,10 @@
 # api/app.py
 # Vercel Python WSGI entrypoint. Exposes a WSGI callable named `app`.
 # It imports the Flask app from your package without running a server.
+import logging
+import time
+
+_started = time.perf_counter()
 
 try:
     # Prefer the Flask instance defined in app/main.py
@@ -14,5 +18,10 @@ except Exception:
         # Raise so Vercel build logs show the problem clearly
         raise
 
+# Time spent importing the app on this (cold) start; logged at INFO so it
+# adds no warning per invocation, and budgeted by bench/cold_start.py.
+IMPORT_MS = (time.perf_counter() - _started) * 1000
+logging.getLogger(__name__).info('cold start: app imported in %.1f ms', IMPORT_MS)
+
 # Some runtimes expect `application` as well
 application = app
@@ -0,0 +1,382 @@
+"""Asyncio backend for the Spotify Web API, built on httpx.
+
+`AsyncSpotifyClient` mirrors the read side of `SpotifyClient` (listing,
+playlist tracks, liked songs, library snapshot) plus the clean and merge
+operations, but issues its requests as coroutines: the pages of a playlist
+and the playlists of a library are all fetched concurrently, and a whole
+compare or clean runs on one event loop instead of tying up a thread per
+request.
+
+Every coroutine runs on a single background event loop owned by this
+module, which also owns the shared `httpx.AsyncClient` (one keep-alive
+connection pool for the process). Synchronous code (Flask views, job
+workers) calls `run_async(coro)`; async views can `await
+asyncio.wrap_future(submit_async(coro))`. Requests go through
+`SCHEDULER.acall`, so rate limits and 429 handling are shared with the
+spotipy clients, and reads go through the same library cache.
+
+Select it for compare and clean with SPOTIFY_BACKEND=async. httpx is an
+optional dependency (`pip install -r requirements-async.txt`); without it the
+sync backend is used whatever SPOTIFY_BACKEND says.
+"""
+import asyncio
+import contextvars
+import importlib.util
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from app.library_cache import LIBRARY
+from app.liked_sync import sync_saved_tracks
+from app.metrics import METRICS, counted
+from app.owned_index import get_owned_index, save_owned_index
+from app.scheduler import SCHEDULER
+from app.spotify_client import API_URL, spotify_for_token, write_playlist_tracks
+from app.tracks import Track
+
+
+BACKEND = os.getenv('SPOTIFY_BACKEND', 'sync').strip().lower()
+POOL_MAXSIZE = int(os.getenv('SPOTIFY_POOL_MAXSIZE', '32'))
+TIMEOUT = float(os.getenv('SPOTIFY_ASYNC_TIMEOUT', '20'))
+PAGE_WINDOW = int(os.getenv('SPOTIFY_PAGE_WORKERS', '8')) * 2
+
+_loop = None
+_http = None
+_lock = threading.Lock()
+
+
+def async_enabled():
+    """True when the asyncio backend is selected and httpx is importable."""
+    return BACKEND == 'async' and importlib.util.find_spec('httpx') is not None
+
+
+def _get_loop():
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='spotify-async', daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def _get_http():
+    """Return the shared AsyncClient (only call on the backend's loop)."""
+    global _http
+    if _http is None:
+        # Imported here so the sync backend never pays for it at startup.
+        import httpx
+        limits = httpx.Limits(max_connections=POOL_MAXSIZE, max_keepalive_connections=POOL_MAXSIZE)
+        _http = httpx.AsyncClient(base_url=API_URL, limits=limits, timeout=TIMEOUT,
+                                  transport=httpx.AsyncHTTPTransport(retries=3))
+    return _http
+
+
+def submit_async(coro):
+    """Schedule `coro` on the backend loop and return a concurrent.futures.Future.
+
+    The coroutine runs with the caller's context variables (e.g. the request timer).
+    """
+    ctx = contextvars.copy_context()
+
+    async def in_context():
+        for var, value in ctx.items():
+            var.set(value)
+        return await coro
+
+    return asyncio.run_coroutine_threadsafe(in_context(), _get_loop())
+
+
+def run_async(coro, timeout=None):
+    """Run `coro` on the backend loop and block until it finishes."""
+    return submit_async(coro).result(timeout)
+
+
+async def acquire_lock(lock, poll=0.01):
+    """Acquire the thread lock `lock` from a coroutine without blocking the loop.
+
+    Only non-blocking attempts are made, so a waiter that is cancelled
+    never ends up holding the lock.
+    """
+    while not lock.acquire(blocking=False):
+        await asyncio.sleep(poll)
+
+
+def iter_async(agen):
+    """Iterate the async generator `agen` from synchronous code.
+
+    Each item costs one round trip to the backend loop, so the caller works
+    on it while the generator's tasks keep running there; closing the
+    iterator closes `agen` on the loop.
+    """
+    try:
+        while True:
+            try:
+                item = run_async(agen.__anext__())
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        run_async(agen.aclose())
+
+
+class AsyncSpotifyClient:
+    """Coroutine-based counterpart of `SpotifyClient` for one access token."""
+
+    def __init__(self, access_token, user_id=None):
+        self.access_token = access_token
+        self.user_id = user_id
+        self._headers = {'Authorization': f'Bearer {access_token}'}
+
+    async def _send(self, method, path, params=None, body=None):
+        resp = await _get_http().request(method, path, params=params, json=body, headers=self._headers)
+        METRICS.observe_spotify(method, str(resp.url), resp.status_code, len(resp.content),
+                                resp.elapsed.total_seconds() * 1000)
+        resp.raise_for_status()
+        if resp.status_code == 204 or not resp.content:
+            return None
+        return resp.json()
+
+    async def _request(self, method, path, params=None, body=None):
+        return await SCHEDULER.acall(self.access_token, self._send, method, path, params, body)
+
+    async def _iter_items(self, path, limit, params=None):
+        """Yield the items of a paginated endpoint in order, pages fetched concurrently."""
+        params = dict(params or {}, limit=limit)
+        first = await self._request('GET', path, dict(params, offset=0)) or {}
+        for item in first.get('items') or []:
+            yield item
+        total = first.get('total') or 0
+        offsets = iter(range(limit, total, limit))
+        pending = deque()
+        for offset in offsets:
+            pending.append(asyncio.ensure_future(self._request('GET', path, dict(params, offset=offset))))
+            if len(pending) >= PAGE_WINDOW:
+                break
+        try:
+            while pending:
+                page = await pending.popleft() or {}
+                offset = next(offsets, None)
+                if offset is not None:
+                    pending.append(asyncio.ensure_future(self._request('GET', path, dict(params, offset=offset))))
+                for item in page.get('items') or []:
+                    yield item
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def current_user_id(self):
+        if not self.user_id:
+            self.user_id = (await self._request('GET', 'me') or {}).get('id')
+        return self.user_id
+
+    async def get_playlists(self):
+        uid = await self.current_user_id()
+        cached = LIBRARY.get_listing(uid)
+        if cached is not None:
+            return cached
+        playlists = []
+        async for p in self._iter_items('me/playlists', 50):
+            playlists.append({
+                'id': p['id'],
+                'name': p['name'],
+                'tracks': p['tracks']['total'],
+                'snapshot_id': p.get('snapshot_id'),
+            })
+        playlists.sort(key=lambda p: (p.get('name') or '').lower())
+        LIBRARY.put_listing(uid, playlists)
+        return playlists
+
+    async def get_user_playlists(self, user_id):
+        playlists = []
+        async for p in self._iter_items(f'users/{user_id}/playlists', 50):
+            playlists.append({
+                'id': p['id'],
+                'name': p['name'],
+                'tracks': p['tracks']['total'],
+                'images': p.get('images', []),
+                'snapshot_id': p.get('snapshot_id'),
+            })
+        LIBRARY.note_snapshots(await self.current_user_id(), playlists)
+        return playlists
+
+    async def iter_playlist_tracks(self, playlist_id):
+        """Yield a playlist's tracks as `Track` records (cached per snapshot id)."""
+        uid = await self.current_user_id()
+        cached = LIBRARY.get_tracks(uid, playlist_id)
+        if cached is not None:
+            for t in cached:
+                yield t
+            return
+        tracks = []
+        params = {'fields': 'items.track(id,uri,name,artists,album),next,total'}
+        async for item in self._iter_items(f'playlists/{playlist_id}/tracks', 100, params):
+            t = Track.from_api(item.get('track'))
+            if t is not None:
+                tracks.append(t)
+                yield t
+        LIBRARY.put_tracks(uid, playlist_id, tracks)
+
+    async def get_playlist_tracks_meta(self, playlist_id):
+        return [t async for t in self.iter_playlist_tracks(playlist_id)]
+
+    async def get_many_playlist_tracks(self, playlist_ids, skip_errors=False):
+        """Return {playlist id: [Track]} for several playlists, fetched concurrently.
+
+        With `skip_errors`, a playlist that fails to load is logged and maps
+        to None (as in `SpotifyClient.iter_many_playlist_tracks`); otherwise
+        the first failure is raised. The listing is revalidated first, so
+        cached tracks are only reused at each playlist's current snapshot.
+        """
+        await self.get_playlists()
+        ids = list(dict.fromkeys(pid for pid in playlist_ids if pid))
+        results = await asyncio.gather(*(self.get_playlist_tracks_meta(pid) for pid in ids), return_exceptions=True)
+        out = {}
+        for pid, res in zip(ids, results):
+            if isinstance(res, BaseException):
+                if not skip_errors:
+                    raise res
+                logging.getLogger(__name__).error('Failed to fetch tracks for playlist %s: %s', pid, res)
+                res = None
+            out[pid] = res
+        return out
+
+    async def get_saved_tracks_meta(self):
+        """Return the liked songs as `Track`s (incremental sync, run off the loop)."""
+        uid = await self.current_user_id()
+        cached = LIBRARY.get_saved(uid)
+        if cached is not None:
+            return list(cached)
+        # The watermark sync is a handful of sequential calls; reuse it as is.
+        tracks = await asyncio.to_thread(sync_saved_tracks, spotify_for_token(self.access_token), uid)
+        LIBRARY.put_saved(uid, tracks)
+        return list(tracks)
+
+    async def get_library_snapshot(self, exclude_ids=()):
+        """Async `SpotifyClient.get_library_snapshot`: liked songs and every playlist fetched concurrently."""
+        exclude = {pid for pid in exclude_ids if pid}
+        saved_task = asyncio.ensure_future(self.get_saved_tracks_meta())
+        playlists = [p for p in await self.get_playlists() if p.get('id') and p['id'] not in exclude]
+        tracks = await self.get_many_playlist_tracks([p['id'] for p in playlists], skip_errors=True)
+        try:
+            saved = await saved_task
+        except Exception:
+            logging.getLogger(__name__).exception('Failed to sync liked songs')
+            saved = []
+        return {'saved': saved, 'playlists': [(p, tracks.get(p['id']) or []) for p in playlists]}
+
+    async def get_owned_index(self):
+        """Async `SpotifyClient.get_owned_index`: the same index, refreshed with
+        the stale playlists and the liked songs read concurrently.
+        """
+        uid = await self.current_user_id()
+        index = get_owned_index(uid)
+        logger = logging.getLogger(__name__)
+        # The index lock is a thread lock shared with the sync backend.
+        await acquire_lock(index.lock)
+        try:
+            saved_task = asyncio.ensure_future(self.get_saved_tracks_meta())
+            changed, stale = index.prune(await self.get_playlists())
+            fetched = await self.get_many_playlist_tracks(stale, skip_errors=True)
+            try:
+                saved_ids = [t.id for t in await saved_task]
+            except Exception:
+                logger.exception('Failed to refresh liked songs in the owned-tracks index')
+                saved_ids = None
+            changed = index.refresh(fetched.items(), lambda pid: LIBRARY.snapshot_id(uid, pid), saved_ids) or changed
+            if changed:
+                save_owned_index(uid, index)
+        finally:
+            index.lock.release()
+        logger.info("owned index for %s: sources=%d tracks=%d refreshed=%d",
+                    uid, len(index.sources), len(index.owners), len(stale))
+        return index
+
+    @staticmethod
+    async def _in_order(ids, tasks, skip_errors):
+        try:
+            for pid, task in zip(ids, tasks):
+                try:
+                    tracks = await task
+                except Exception as e:
+                    if not skip_errors:
+                        raise
+                    logging.getLogger(__name__).error('Failed to fetch tracks for playlist %s: %s', pid, e)
+                    tracks = None
+                yield pid, tracks
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def iter_compare_sources(self, playlist_ids):
+        """Yield the library snapshot, then (playlist id, [Track] or None) per compared playlist.
+
+        Every compared playlist starts downloading alongside the library, and
+        each is yielded in order as soon as it has arrived, so a compare job
+        reading this through `iter_async` publishes partial results as it goes.
+        """
+        ids = list(playlist_ids)
+        tasks = [asyncio.ensure_future(self.get_playlist_tracks_meta(pid)) for pid in ids]
+        pairs = self._in_order(ids, tasks, skip_errors=True)
+        try:
+            yield await self.get_library_snapshot()
+            async for pair in pairs:
+                yield pair
+        finally:
+            for task in tasks:
+                task.cancel()
+            await pairs.aclose()
+
+    async def _add_items(self, playlist_id, uris):
+        for i in range(0, len(uris), 100):
+            await self._request('POST', f'playlists/{playlist_id}/tracks', body={'uris': uris[i:i + 100]})
+
+    async def _create_playlist(self, name, uris):
+        uid = await self.current_user_id()
+        playlist = await self._request('POST', f'users/{uid}/playlists', body={'name': name, 'public': False})
+        await self._add_items(playlist['id'], uris)
+        LIBRARY.invalidate_listing(uid)
+        return playlist
+
+    @counted('merge_playlists')
+    async def merge_playlists(self, playlist_ids, new_name='Merged Playlist'):
+        tracks = await self.get_many_playlist_tracks(playlist_ids)
+        seen, uris = set(), []
+        for pid in playlist_ids:
+            for t in tracks.get(pid, ()):
+                if t.uri not in seen:
+                    seen.add(t.uri)
+                    uris.append(t.uri)
+        return await self._create_playlist(new_name, uris)
+
+    @counted('clean_out_playlist')
+    async def clean_out_playlist(self, playlist_id, new_name=None, overwrite_playlist_id=None, progress_cb=None):
+        """Async `SpotifyClient.clean_out_playlist`; returns (playlist, removed count)."""
+        # Same rule as the sync client: a track is saved when the owned-tracks
+        # index has it in the liked songs or any playlist other than these.
+        exclude = {playlist_id, overwrite_playlist_id} - {None}
+        target_task = asyncio.ensure_future(self.get_playlist_tracks_meta(playlist_id))
+        try:
+            owned = await self.get_owned_index()
+        except Exception:
+            # Fall back to keeping every track rather than failing the clean.
+            logging.getLogger(__name__).exception('Failed to refresh the owned-tracks index')
+            owned = None
+        tracks = await target_task
+        keep = [t for t in tracks if owned is None or not owned.owned(t.id, exclude)]
+        if progress_cb:
+            try:
+                progress_cb(len(tracks), len(tracks))
+            except Exception:
+                pass
+        removed = len(tracks) - len(keep)
+        uid = await self.current_user_id()
+        if overwrite_playlist_id:
+            await asyncio.to_thread(write_playlist_tracks, spotify_for_token(self.access_token), uid,
+                                    overwrite_playlist_id, keep)
+            return await self._request('GET', f'playlists/{overwrite_playlist_id}'), removed
+        name = new_name or f"Cleaned - {time.strftime('%Y-%m-%d %H:%M')}"
+        return await self._create_playlist(name, [t.uri for t in keep]), removed
@@ -0,0 +1,69 @@
+"""Process-wide HTTP connection pool for api.spotify.com.
+
+All spotipy clients share one `requests.Session`, so warm requests reuse
+keep-alive TCP connections and TLS sessions instead of opening new ones.
+The adapter's pool is sized for the concurrent paginators and background
+tasks, and it retries connection errors and 5xx responses (429s are handled
+by the request scheduler). A response hook records every call in the
+timing metrics.
+"""
+import os
+import threading
+
+from app.metrics import METRICS
+
+
+POOL_CONNECTIONS = int(os.getenv('SPOTIFY_POOL_CONNECTIONS', '4'))
+POOL_MAXSIZE = int(os.getenv('SPOTIFY_POOL_MAXSIZE', '32'))
+RETRIES = int(os.getenv('SPOTIFY_HTTP_RETRIES', '3'))
+
+_session = None
+_lock = threading.Lock()
+
+
+def _retry():
+    from urllib3.util.retry import Retry
+    # urllib3 retries any response carrying Retry-After (429 included) unless
+    # told not to; those must reach the scheduler, which pauses every caller.
+    # Once 5xx retries run out the last response is returned, so spotipy
+    # raises its real status rather than a header-less 429.
+    kwargs = dict(total=RETRIES, connect=RETRIES, read=False, status=RETRIES,
+                  status_forcelist=(500, 502, 503, 504), backoff_factor=0.3,
+                  respect_retry_after_header=False, raise_on_status=False)
+    try:
+        return Retry(allowed_methods=False, **kwargs)
+    except TypeError:
+        # urllib3 < 1.26
+        return Retry(method_whitelist=False, **kwargs)
+
+
+def _record_call(response, *args, **kwargs):
+    METRICS.observe_spotify(response.request.method, response.url, response.status_code,
+                            len(response.content or b''), response.elapsed.total_seconds() * 1000)
+
+
+def get_session():
+    """Return the shared, pooled `requests.Session`."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                # Imported on first use to keep requests out of the cold-start path.
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                                      max_retries=_retry(), pool_block=True)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.hooks['response'].append(_record_call)
+                _session = session
+    return _session
+
+
+def instrument(sp):
+    """Record the calls of a spotipy client that keeps its own session (the CLI's) in the metrics."""
+    hooks = getattr(getattr(sp, '_session', None), 'hooks', None)
+    if hooks is not None and _record_call not in hooks['response']:
+        hooks['response'].append(_record_call)
+    return sp
@@ -0,0 +1,266 @@
+"""Background job subsystem for long-running playlist operations.
+
+Jobs (clean, merge, update_liked, save_queue) are recorded in a local
+SQLite store shared by every worker process on the machine, and executed by
+a small bounded pool of worker threads in the process that enqueued them.
+Any worker can therefore answer a progress poll, while the user's access
+token only ever lives in the memory of the process running the job.
+
+Finished jobs expire after JOB_TTL seconds; queued/running jobs whose
+process died are marked as interrupted after JOB_STALE seconds without an
+update (each process keeps its own live jobs fresh whenever it purges, and
+never starts a job that was already marked as interrupted). Jobs can be cancelled; handlers check for cancellation between
+stages via `JobHandle.check_cancelled()`.
+"""
+import json
+import logging
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+from uuid import uuid4
+
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_TTL = float(os.getenv('JOB_TTL', '3600'))
+JOB_STALE = float(os.getenv('JOB_STALE', '900'))
+PROGRESS_INTERVAL = 0.25
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), 'spotify-webserver-jobs.sqlite3')
+
+FINISHED = ('done', 'error', 'cancelled')
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobStore:
+    """SQLite-backed table of jobs and their progress."""
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('JOB_STORE_PATH') or DEFAULT_PATH
+        self._lock = threading.Lock()
+        try:
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        except Exception:
+            logging.getLogger(__name__).warning('Job store unavailable at %s; using an in-memory store', self.path)
+            self._conn = sqlite3.connect(':memory:', check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' id TEXT PRIMARY KEY,'
+            ' kind TEXT NOT NULL,'
+            ' owner TEXT,'
+            ' status TEXT NOT NULL,'
+            ' total INTEGER NOT NULL DEFAULT 0,'
+            ' processed INTEGER NOT NULL DEFAULT 0,'
+            ' message TEXT,'
+            ' data TEXT,'
+            ' cancel INTEGER NOT NULL DEFAULT 0,'
+            ' created_at REAL NOT NULL,'
+            ' updated_at REAL NOT NULL)'
+        )
+        self._conn.commit()
+
+    def create(self, job_id, kind, owner, data=None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO jobs (id, kind, owner, status, message, data, created_at, updated_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, kind, owner, 'queued', 'Queued', json.dumps(data or {}), now, now),
+            )
+            self._conn.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT id, kind, owner, status, total, processed, message, data, cancel, created_at, updated_at'
+                ' FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if not row:
+            return None
+        keys = ('id', 'kind', 'owner', 'status', 'total', 'processed', 'message', 'data', 'cancel', 'created_at', 'updated_at')
+        job = dict(zip(keys, row))
+        job['data'] = json.loads(job['data'] or '{}')
+        job['cancel'] = bool(job['cancel'])
+        return job
+
+    def update(self, job_id, data=None, **fields):
+        """Update status/total/processed/message and merge `data` into the job's data."""
+        allowed = {k: v for k, v in fields.items() if k in ('status', 'total', 'processed', 'message')}
+        with self._lock:
+            if data:
+                row = self._conn.execute('SELECT data FROM jobs WHERE id = ?', (job_id,)).fetchone()
+                merged = json.loads(row[0] or '{}') if row else {}
+                merged.update(data)
+                allowed['data'] = json.dumps(merged)
+            allowed['updated_at'] = time.time()
+            cols = ', '.join(f'{k} = ?' for k in allowed)
+            self._conn.execute(f'UPDATE jobs SET {cols} WHERE id = ?', (*allowed.values(), job_id))
+            self._conn.commit()
+
+    def start(self, job_id):
+        """Mark a queued job as running; False if it is no longer queued."""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = 'running', message = 'Initializing', updated_at = ?"
+                " WHERE id = ? AND status = 'queued'", (time.time(), job_id))
+            self._conn.commit()
+            return cur.rowcount > 0
+
+    def request_cancel(self, job_id):
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET cancel = 1, updated_at = ? WHERE id = ? AND status NOT IN ('done', 'error', 'cancelled')",
+                (time.time(), job_id))
+            self._conn.commit()
+            return cur.rowcount > 0
+
+    def is_cancelled(self, job_id):
+        with self._lock:
+            row = self._conn.execute('SELECT cancel FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def purge(self, live=()):
+        """Drop expired finished jobs and mark abandoned ones as interrupted.
+
+        `live` are the ids of jobs this process still has queued or running;
+        they are refreshed first, so waiting in the queue never expires them.
+        """
+        now = time.time()
+        live = list(live)
+        with self._lock:
+            if live:
+                self._conn.execute(
+                    f"UPDATE jobs SET updated_at = ? WHERE id IN ({', '.join('?' * len(live))})"
+                    " AND status IN ('queued', 'running')", (now, *live))
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'error', 'cancelled') AND updated_at < ?",
+                (now - JOB_TTL,))
+            self._conn.execute(
+                "UPDATE jobs SET status = 'error', message = 'Interrupted', updated_at = ?"
+                " WHERE status IN ('queued', 'running') AND updated_at < ?",
+                (now, now - JOB_STALE))
+            self._conn.commit()
+
+
+class JobHandle:
+    """What a job handler sees: its params, in-memory context and progress helpers."""
+
+    def __init__(self, store, job_id, params, context):
+        self.store = store
+        self.id = job_id
+        self.params = params
+        self.context = context
+        self._last_write = 0.0
+
+    def progress(self, processed=None, total=None, message=None, force=False):
+        """Record progress; writes are throttled unless `force` or a message is given."""
+        now = time.time()
+        if not force and message is None and now - self._last_write < PROGRESS_INTERVAL:
+            return
+        self._last_write = now
+        fields = {}
+        if processed is not None:
+            fields['processed'] = processed
+        if total is not None:
+            fields['total'] = total
+        if message is not None:
+            fields['message'] = message
+        self.store.update(self.id, **fields)
+
+    def check_cancelled(self):
+        if self.store.is_cancelled(self.id):
+            raise JobCancelled()
+
+
+class JobQueue:
+    """Bounded pool of worker threads executing jobs recorded in a JobStore."""
+
+    def __init__(self, store=None, workers=JOB_WORKERS):
+        self._store = store
+        self.workers = workers
+        self._handlers = {}
+        self._queue = queue.Queue()
+        # ids of the jobs queued or running in this process
+        self._live = set()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    @property
+    def store(self):
+        # Opened on first use so importing the app never touches the disk.
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = JobStore()
+        return self._store
+
+    def register(self, kind, handler):
+        """Register `handler(job)` for jobs of `kind`.
+
+        The handler returns a dict of result data (merged into the job's
+        data) and an optional 'message' shown when the job finishes.
+        """
+        self._handlers[kind] = handler
+
+    def _start(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                t = threading.Thread(target=self._work, name=f'job-worker-{len(self._threads)}', daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, kind, params=None, owner=None, context=None, data=None):
+        """Queue a job and return its id. `context` stays in this process's memory only."""
+        if kind not in self._handlers:
+            raise ValueError(f'Unknown job kind: {kind}')
+        try:
+            with self._lock:
+                live = list(self._live)
+            self.store.purge(live)
+        except Exception:
+            logging.getLogger(__name__).exception('Failed to purge job store')
+        job_id = str(uuid4())
+        self.store.create(job_id, kind, owner, data)
+        with self._lock:
+            self._live.add(job_id)
+        self._queue.put((job_id, kind, params or {}, context or {}))
+        self._start()
+        return job_id
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def cancel(self, job_id):
+        return self.store.request_cancel(job_id)
+
+    def _work(self):
+        logger = logging.getLogger(__name__)
+        while True:
+            job_id, kind, params, context = self._queue.get()
+            job = JobHandle(self.store, job_id, params, context)
+            try:
+                job.check_cancelled()
+                if not self.store.start(job_id):
+                    # expired or finished elsewhere while it waited
+                    continue
+                result = self._handlers[kind](job) or {}
+                message = result.pop('message', None) or 'Finished'
+                self.store.update(job_id, status='done', message=message, data=result)
+            except JobCancelled:
+                self.store.update(job_id, status='cancelled', message='Cancelled')
+            except Exception as e:
+                logger.exception('%s job %s failed', kind, job_id)
+                self.store.update(job_id, status='error', message=str(e) or 'Failed')
+            finally:
+                with self._lock:
+                    self._live.discard(job_id)
+                self._queue.task_done()
+
+
+# Process-wide queue; handlers are registered by app.main.
+JOBS = JobQueue()
@@ -0,0 +1,221 @@
+"""Per-user snapshot cache of a Spotify library.
+
+Holds, for each user, the playlist listing (with each playlist's
+`snapshot_id`), the track list of every playlist that has been fetched and
+the user's liked songs. Track lists are keyed by the snapshot id they were
+fetched at, so a playlist is downloaded at most once per snapshot version.
+
+The cache is process-wide and thread-safe; `SpotifyClient` reads through it
+and invalidates the relevant entries after it writes to the library.
+Versioned track lists are also written to the persistent `TrackStore`, so
+after a restart (or on another worker) a fresh listing pass is enough to
+revalidate them and only playlists whose snapshot changed are downloaded.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app.track_store import TRACKS
+
+
+LISTING_TTL = float(os.getenv('LIBRARY_LISTING_TTL', '30'))
+SAVED_TTL = float(os.getenv('LIBRARY_SAVED_TTL', '120'))
+UNVERSIONED_TTL = float(os.getenv('LIBRARY_UNVERSIONED_TTL', '60'))
+MAX_USERS = int(os.getenv('LIBRARY_CACHE_MAX_USERS', '64'))
+
+
+class _UserLibrary:
+    __slots__ = ('listing', 'listing_at', 'saved', 'saved_at', 'snapshots', 'tracks', 'contents')
+
+    def __init__(self):
+        self.listing = None
+        self.listing_at = 0.0
+        self.saved = None
+        self.saved_at = 0.0
+        # playlist id -> snapshot id last reported by a listing
+        self.snapshots = {}
+        # playlist id -> (snapshot id or None, fetched_at, tracks)
+        self.tracks = {}
+        # playlist id -> (snapshot id, every item's uri) for playlists this process wrote
+        self.contents = {}
+
+
+class LibraryCache:
+    """Thread-safe store of per-user library snapshots."""
+
+    def __init__(self, max_users=MAX_USERS):
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+        self.max_users = max_users
+
+    def _user(self, user_id):
+        lib = self._users.get(user_id)
+        if lib is None:
+            lib = self._users[user_id] = _UserLibrary()
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return lib
+
+    # Playlist listing
+    def get_listing(self, user_id):
+        """Return the cached playlist listing for `user_id`, or None if stale."""
+        if not user_id:
+            return None
+        with self._lock:
+            lib = self._user(user_id)
+            if lib.listing is None or time.time() - lib.listing_at > LISTING_TTL:
+                return None
+            return list(lib.listing)
+
+    def put_listing(self, user_id, playlists):
+        """Store a fresh playlist listing and remember each snapshot id."""
+        if not user_id:
+            return
+        with self._lock:
+            lib = self._user(user_id)
+            lib.listing = list(playlists)
+            lib.listing_at = time.time()
+            for p in playlists:
+                if p.get('id'):
+                    lib.snapshots[p['id']] = p.get('snapshot_id')
+
+    def note_snapshots(self, user_id, playlists):
+        """Record snapshot ids seen in any listing (e.g. another user's playlists)."""
+        if not user_id:
+            return
+        with self._lock:
+            lib = self._user(user_id)
+            for p in playlists:
+                if p.get('id') and p.get('snapshot_id'):
+                    lib.snapshots[p['id']] = p['snapshot_id']
+
+    def snapshot_id(self, user_id, playlist_id):
+        if not user_id:
+            return None
+        with self._lock:
+            return self._user(user_id).snapshots.get(playlist_id)
+
+    # Playlist track lists
+    def get_tracks(self, user_id, playlist_id):
+        """Return cached tracks for a playlist if they match its current snapshot.
+
+        Falls back to the persistent track store when the snapshot id is
+        known. Entries fetched without a known snapshot id are only trusted
+        for `UNVERSIONED_TTL` seconds.
+        """
+        if not user_id:
+            return None
+        with self._lock:
+            lib = self._user(user_id)
+            current = lib.snapshots.get(playlist_id)
+            entry = lib.tracks.get(playlist_id)
+            if entry is not None:
+                snap, fetched_at, tracks = entry
+                if snap and current:
+                    if snap == current:
+                        return tracks
+                elif time.time() - fetched_at <= UNVERSIONED_TTL:
+                    return tracks
+        if not current:
+            return None
+        tracks = TRACKS.get(playlist_id, current)
+        if tracks is not None:
+            with self._lock:
+                self._user(user_id).tracks[playlist_id] = (current, time.time(), tracks)
+        return tracks
+
+    def put_tracks(self, user_id, playlist_id, tracks, snapshot_id=None):
+        if not user_id:
+            return
+        with self._lock:
+            lib = self._user(user_id)
+            snap = snapshot_id or lib.snapshots.get(playlist_id)
+            lib.tracks[playlist_id] = (snap, time.time(), tracks)
+        if snap:
+            TRACKS.put(playlist_id, snap, tracks)
+
+    # Playlist contents after a write
+    def put_written(self, user_id, playlist_id, snapshot_id, uris, tracks):
+        """Record a playlist's state right after this process wrote it.
+
+        `uris` are all of its items in order (None for local or unavailable
+        ones, as `playlist_writer` reports them) and `tracks` the `Track`s
+        among them; `snapshot_id` becomes the playlist's known snapshot, so the
+        next read or write of the playlist needs no refetch.
+        """
+        if not user_id or not snapshot_id:
+            self.invalidate_playlist(user_id, playlist_id)
+            return
+        with self._lock:
+            lib = self._user(user_id)
+            lib.snapshots[playlist_id] = snapshot_id
+            lib.tracks[playlist_id] = (snapshot_id, time.time(), tracks)
+            lib.contents[playlist_id] = (snapshot_id, list(uris))
+            # track counts in the listing are out of date
+            lib.listing = None
+        TRACKS.put(playlist_id, snapshot_id, tracks)
+
+    def get_contents(self, user_id, playlist_id):
+        """Return (snapshot id, uris) recorded by `put_written` if still current, else None."""
+        if not user_id:
+            return None
+        with self._lock:
+            lib = self._user(user_id)
+            entry = lib.contents.get(playlist_id)
+            if entry is None or entry[0] != lib.snapshots.get(playlist_id):
+                return None
+            return entry[0], list(entry[1])
+
+    # Liked songs
+    def get_saved(self, user_id):
+        if not user_id:
+            return None
+        with self._lock:
+            lib = self._user(user_id)
+            if lib.saved is None or time.time() - lib.saved_at > SAVED_TTL:
+                return None
+            return lib.saved
+
+    def put_saved(self, user_id, tracks):
+        if not user_id:
+            return
+        with self._lock:
+            lib = self._user(user_id)
+            lib.saved = tracks
+            lib.saved_at = time.time()
+
+    # Invalidation
+    def invalidate_listing(self, user_id):
+        with self._lock:
+            lib = self._users.get(user_id)
+            if lib is not None:
+                lib.listing = None
+
+    def invalidate_saved(self, user_id):
+        with self._lock:
+            lib = self._users.get(user_id)
+            if lib is not None:
+                lib.saved = None
+
+    def invalidate_playlist(self, user_id, playlist_id):
+        with self._lock:
+            lib = self._users.get(user_id)
+            if lib is not None:
+                lib.tracks.pop(playlist_id, None)
+                lib.snapshots.pop(playlist_id, None)
+                lib.contents.pop(playlist_id, None)
+                lib.listing = None
+
+    def clear(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(user_id, None)
+
+
+# Process-wide cache shared by every SpotifyClient instance.
+LIBRARY = LibraryCache()
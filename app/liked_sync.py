@@ -0,0 +1,104 @@
+"""Incremental sync of a user's liked songs.
+
+`current_user_saved_tracks` is ordered newest-first and every item carries
+`added_at`, so after one full read we only need to page from the top until
+we reach an item we already have. Each user's list is kept (with the raw
+`total` reported by Spotify) in the persistent track store; a routine sync
+then costs one or two API calls.
+
+Unlikes are not visible from the top of the list, so a full reconcile runs
+whenever the reported total disagrees with what we expect, and otherwise
+every LIKED_FULL_SYNC_INTERVAL seconds (default: daily).
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app.pagination import fetch_items
+from app.track_store import TRACKS
+from app.tracks import Track, decode_tracks, encode_tracks
+
+
+FULL_SYNC_INTERVAL = float(os.getenv('LIKED_FULL_SYNC_INTERVAL', '86400'))
+PAGE = 50
+
+# In-process copy of recent users' state (also covers an unavailable track store).
+_STATE = OrderedDict()
+_MAX_STATES = 32
+_lock = threading.Lock()
+
+
+def _full_sync(sp):
+    items = fetch_items(lambda offset: sp.current_user_saved_tracks(limit=PAGE, offset=offset), PAGE, sp.next)
+    tracks, added = [], []
+    for item in items:
+        t = Track.from_api(item.get('track'))
+        if t:
+            tracks.append(t)
+            added.append(item.get('added_at'))
+    return {'tracks': tracks, 'added_at': added, 'total': len(items), 'full_sync_at': time.time()}
+
+
+def _incremental_sync(sp, state):
+    if len(state.get('added_at') or ()) != len(state['tracks']):
+        return None
+    known = {(t.id, a) for t, a in zip(state['tracks'], state['added_at'])}
+    new, new_added, raw_new, offset, total = [], [], 0, 0, None
+    while True:
+        page = sp.current_user_saved_tracks(limit=PAGE, offset=offset) or {}
+        if total is None:
+            total = page.get('total')
+        for item in page.get('items') or []:
+            t = item.get('track') or {}
+            if (t.get('id'), item.get('added_at')) in known:
+                if total is not None and total != state['total'] + raw_new:
+                    return None
+                if not raw_new:
+                    return state
+                return dict(state, tracks=new + state['tracks'], added_at=new_added + state['added_at'],
+                            total=state['total'] + raw_new)
+            raw_new += 1
+            m = Track.from_api(t)
+            if m:
+                new.append(m)
+                new_added.append(item.get('added_at'))
+        if not page.get('next'):
+            # Never reached a known item: nothing we had is still liked.
+            return None
+        offset += PAGE
+
+
+def _load_state(user_id):
+    state = TRACKS.get_saved(user_id)
+    if not state:
+        return None
+    try:
+        return dict(state, tracks=decode_tracks(state.get('tracks')))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def sync_saved_tracks(sp, user_id, force_full=False):
+    """Return the user's liked songs (newest first) as a list of `Track`."""
+    logger = logging.getLogger(__name__)
+    with _lock:
+        state = _STATE.get(user_id)
+    if state is None:
+        state = _load_state(user_id)
+    fresh = None
+    if state and not force_full and time.time() - state.get('full_sync_at', 0) <= FULL_SYNC_INTERVAL:
+        fresh = _incremental_sync(sp, state)
+        if fresh is None:
+            logger.info('Liked songs for %s changed beyond the watermark; running a full sync', user_id)
+    if fresh is None:
+        fresh = _full_sync(sp)
+    if fresh is not state:
+        with _lock:
+            _STATE[user_id] = fresh
+            _STATE.move_to_end(user_id)
+            while len(_STATE) > _MAX_STATES:
+                _STATE.popitem(last=False)
+        TRACKS.put_saved(user_id, dict(fresh, tracks=encode_tracks(fresh['tracks'])))
+    return list(fresh['tracks'])
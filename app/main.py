@@ -1,13 +1,30 @@
 import os
+import hashlib
+import hmac
+import json
 import logging
-import threading
-import spotipy
 import time
 from functools import wraps
 from uuid import uuid4
-from flask import Flask, render_template, redirect, url_for, request, flash, session, send_from_directory, jsonify
+from flask import Flask, Response, g, make_response, render_template, redirect, url_for, request, flash, session, send_from_directory, jsonify
 from werkzeug.exceptions import HTTPException
-from app.spotify_client import SpotifyClient
+
+# Local development reads settings from .env; deployments set real environment
+# variables, so python-dotenv is only imported when the file exists. This
+# runs before the app modules below read their settings at import time.
+_DOTENV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env')
+if os.path.exists(_DOTENV):
+    from dotenv import load_dotenv
+    load_dotenv(_DOTENV)
+
+from app.async_client import AsyncSpotifyClient, async_enabled, iter_async, run_async
+from app.jobs import FINISHED, JOBS, JobCancelled
+from app.matching import LibraryIndex, meta_rows
+from app.metrics import METRICS, counted, render_prometheus, start_request_timer
+from app.result_store import GrowingResult, make_result_store
+from app.scheduler import SCHEDULER
+from app.spotify_client import SpotifyClient, spotify_for_token
+from app.tracks import Track, TrackTable
 
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
@@ -31,10 +48,206 @@ def login_required(fn):
 
 client = SpotifyClient()
 
-# In-memory store for generated compare results. Ephemeral: restart clears it.
-GENERATED = {}
-# In-memory progress store for background clean tasks
-PROGRESS = {}
+# Store for generated compare results: bounded by size, TTL and per-user
+# quota. Set RESULT_STORE=sqlite to keep results across restarts/workers.
+GENERATED = make_result_store()
+# How often a running compare job publishes its partial result; the result
+# page polls once a second, so publishing more often is wasted work.
+COMPARE_WRITE_INTERVAL = float(os.getenv('COMPARE_WRITE_INTERVAL', '1.0'))
+
+
+def _is_ajax():
+    return request.is_json or request.headers.get('X-Requested-With')
+
+
+def _job_context():
+    """Capture what a background job needs from the session while in request context."""
+    token_info = session.get('token_info') or {}
+    if not token_info.get('access_token'):
+        return None
+    # Resolve the user id now so the worker shares this user's library cache.
+    return {'access_token': token_info['access_token'], 'user_id': client._current_user_id()}
+
+
+def _job_client(job):
+    """Build a SpotifyClient for a worker thread from the job's captured context."""
+    local_client = SpotifyClient()
+    local_client.sp = spotify_for_token(job.context['access_token'])
+    local_client.user_id = job.context.get('user_id')
+    # override _ensure_token to avoid touching Flask session from worker thread
+    local_client._ensure_token = lambda: local_client.sp
+    return local_client
+
+
+def _async_client(context):
+    """Build an AsyncSpotifyClient from a job (or request) context."""
+    return AsyncSpotifyClient(context['access_token'], context.get('user_id'))
+
+
+def _submit_job(kind, params, data=None):
+    """Queue a background job for the current user and return the AJAX response."""
+    context = _job_context()
+    if not context:
+        return jsonify({'ok': False, 'error': 'No auth token available for background task'}), 403
+    task_id = JOBS.submit(kind, params, owner=context['user_id'], context=context, data=data)
+    return jsonify({'ok': True, 'task_id': task_id})
+
+
+def run_clean_job(job):
+    p = job.params
+    local_client = _job_client(job)
+    job.progress(message='Processing tracks')
+    job.check_cancelled()
+    done = [0]
+
+    def progress_cb(processed, total):
+        done[0] = processed
+        job.progress(processed=processed, total=total or None)
+
+    if async_enabled():
+        res = run_async(_async_client(job.context).clean_out_playlist(
+            p['playlist_id'], p['new_name'], overwrite_playlist_id=p['overwrite_playlist_id'],
+            progress_cb=progress_cb))
+    else:
+        res = local_client.clean_out_playlist(p['playlist_id'], p['new_name'],
+                                              overwrite_playlist_id=p['overwrite_playlist_id'],
+                                              progress_cb=progress_cb)
+    if not res:
+        raise RuntimeError('Failed to create or update cleaned playlist')
+    created, removed = res
+    job.progress(processed=done[0], total=done[0], force=True)
+    return {
+        'removed': removed,
+        'name': created.get('name') if created else p['new_name'],
+        'message': f'Finished — removed {removed} tracks' if removed is not None else 'Finished',
+    }
+
+
+@counted('compare_fetch')
+def run_compare_job(job):
+    """Compare another user's playlists against the current user's library.
+
+    The current user's library (liked songs + every playlist) is indexed
+    once; each compared playlist is then classified against it as soon as
+    its tracks arrive. A playlist that is also one of mine is excluded from
+    the library it is compared against. Results are published to the
+    GENERATED entry as playlists finish (at most every
+    COMPARE_WRITE_INTERVAL seconds), each time as a new dict, so readers
+    never see a half-written result. Each playlist and track is encoded
+    once (see GrowingResult), so a publish costs only what is new.
+    """
+    gid, uid = job.params['gid'], job.params['user']
+    owner = job.context.get('user_id')
+    base = GENERATED.get(gid)
+    if base is None:
+        raise RuntimeError('Compare result expired before it started')
+    local_client = _job_client(job)
+    # Every compared track is stored once in a shared table; each playlist
+    # keeps lists of integer references into it.
+    table = TrackTable()
+    partial = GrowingResult(base)
+    state = {'count': 0, 'processed': 0}
+
+    def publish(**fields):
+        rows = partial.lists['tracks']
+        partial.extend('tracks', (t.to_row() for t in table.tracks[len(rows):]))
+        result, payload = partial.snapshot(count=state['count'], processed=state['processed'], **fields)
+        GENERATED.put(gid, result, owner=owner, payload=payload)
+
+    sources = ()
+    try:
+        job.progress(message='Reading playlists')
+        user_playlists = local_client.get_user_playlists(uid)
+        partial.update(profile=local_client.get_user_profile(uid), total=len(user_playlists))
+        publish()
+        ids = [p['id'] for p in user_playlists]
+
+        job.progress(processed=0, total=len(ids), message='Reading your library')
+        # With the async backend the library and every compared playlist are
+        # fetched concurrently on one event loop; playlists still arrive one
+        # by one, in order, so partial results are published as they finish.
+        if async_enabled():
+            sources = iter_async(_async_client(job.context).iter_compare_sources(ids))
+            library = next(sources)
+        else:
+            library = local_client.get_library_snapshot()
+            sources = local_client.iter_many_playlist_tracks(ids, skip_errors=True)
+        index = LibraryIndex()
+        index.add_source('__liked__', meta_rows(library['saved']))
+        for myp, tmeta in library['playlists']:
+            index.add_source(myp.get('id'), meta_rows(tmeta))
+
+        job.progress(message='Comparing playlists')
+        last_write = time.time()
+        for p, (pid, tracks) in zip(user_playlists, sources):
+            job.check_cancelled()
+            refs = [table.add(t) for t in tracks or ()]
+            flags = index.classify([(table[r].artist, table[r].name) for r in refs],
+                                   exclude=(pid,) if pid in index else ())
+            unique_refs = [r for r, saved in zip(refs, flags) if not saved]
+            similar_refs = [r for r, saved in zip(refs, flags) if saved]
+            partial.extend('playlists', [{
+                'id': pid,
+                'name': p.get('name'),
+                'tracks_count': p.get('tracks', 0),
+                'images': p.get('images', []),
+                'all_refs': refs,
+                'unique_refs': unique_refs,
+                'similar_refs': similar_refs,
+            }])
+            state['count'] += len(unique_refs) + len(similar_refs)
+            state['processed'] += 1
+            job.progress(processed=state['processed'], total=len(ids))
+            if time.time() - last_write >= COMPARE_WRITE_INTERVAL:
+                publish()
+                last_write = time.time()
+        publish(status='done')
+    except JobCancelled:
+        publish(status='cancelled', error='Cancelled')
+        raise
+    except Exception as e:
+        publish(status='error', error=str(e) or 'Compare failed')
+        raise
+    finally:
+        # stop the downloads still queued for a cancelled or failed compare
+        close = getattr(sources, 'close', None)
+        if close:
+            close()
+    return {'count': state['count'], 'message': f"Compared {state['processed']} playlists"}
+
+
+def run_merge_job(job):
+    job.progress(message='Merging playlists')
+    if async_enabled():
+        playlist = run_async(_async_client(job.context).merge_playlists(job.params['playlist_ids'], job.params['name']))
+    else:
+        playlist = _job_client(job).merge_playlists(job.params['playlist_ids'], job.params['name'])
+    if not playlist:
+        raise RuntimeError('Failed to create merged playlist')
+    return {'name': playlist.get('name'), 'message': f"Created merged playlist: {playlist.get('name')}"}
+
+
+def run_update_liked_job(job):
+    job.progress(message='Reading liked songs')
+    pl = _job_client(job).update_liked_playlist(job.params['name'])
+    if not pl:
+        raise RuntimeError('Failed to update liked playlist')
+    return {'name': pl.get('name'), 'message': f"Updated playlist: {pl.get('name')}"}
+
+
+def run_save_queue_job(job):
+    job.progress(message='Reading queue')
+    playlist, reason = _job_client(job).save_queue(None, job.params.get('name'))
+    if playlist is None:
+        raise RuntimeError(_queue_failure_message(reason))
+    return {'name': playlist.get('name'), 'message': f"Saved queue to playlist: {playlist['name']}"}
+
+
+JOBS.register('compare', run_compare_job)
+JOBS.register('clean', run_clean_job)
+JOBS.register('merge', run_merge_job)
+JOBS.register('update_liked', run_update_liked_job)
+JOBS.register('save_queue', run_save_queue_job)
 
 
 @app.context_processor
@@ -56,12 +269,85 @@ def handle_unexpected_error(error):
 
 
 @app.before_request
-def log_request_info():
-    app.logger.info(f'Incoming request: {request.method} {request.path}')
-    try:
-        app.logger.info(f'session keys: {list(session.keys())}')
-    except Exception:
-        pass
+def start_timing():
+    g.timer = start_request_timer()
+
+
+@app.after_request
+def record_timing(response):
+    timer = g.get('timer')
+    if timer is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        METRICS.observe_request(route, request.method, response.status_code, timer.elapsed_ms())
+        response.headers['Server-Timing'] = timer.server_timing()
+    return response
+
+
+def _source_version():
+    """Hash the app's code, templates and static files, so every worker of a
+    deploy agrees on the version and it changes whenever any of them does."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d != '__pycache__')
+        for name in sorted(filenames):
+            if name.endswith('.pyc'):
+                continue
+            path = os.path.join(dirpath, name)
+            digest.update(os.path.relpath(path, root).encode())
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+# Part of every page ETag, so a deploy never revalidates a page rendered by
+# older templates; without a commit sha it is derived from the files on disk.
+ETAG_VERSION = os.getenv('APP_VERSION') or os.getenv('VERCEL_GIT_COMMIT_SHA') or _source_version()
+# How long a browser may reuse a finished compare result without revalidating.
+COMPARE_MAX_AGE = int(os.getenv('COMPARE_MAX_AGE', '300'))
+
+
+def _etag(*parts):
+    """Return a strong ETag for a response built from `parts` (JSON-serializable)."""
+    payload = json.dumps([ETAG_VERSION, *parts], sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def _conditional(etag, cache_control, render):
+    """Answer with 304 Not Modified when the client already holds `etag`,
+    otherwise with `render()` tagged with it.
+
+    Flashed messages are not part of the ETag, so while any are pending (the
+    redirect after a POST) the page is always rendered and not stored; views
+    that flash while rendering set `g.no_store` for the same reason.
+    """
+    if session.get('_flashes'):
+        response = make_response(render())
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = make_response(render())
+        if g.get('no_store'):
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    response.vary.add('Cookie')
+    return response
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text-format metrics (per process), served only to scrapers
+    presenting METRICS_TOKEN as a bearer token; without it the route is off."""
+    token = os.getenv('METRICS_TOKEN')
+    if not token:
+        return 'Not Found', 404
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return 'Forbidden', 403
+    return Response(render_prometheus(METRICS, SCHEDULER.stats()), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/favicon.ico')
@@ -126,39 +412,51 @@ def callback():
 @app.route('/playlists')
 @login_required
 def playlists():
+    """The current user's playlists, optionally next to another user's.
+
+    The page is tagged with the listings' snapshot ids (served from the
+    library cache), so a revalidation that matches skips fetching the other
+    user's tracks and rendering.
+    """
     pls = client.get_playlists()
     user = client.get_current_user()
     compare_user = request.args.get('compare_user')
-    compare_playlists = None
+    up = None
     if compare_user:
         # normalize an input that might be a URL or an id
-        try:
-            uid = compare_user.split('?')[0].split('/')[-1]
-            up = client.get_user_playlists(uid)
-            # for each playlist, include its tracks (meta)
-            compare_playlists = []
-            for p in up:
-                tracks = client.get_playlist_tracks_meta(p['id'])
-                compare_playlists.append({
-                    'id': p['id'],
-                    'name': p['name'],
-                    'tracks_count': p.get('tracks', 0),
-                    'images': p.get('images', []),
-                    'tracks': tracks,
-                })
-        except Exception:
-            compare_playlists = None
-            flash('Unable to fetch user playlists. Make sure the user id or URL is correct and the playlists are public.', 'error')
-    return render_template('playlists.html', playlists=pls, user=user, compare_playlists=compare_playlists, compare_user=compare_user)
+        up = client.get_user_playlists(compare_user.split('?')[0].split('/')[-1])
+    etag = _etag('playlists', user, pls, compare_user, up)
+
+    def render():
+        compare_playlists = None
+        if compare_user:
+            try:
+                # for each playlist, include its tracks (meta)
+                compare_playlists = []
+                for p in up:
+                    tracks = client.get_playlist_tracks_meta(p['id'])
+                    compare_playlists.append({
+                        'id': p['id'],
+                        'name': p['name'],
+                        'tracks_count': p.get('tracks', 0),
+                        'images': p.get('images', []),
+                        'tracks': tracks,
+                    })
+            except Exception:
+                compare_playlists = None
+                g.no_store = True
+                flash('Unable to fetch user playlists. Make sure the user id or URL is correct and the playlists are public.', 'error')
+        return render_template('playlists.html', playlists=pls, user=user, compare_playlists=compare_playlists, compare_user=compare_user)
+
+    return _conditional(etag, 'private, no-cache', render)
 
 
 @app.route('/compare_fetch', methods=['POST'])
 @login_required
 def compare_fetch():
-    """AJAX endpoint: given a compare_user, compute per-playlist unique and
-    similar tracks (artist+title logic) relative to the current user's saved
-    tracks. Stores the full, unique and similar lists for each playlist and
-    returns a short URL to view the comparison.
+    """AJAX endpoint: start comparing a user's playlists against the current
+    user's library (artist+title logic) in a background job. Returns the URL
+    of the result right away; the result page fills in as playlists finish.
     """
     try:
         data = request.get_json() or request.form.to_dict() or {}
@@ -167,160 +465,186 @@ def compare_fetch():
     compare_user = (data.get('compare_user') or '').strip()
     if not compare_user:
         return jsonify({'ok': False, 'error': 'No user provided'}), 400
+    context = _job_context()
+    if not context:
+        return jsonify({'ok': False, 'error': 'No auth token available for background task'}), 403
+
+    uid = compare_user.split('?')[0].split('/')[-1]
+    gid = str(uuid4())
+    GENERATED.put(gid, {
+        'id': gid,
+        'user': uid,
+        'count': 0,
+        'playlists': [],
+        'tracks': [],
+        'profile': None,
+        'status': 'running',
+        'processed': 0,
+        'total': None,
+        'owner': context['user_id'],
+    }, owner=context['user_id'])
+    task_id = JOBS.submit('compare', {'gid': gid, 'user': uid}, owner=context['user_id'], context=context)
+    return jsonify({'ok': True, 'url': url_for('compare_view', gid=gid), 'gid': gid, 'task_id': task_id})
+
+
+COMPARE_MODES = ('all', 'unique', 'similar')
+TRACKS_PAGE_SIZE = 100
+TRACKS_PAGE_MAX = 500
+
+
+def _owned_result(gid):
+    """Return the stored compare result `gid` if it belongs to the signed-in
+    user, otherwise None (so another user's result id reads as not found)."""
+    group = GENERATED.get(gid)
+    if not group or (group.get('owner') and group['owner'] != client._current_user_id()):
+        return None
+    return group
+
+
+def _result_summary(group, start=0):
+    """Return a stored compare result without its track table.
+
+    Each playlist (from index `start` on) keeps its metadata and gains
+    `all_count` / `unique_count` / `similar_count`; the tracks themselves
+    are fetched a page at a time from /api/compare/<gid>/<plid>/tracks.
+    """
+    playlists = []
+    for pl in group.get('playlists', [])[start:]:
+        summary = {k: pl.get(k) for k in ('id', 'name', 'tracks_count', 'images')}
+        for mode in COMPARE_MODES:
+            summary[f'{mode}_count'] = len(pl.get(f'{mode}_refs') or ())
+        playlists.append(summary)
+    return dict({k: v for k, v in group.items() if k != 'tracks'}, playlists=playlists)
 
-    try:
-        uid = compare_user.split('?')[0].split('/')[-1]
-        user_playlists = client.get_user_playlists(uid)
 
-        # get saved tracks metadata for current user (liked songs)
-        saved_meta = client.get_saved_tracks_meta() or []
-        # also include *all* tracks from the user's own playlists
-        all_playlist_tracks = []
-        try:
-            my_playlists = client.get_playlists() or []
-            for myp in my_playlists:
-                try:
-                    tmeta = client.get_playlist_tracks_meta(myp['id'])
-                except Exception:
-                    tmeta = []
-                all_playlist_tracks.extend(tmeta)
-        except Exception:
-            all_playlist_tracks = []
-
-        from collections import Counter
-
-        playlists_out = []
-        total_matches = 0
-        # For each playlist, compute unique vs similar using artist+title logic.
-        # We follow the efficient approach from your PlaylistManager:
-        #  - pl_tracks = tracks for this playlist
-        #  - al_tracks = all my tracks (liked + other playlists) excluding this playlist
-        #  - t_counts_pl, t_counts_al = Counter(titles in pl), Counter(titles in al)
-        #  - potential_saved = intersection of title sets
-        #  - seen = set of (artist, title) from al_tracks for titles in potential_saved
-        #  - iterate pl_tracks, if (artist,title) in seen then it's already-saved, else unique and add to seen
-        my_playlists = client.get_playlists() or []
-        for p in user_playlists:
-            try:
-                tracks = client.get_playlist_tracks_meta(p['id'])
-            except Exception:
-                tracks = []
-
-            # Build pl_tracks as list of dicts with primary artist separated
-            pl_rows = []
-            for t in tracks:
-                title = (t.get('name') or '').strip()
-                artists = (t.get('artists') or '').strip()
-                primary = (artists.split(',')[0].strip()) if artists else ''
-                pl_rows.append({
-                    'id': t.get('id'),
-                    'uri': t.get('uri'),
-                    'name': title,
-                    'artist': primary,
-                    'artists': artists,
-                    'album_image': t.get('album_image'),
-                })
-
-            # Build al_tracks: saved_meta (liked songs) + tracks from my playlists excluding this playlist
-            al_rows = []
-            if saved_meta:
-                for s in saved_meta:
-                    title = (s.get('name') or '').strip()
-                    artists = (s.get('artists') or '').strip()
-                    primary = (artists.split(',')[0].strip()) if artists else ''
-                    al_rows.append((s.get('id'), primary, title))
-            for myp in my_playlists:
-                if myp.get('id') == p.get('id'):
-                    continue
-                try:
-                    tmeta = client.get_playlist_tracks_meta(myp['id'])
-                except Exception:
-                    tmeta = []
-                for s in tmeta:
-                    title = (s.get('name') or '').strip()
-                    artists = (s.get('artists') or '').strip()
-                    primary = (artists.split(',')[0].strip()) if artists else ''
-                    al_rows.append((s.get('id'), primary, title))
-
-            # Counters by title
-            t_counts_pl = Counter(t['name'] for t in pl_rows if t.get('name'))
-            t_counts_al = Counter(t for _, _, t in al_rows if t)
-            potential_saved = set(t_counts_pl) & set(t_counts_al)
-
-            # seen is set of (artist, title) present in al_rows for titles in potential_saved
-            seen = {(a, t) for _, a, t in al_rows if t in potential_saved}
-
-            unique_list = []
-            similar_list = []
-            already_saved = []
-            for row in pl_rows:
-                i = row.get('id')
-                a = row.get('artist')
-                tname = row.get('name')
-                if tname in potential_saved and (a, tname) in seen:
-                    similar_list.append(row)
-                    already_saved.append(i)
-                else:
-                    unique_list.append(row)
-                    seen.add((a, tname))
+def _render_result(group):
+    """Render a compare result page, tagged with the result's contents.
 
-            playlists_out.append({
-                'id': p['id'],
-                'name': p.get('name'),
-                'tracks_count': p.get('tracks', 0),
-                'images': p.get('images', []),
-                'all_tracks': pl_rows,
-                'unique_tracks': unique_list,
-                'similar_tracks': similar_list,
-            })
-            total_matches += len(unique_list) + len(similar_list)
-
-        profile = client.get_user_profile(uid)
-
-        gid = str(uuid4())
-        GENERATED[gid] = {
-            'id': gid,
-            'user': uid,
-            'count': total_matches,
-            'playlists': playlists_out,
-            'profile': profile,
-        }
-
-        view_url = url_for('compare_view', gid=gid)
-        return jsonify({'ok': True, 'url': view_url, 'count': total_matches})
-    except Exception as e:
-        app.logger.exception('compare_fetch failed')
-        return jsonify({'ok': False, 'error': str(e)}), 500
+    A finished result never changes, so the browser may reuse it for
+    COMPARE_MAX_AGE seconds; a running one is revalidated on every visit.
+    """
+    result = _result_summary(group)
+    etag = _etag('compare', client.get_current_user(), result)
+    if result.get('status', 'done') == 'done':
+        cache_control = f'private, max-age={COMPARE_MAX_AGE}'
+    else:
+        cache_control = 'private, no-cache'
+    return _conditional(etag, cache_control, lambda: render_template('generated_playlist.html', result=result))
 
 
 @app.route('/unique/<gid>')
 @login_required
 def unique_view(gid):
-    g = GENERATED.get(gid)
-    if not g:
+    group = _owned_result(gid)
+    if not group:
         flash('Generated playlist not found or expired.', 'error')
         return redirect(url_for('playlists'))
-    return render_template('generated_playlist.html', result=g)
+    return _render_result(group)
 
 
 @app.route('/similar/<gid>')
 @login_required
 def similar_view(gid):
-    g = GENERATED.get(gid)
-    if not g:
+    group = _owned_result(gid)
+    if not group:
         flash('Generated playlist not found or expired.', 'error')
         return redirect(url_for('playlists'))
-    return render_template('generated_playlist.html', result=g)
+    return _render_result(group)
 
 
 @app.route('/compare/<gid>')
 @login_required
 def compare_view(gid):
-    g = GENERATED.get(gid)
-    if not g:
+    group = _owned_result(gid)
+    if not group:
         flash('Generated playlist not found or expired.', 'error')
         return redirect(url_for('playlists'))
-    return render_template('generated_playlist.html', result=g)
+    return _render_result(group)
+
+
+@app.route('/compare/<gid>/partial')
+def compare_partial(gid):
+    """Progress of a compare result, with the rendered blocks of the playlists
+    from index `start` on. Polled by the result page while the compare job
+    runs; reads only the result store, so it costs no Spotify calls.
+    """
+    if not client._ensure_token():
+        return jsonify({'ok': False, 'error': 'Not authorized'}), 401
+    group = _owned_result(gid)
+    if not group:
+        return jsonify({'ok': False, 'error': 'Generated result not found'}), 404
+    start = max(0, request.args.get('start', 0, type=int))
+    result = _result_summary(group, start)
+    return jsonify({
+        'ok': True,
+        'status': group.get('status', 'done'),
+        'error': group.get('error'),
+        'processed': group.get('processed'),
+        'total': group.get('total'),
+        'count': group.get('count'),
+        'profile': group.get('profile'),
+        'next': len(group.get('playlists', [])),
+        'html': render_template('_generated_playlists.html', result=result),
+    })
+
+
+@app.route('/api/compare/<gid>')
+def api_compare(gid):
+    """Progress of a compare result and the track counts of each playlist, as JSON."""
+    if not client._ensure_token():
+        return jsonify({'ok': False, 'error': 'Not authorized'}), 401
+    group = _owned_result(gid)
+    if not group:
+        return jsonify({'ok': False, 'error': 'Generated result not found'}), 404
+    result = _result_summary(group)
+    result.update(ok=True, status=group.get('status', 'done'))
+    return jsonify(result)
+
+
+@app.route('/api/compare/<gid>/<plid>/tracks')
+def api_compare_tracks(gid, plid):
+    """One page of a compared playlist's tracks for `mode` (all, unique or similar).
+
+    Pass the `next_cursor` of the previous page as `cursor` (omit it for the
+    first page); `next_cursor` is null on the last page. `limit` defaults to
+    TRACKS_PAGE_SIZE and is capped at TRACKS_PAGE_MAX.
+    """
+    if not client._ensure_token():
+        return jsonify({'ok': False, 'error': 'Not authorized'}), 401
+    mode = request.args.get('mode', 'all')
+    if mode not in COMPARE_MODES:
+        return jsonify({'ok': False, 'error': f'Unknown mode: {mode}'}), 400
+    try:
+        start = int(request.args.get('cursor') or 0)
+    except ValueError:
+        start = -1
+    if start < 0:
+        return jsonify({'ok': False, 'error': 'Invalid cursor'}), 400
+    limit = min(max(1, request.args.get('limit', TRACKS_PAGE_SIZE, type=int)), TRACKS_PAGE_MAX)
+    group = _owned_result(gid)
+    if not group:
+        return jsonify({'ok': False, 'error': 'Generated result not found'}), 404
+    pl = next((p for p in group.get('playlists', []) if p.get('id') == plid), None)
+    if not pl:
+        return jsonify({'ok': False, 'error': 'Playlist entry not found'}), 404
+
+    # A playlist is published with its final refs, so its pages never change.
+    refs = pl.get(f'{mode}_refs') or []
+    etag = _etag('tracks', gid, plid, mode, start, limit, len(refs))
+
+    def render():
+        rows = group.get('tracks') or []
+        items = [Track.from_row(rows[r]).to_dict() for r in refs[start:start + limit]]
+        end = start + len(items)
+        return jsonify({
+            'ok': True,
+            'mode': mode,
+            'total': len(refs),
+            'items': items,
+            'next_cursor': str(end) if end < len(refs) else None,
+        })
+
+    return _conditional(etag, f'private, max-age={COMPARE_MAX_AGE}', render)
 
 
 @app.route('/save_generated/<gid>/<plid>', methods=['POST'])
@@ -330,8 +654,8 @@ def save_generated(gid, plid):
     for the given generated id and playlist id. Returns JSON when requested
     via AJAX, otherwise redirects back to the generated view.
     """
-    g = GENERATED.get(gid)
-    if not g:
+    group = _owned_result(gid)
+    if not group:
         if request.is_json or request.headers.get('X-Requested-With'):
             return jsonify({'ok': False, 'error': 'Generated result not found'}), 404
         flash('Generated playlist not found or expired.', 'error')
@@ -339,7 +663,7 @@ def save_generated(gid, plid):
 
     # find playlist entry
     pl = None
-    for p in g.get('playlists', []):
+    for p in group.get('playlists', []):
         if p.get('id') == plid:
             pl = p
             break
@@ -352,13 +676,14 @@ def save_generated(gid, plid):
     # Determine which mode to save: 'unique', 'similar', or 'full'
     mode = (request.form.get('mode') or request.args.get('mode') or '').strip().lower()
     if mode == 'unique':
-        track_list = pl.get('unique_tracks', [])
+        refs = pl.get('unique_refs', [])
     elif mode == 'similar':
-        track_list = pl.get('similar_tracks', [])
+        refs = pl.get('similar_refs', [])
     else:
-        track_list = pl.get('all_tracks', [])
+        refs = pl.get('all_refs', [])
 
-    track_uris = [t.get('uri') for t in track_list if t.get('uri')]
+    rows = group.get('tracks') or []
+    track_uris = [Track.from_row(rows[r]).uri for r in refs]
     if not track_uris:
         if request.is_json or request.headers.get('X-Requested-With'):
             return jsonify({'ok': False, 'error': 'No tracks to save'}), 400
@@ -372,7 +697,7 @@ def save_generated(gid, plid):
         if request.is_json or request.headers.get('X-Requested-With'):
             return jsonify({'ok': False, 'error': 'Failed to create playlist'}), 500
         flash('Failed to create playlist.', 'error')
-        return redirect(url_for('unique_view' if g.get('mode')=='unique' else 'similar_view', gid=gid))
+        return redirect(url_for('unique_view' if group.get('mode')=='unique' else 'similar_view', gid=gid))
 
     external = created.get('external_urls', {}).get('spotify') or created.get('uri') or None
     if request.is_json or request.headers.get('X-Requested-With'):
@@ -406,6 +731,8 @@ def merge():
     if not ids:
         flash('Select at least one playlist.', 'error')
         return redirect(url_for('playlists'))
+    if _is_ajax():
+        return _submit_job('merge', {'playlist_ids': ids, 'name': name})
     playlist = client.merge_playlists(ids, name)
     flash(f"Created merged playlist: {playlist['name']}", 'success')
     return redirect(url_for('playlists'))
@@ -487,73 +814,18 @@ def clean():
 
     # If overwrite_flag == '1' and existing_pid is set, pass that id to
     # the cleaner so it replaces items in-place. Otherwise create a new playlist.
-    # If this is an AJAX call, start the clean in a background thread and
+    # If this is an AJAX call, queue the clean as a background job and
     # return a task id so the client can poll progress. For non-AJAX calls
     # continue running synchronously as before.
-    is_ajax = (request.is_json or request.headers.get('X-Requested-With'))
+    is_ajax = _is_ajax()
     app.logger.info("Starting clean for playlist_id=%s cleaned_name=%s existing_pid=%s overwrite_flag=%s ajax=%s", pid, cleaned_name, existing_pid, overwrite_flag, bool(is_ajax))
 
     if is_ajax:
-        # Capture the user's token info from the session while in request context
-        token_info = None
-        try:
-            token_info = session.get('token_info')
-        except Exception:
-            token_info = None
-
-        if not token_info or not token_info.get('access_token'):
-            return jsonify({'ok': False, 'error': 'No auth token available for background task'}), 403
-
-        access_token = token_info.get('access_token')
-
-        task_id = str(uuid4())
-        PROGRESS[task_id] = {'status': 'queued', 'total': 0, 'processed': 0, 'message': 'Queued', 'name': cleaned_name, 'removed': None}
-
-        def run_clean_task(tid, playlist_id, cleaned_name, existing_pid, overwrite_flag, access_token):
-            PROGRESS[tid]['status'] = 'running'
-            PROGRESS[tid]['message'] = 'Initializing'
-            try:
-                # create a local SpotifyClient that uses the captured access token
-                local_client = SpotifyClient()
-                try:
-                    local_client.sp = spotipy.Spotify(auth=access_token)
-                    # override _ensure_token to avoid touching Flask session from worker thread
-                    local_client._ensure_token = lambda: local_client.sp
-                except Exception:
-                    app.logger.exception('Failed to create spotipy client for background task')
-                    PROGRESS[tid].update({'status': 'error', 'message': 'Failed to initialize spotify client'})
-                    return
-
-                # Determine total tracks for progress reporting
-                try:
-                    PROGRESS[tid]['message'] = 'Scanning playlist'
-                    tracks_meta = local_client._get_playlist_tracks(playlist_id) or []
-                    PROGRESS[tid]['total'] = len(tracks_meta)
-                except Exception as ex:
-                    app.logger.exception('Failed to list playlist tracks for progress')
-                    PROGRESS[tid].update({'status': 'error', 'message': 'Failed to list playlist tracks: ' + str(ex)})
-                    return
-
-                def progress_cb(processed, total):
-                    PROGRESS[tid]['processed'] = processed
-                    PROGRESS[tid]['total'] = total or PROGRESS[tid].get('total', 0)
-
-                PROGRESS[tid]['message'] = 'Processing tracks'
-                res = local_client.clean_out_playlist(playlist_id, cleaned_name if not existing_pid else None,
-                                                      overwrite_playlist_id=(existing_pid if overwrite_flag == '1' else None),
-                                                      progress_cb=progress_cb)
-                if not res:
-                    PROGRESS[tid].update({'status': 'error', 'message': 'Failed to create or update cleaned playlist'})
-                    return
-                created, removed = res
-                PROGRESS[tid].update({'status': 'done', 'processed': PROGRESS[tid].get('total', 0), 'removed': removed, 'name': created.get('name') if created else cleaned_name, 'message': f'Finished — removed {removed} tracks' if removed is not None else 'Finished'})
-            except Exception as e:
-                app.logger.exception('clean task failed')
-                PROGRESS[tid].update({'status': 'error', 'message': str(e)})
-
-        thread = threading.Thread(target=run_clean_task, args=(task_id, pid, cleaned_name, existing_pid, overwrite_flag, access_token), daemon=True)
-        thread.start()
-        return jsonify({'ok': True, 'task_id': task_id})
+        return _submit_job('clean', {
+            'playlist_id': pid,
+            'new_name': cleaned_name if not existing_pid else None,
+            'overwrite_playlist_id': existing_pid if overwrite_flag == '1' else None,
+        }, data={'name': cleaned_name, 'removed': None})
 
     # Non-AJAX synchronous path: perform cleaning inline (unchanged behavior)
     result = client.clean_out_playlist(pid, cleaned_name if not existing_pid else None,
@@ -605,10 +877,11 @@ def clean():
 @app.route('/update_liked', methods=['POST'])
 @login_required
 def update_liked():
-    spotify = SpotifyClient()
     pname = request.form.get('liked_name') or 'Liked songs as playlist'
+    if _is_ajax():
+        return _submit_job('update_liked', {'name': pname})
     try:
-        pl = spotify.update_liked_playlist(pname)
+        pl = client.update_liked_playlist(pname)
         if pl:
             flash(f"Updated playlist: {pl.get('name')}", 'success')
         else:
@@ -618,10 +891,24 @@ def update_liked():
     return redirect(url_for('playlists'))
 
 
+def _queue_failure_message(reason):
+    if reason == 'empty':
+        return 'Your queue is empty.'
+    if reason == 'no_playback':
+        return 'No active playback detected. Start playback and try again.'
+    if reason == 'no_current_track':
+        return 'Could not determine current track. Start playback and try again.'
+    if reason == 'no_token':
+        return 'Not authorized. Please log in.'
+    return 'Unable to read/save queue. Make sure you have active playback and try again.'
+
+
 @app.route('/save_queue', methods=['POST'])
 @login_required
 def save_queue():
     name = request.form.get('queue_name')
+    if _is_ajax():
+        return _submit_job('save_queue', {'name': name})
     try:
         playlist, reason = client.save_queue(None, name)
     except Exception as e:
@@ -632,16 +919,7 @@ def save_queue():
             flash(f"Error saving queue: {msg}", 'error')
         return redirect(url_for('playlists'))
     if playlist is None:
-        if reason == 'empty':
-            flash('Your queue is empty.', 'info')
-        elif reason == 'no_playback':
-            flash('No active playback detected. Start playback and try again.', 'error')
-        elif reason == 'no_current_track':
-            flash('Could not determine current track. Start playback and try again.', 'error')
-        elif reason == 'no_token':
-            flash('Not authorized. Please log in.', 'error')
-        else:
-            flash('Unable to read/save queue. Make sure you have active playback and try again.', 'error')
+        flash(_queue_failure_message(reason), 'info' if reason == 'empty' else 'error')
         return redirect(url_for('playlists'))
     flash(f"Saved queue to playlist: {playlist['name']}", 'success')
     return redirect(url_for('playlists'))
@@ -652,19 +930,88 @@ def logout():
     try:
         session.pop('token_info', None)
         session.pop('token', None)
+        session.pop('current_user', None)
+        session.pop('spotify_user_id', None)
     except Exception:
         app.logger.info('No token info in session to clear')
     return redirect(url_for('index'))
 
 
+# An open event stream holds a worker thread for its whole life, so streams
+# are kept short: after SSE_MAX_SECONDS the page continues by polling
+# /clean_progress. Raise it only when serving with threaded or gevent workers.
+SSE_POLL_INTERVAL = 1.0
+SSE_MAX_SECONDS = int(os.getenv('SSE_MAX_SECONDS', '20'))
+
+
+def _job_payload(task_id, job):
+    data = job.get('data') or {}
+    return {'ok': True, 'task_id': task_id, 'kind': job.get('kind'), 'status': job.get('status'), 'processed': job.get('processed', 0), 'total': job.get('total', 0), 'message': job.get('message'), 'removed': data.get('removed'), 'name': data.get('name')}
+
+
+def _owned_job(task_id):
+    job = JOBS.get(task_id)
+    if not job or (job.get('owner') and job['owner'] != client._current_user_id()):
+        return None
+    return job
+
+
 @app.route('/clean_progress/<task_id>')
 @login_required
 def clean_progress(task_id):
-    """Return JSON status for a background clean task id."""
-    data = PROGRESS.get(task_id)
-    if not data:
+    """Return JSON status for a background job id (clean, merge, update_liked, save_queue)."""
+    job = _owned_job(task_id)
+    if not job:
+        return jsonify({'ok': False, 'error': 'Task not found'}), 404
+    return jsonify(_job_payload(task_id, job)), 200
+
+
+@app.route('/jobs/<task_id>/events')
+def job_events(task_id):
+    """Server-sent event stream of a background job's progress.
+
+    Only reads the local job store, so following a job costs no Spotify
+    calls (unlike polling through login_required). The stream ends once the
+    job finishes or after SSE_MAX_SECONDS, at which point the page falls back
+    to polling /clean_progress, so a long job never pins a worker.
+    """
+    if not client._ensure_token():
+        return jsonify({'ok': False, 'error': 'Not authorized'}), 401
+    if not _owned_job(task_id):
+        return jsonify({'ok': False, 'error': 'Task not found'}), 404
+
+    def stream():
+        last = None
+        started = last_sent = time.time()
+        while time.time() - started < SSE_MAX_SECONDS:
+            job = JOBS.get(task_id)
+            if not job:
+                yield 'event: progress\ndata: ' + json.dumps({'ok': False, 'error': 'Task not found'}) + '\n\n'
+                return
+            payload = _job_payload(task_id, job)
+            if payload != last:
+                last, last_sent = payload, time.time()
+                yield f"event: progress\ndata: {json.dumps(payload)}\n\n"
+                if job.get('status') in FINISHED:
+                    return
+            elif time.time() - last_sent > 15:
+                last_sent = time.time()
+                yield ': keep-alive\n\n'
+            time.sleep(SSE_POLL_INTERVAL)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/jobs/<task_id>/cancel', methods=['POST'])
+@login_required
+def cancel_job(task_id):
+    """Request cancellation of a queued or running background job."""
+    if not _owned_job(task_id):
         return jsonify({'ok': False, 'error': 'Task not found'}), 404
-    return jsonify({'ok': True, 'task_id': task_id, 'status': data.get('status'), 'processed': data.get('processed', 0), 'total': data.get('total', 0), 'message': data.get('message'), 'removed': data.get('removed'), 'name': data.get('name')}), 200
+    if not JOBS.cancel(task_id):
+        return jsonify({'ok': False, 'error': 'Task already finished'}), 409
+    return jsonify({'ok': True, 'task_id': task_id})
 
 
 if __name__ == '__main__':
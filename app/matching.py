@@ -0,0 +1,151 @@
+"""Title/artist matching engine shared by compare and clean.
+
+Tracks are matched on (primary artist, title), the same rule the CLI
+`Cleaner` has always used. `LibraryIndex` interns every artist and title to
+an integer, packs each (artist, title) pair into one 64-bit key and keeps,
+per source (liked songs, each playlist), an `array('q')` of its distinct
+keys plus library-wide occurrence counts. Built once per library, it then
+classifies any number of candidate playlists in O(len(playlist)) each,
+with optional exclusion of sources (e.g. the playlist being compared).
+"""
+from array import array
+
+
+class KeyCoder:
+    """Interns strings to small integers and packs (artist, title) pairs into one int key."""
+
+    def __init__(self):
+        self._codes = {}
+
+    def code(self, s):
+        c = self._codes.get(s)
+        if c is None:
+            c = self._codes[s] = len(self._codes)
+        return c
+
+    def key(self, artist, title):
+        return (self.code(artist) << 32) | self.code(title)
+
+    def lookup(self, artist, title):
+        """Return the packed key without interning, or None for unseen strings."""
+        a = self._codes.get(artist)
+        t = self._codes.get(title)
+        if a is None or t is None:
+            return None
+        return (a << 32) | t
+
+
+class LibraryIndex:
+    """Hashed (primary_artist, title) index over a set of track sources."""
+
+    def __init__(self, coder=None):
+        self.coder = coder or KeyCoder()
+        # source id -> (array of distinct keys, array of distinct title codes)
+        self._sources = {}
+        # key / title code -> number of sources containing it
+        self._key_counts = {}
+        self._title_counts = {}
+
+    def add_source(self, source_id, rows):
+        """Index `rows` of (artist, title) pairs under `source_id` (replacing any previous)."""
+        if source_id in self._sources:
+            self.remove_source(source_id)
+        coder = self.coder
+        keys, titles = set(), set()
+        for artist, title in rows:
+            if not title:
+                continue
+            t = coder.code(title)
+            keys.add((coder.code(artist) << 32) | t)
+            titles.add(t)
+        self._sources[source_id] = (array('q', keys), array('q', titles))
+        for k in keys:
+            self._key_counts[k] = self._key_counts.get(k, 0) + 1
+        for t in titles:
+            self._title_counts[t] = self._title_counts.get(t, 0) + 1
+
+    def remove_source(self, source_id):
+        entry = self._sources.pop(source_id, None)
+        if entry is None:
+            return
+        keys, titles = entry
+        for counts, codes in ((self._key_counts, keys), (self._title_counts, titles)):
+            for c in codes:
+                n = counts.get(c, 0) - 1
+                if n > 0:
+                    counts[c] = n
+                else:
+                    counts.pop(c, None)
+
+    def __contains__(self, source_id):
+        return source_id in self._sources
+
+    def _excluded_counts(self, exclude):
+        key_minus, title_minus = {}, {}
+        for sid in exclude:
+            entry = self._sources.get(sid)
+            if entry is None:
+                continue
+            for k in entry[0]:
+                key_minus[k] = key_minus.get(k, 0) + 1
+            for t in entry[1]:
+                title_minus[t] = title_minus.get(t, 0) + 1
+        return key_minus, title_minus
+
+    def classify(self, rows, exclude=()):
+        """Split candidate `rows` of (artist, title) into already-saved and unique.
+
+        Returns a list of booleans, True where the row counts as saved: its
+        (artist, title) exists in the library (minus `exclude` sources), or it
+        repeats an earlier row of the same candidate whose title also exists
+        in the library. This is exactly the rule used by `Cleaner`.
+        """
+        key_counts, title_counts = self._key_counts, self._title_counts
+        key_minus, title_minus = self._excluded_counts(exclude) if exclude else ({}, {})
+        lookup = self.coder._codes.get
+        seen_local = set()
+        out = []
+        for artist, title in rows:
+            a, t = lookup(artist), lookup(title)
+            saved = False
+            if a is not None and t is not None:
+                k = (a << 32) | t
+                saved = key_counts.get(k, 0) - key_minus.get(k, 0) > 0
+            if not saved and t is not None and (artist, title) in seen_local:
+                saved = title_counts.get(t, 0) - title_minus.get(t, 0) > 0
+            out.append(saved)
+            if not saved:
+                seen_local.add((artist, title))
+        return out
+
+    def classify_many(self, candidates, exclude_self=True):
+        """Classify several candidate playlists at once.
+
+        `candidates` is an iterable of (source_id, rows); when `exclude_self`
+        is set, a candidate that is itself an indexed source is excluded from
+        the library it is compared against. Yields (source_id, flags).
+        """
+        for source_id, rows in candidates:
+            exclude = (source_id,) if exclude_self and source_id in self._sources else ()
+            yield source_id, self.classify(rows, exclude=exclude)
+
+
+def primary_artist(artists):
+    """Return the first artist of a comma-joined artists string."""
+    return artists.split(',')[0].strip() if artists else ''
+
+
+def meta_rows(tracks):
+    """Return (primary artist, title) pairs for `Track` records."""
+    return [(t.artist, t.name) for t in tracks]
+
+
+def find_duplicates(rows):
+    """Return the indexes of rows repeating an earlier (artist, title) pair."""
+    seen, dupes = set(), []
+    for i, key in enumerate(rows):
+        if key in seen:
+            dupes.append(i)
+        else:
+            seen.add(key)
+    return dupes
@@ -0,0 +1,321 @@
+"""Request and Spotify API timing metrics.
+
+`METRICS` records, per process:
+
+- every Flask request: wall time histogram and count by route template,
+  method and status,
+- every HTTP call to the Spotify Web API: count by endpoint template,
+  method and status, response bytes and a latency histogram, plus the
+  request scheduler's throttle / retry counters, overall and by endpoint.
+
+`render_prometheus()` formats them in the Prometheus text exposition format
+(served at /metrics). While a request is being handled, the Spotify calls
+it makes (including those made on pagination worker threads, which inherit
+the request's context) are also summed into a per-request `RequestTimer`,
+which the app turns into a `Server-Timing` response header.
+
+High-level operations (clean, merge, compare, save queue) are wrapped in
+`count_calls()` / `@counted`, which count the API calls each one makes per
+endpoint. The counts are logged, exported per operation, and can be checked
+against a budget with `CallCounter.assert_within()`.
+"""
+import asyncio
+import contextvars
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+
+# Histogram bucket upper bounds, in milliseconds.
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+_SPOTIFY_ID = re.compile(r'^[0-9A-Za-z]{22}$')
+_current = contextvars.ContextVar('request_timer', default=None)
+_counters = contextvars.ContextVar('call_counters', default=())
+# (endpoint, method) of the last 429 seen in this context, for the scheduler
+_throttled = contextvars.ContextVar('throttled_call', default=None)
+logger = logging.getLogger(__name__)
+
+
+def endpoint_template(url):
+    """Return the Spotify API path of `url` with ids replaced, e.g. /playlists/{id}/tracks."""
+    path = url.split('://', 1)[-1].split('?', 1)[0]
+    path = path.split('/', 1)[1] if '/' in path else ''
+    parts = [p for p in path.split('/') if p]
+    if parts and parts[0] == 'v1':
+        parts = parts[1:]
+    out = []
+    for i, p in enumerate(parts):
+        if _SPOTIFY_ID.match(p) or (i > 0 and parts[i - 1] == 'users'):
+            out.append('{id}')
+        else:
+            out.append(p)
+    return '/' + '/'.join(out)
+
+
+class Histogram:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, ms):
+        i = 0
+        while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.total += ms
+        self.count += 1
+
+
+class RequestTimer:
+    """Spotify time spent on behalf of one Flask request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spotify_ms = 0.0
+        self.spotify_calls = 0
+
+    def add_spotify(self, ms):
+        with self._lock:
+            self.spotify_ms += ms
+            self.spotify_calls += 1
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self):
+        """Return the value of a Server-Timing header for this request."""
+        parts = [f'app;dur={self.elapsed_ms():.1f}']
+        if self.spotify_calls:
+            parts.append(f'spotify;dur={self.spotify_ms:.1f};desc="{self.spotify_calls} calls"')
+        return ', '.join(parts)
+
+
+def start_request_timer():
+    timer = RequestTimer()
+    _current.set(timer)
+    return timer
+
+
+def current_request_timer():
+    return _current.get()
+
+
+class CallBudgetExceeded(AssertionError):
+    pass
+
+
+class CallCounter:
+    """Spotify API calls made by one high-level operation, per endpoint."""
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.by_endpoint = {}
+        self._lock = threading.Lock()
+
+    def add(self, method, endpoint):
+        key = f'{method} {endpoint}'
+        with self._lock:
+            self.by_endpoint[key] = self.by_endpoint.get(key, 0) + 1
+
+    @property
+    def total(self):
+        return sum(self.by_endpoint.values())
+
+    def assert_within(self, total=None, endpoints=None):
+        """Raise CallBudgetExceeded if more than `total` calls (or more than
+        `endpoints[key]` calls to an endpoint such as 'GET /me/tracks') were made.
+        """
+        over = []
+        if total is not None and self.total > total:
+            over.append(f'{self.total} calls > {total}')
+        for key, limit in (endpoints or {}).items():
+            n = self.by_endpoint.get(key, 0)
+            if n > limit:
+                over.append(f'{key}: {n} > {limit}')
+        if over:
+            raise CallBudgetExceeded(f'{self.operation} over budget: ' + '; '.join(over))
+
+
+@contextmanager
+def count_calls(operation):
+    """Count the Spotify calls made inside the block (including on worker threads
+    and the async loop, which inherit the context). Nested operations count
+    towards every enclosing one.
+    """
+    counter = CallCounter(operation)
+    token = _counters.set(_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _counters.reset(token)
+        METRICS.observe_operation(counter)
+        logger.info('%s used %d Spotify calls: %s', operation, counter.total, counter.by_endpoint)
+
+
+def counted(operation):
+    """Decorator form of `count_calls` for functions and coroutine functions."""
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with count_calls(operation):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with count_calls(operation):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (route, method) -> Histogram; (route, method, status) -> count
+        self._routes = {}
+        self._route_status = {}
+        # (endpoint, method) -> Histogram; (endpoint, method, status) -> count; endpoint -> bytes
+        self._calls = {}
+        self._call_status = {}
+        self._call_bytes = {}
+        # operation -> run count; (operation, endpoint) -> calls
+        self._operations = {}
+        self._operation_calls = {}
+        # (endpoint, method) -> 429s seen by the scheduler / retries it made
+        self._throttled = {}
+        self._retried = {}
+
+    def observe_request(self, route, method, status, ms):
+        with self._lock:
+            hist = self._routes.get((route, method))
+            if hist is None:
+                hist = self._routes[(route, method)] = Histogram()
+            hist.observe(ms)
+            key = (route, method, status)
+            self._route_status[key] = self._route_status.get(key, 0) + 1
+
+    def observe_spotify(self, method, url, status, nbytes, ms):
+        """Record one HTTP call to the Spotify API (and add it to the current request's timer)."""
+        endpoint = endpoint_template(url)
+        with self._lock:
+            hist = self._calls.get((endpoint, method))
+            if hist is None:
+                hist = self._calls[(endpoint, method)] = Histogram()
+            hist.observe(ms)
+            key = (endpoint, method, status)
+            self._call_status[key] = self._call_status.get(key, 0) + 1
+            self._call_bytes[endpoint] = self._call_bytes.get(endpoint, 0) + (nbytes or 0)
+        if status == 429:
+            _throttled.set((endpoint, method))
+        timer = _current.get()
+        if timer is not None:
+            timer.add_spotify(ms)
+        for counter in _counters.get():
+            counter.add(method, endpoint)
+
+    def observe_throttle(self, retried):
+        """Record a 429 handled by the scheduler (and whether it retried), by
+        the endpoint of the throttled call made in the current context."""
+        key = _throttled.get() or ('unknown', '')
+        with self._lock:
+            self._throttled[key] = self._throttled.get(key, 0) + 1
+            if retried:
+                self._retried[key] = self._retried.get(key, 0) + 1
+
+    def observe_operation(self, counter):
+        with self._lock:
+            op = counter.operation
+            self._operations[op] = self._operations.get(op, 0) + 1
+            for endpoint, n in counter.by_endpoint.items():
+                key = (op, endpoint)
+                self._operation_calls[key] = self._operation_calls.get(key, 0) + n
+
+    def snapshot(self):
+        with self._lock:
+            copy = lambda d: {k: (v.counts[:], v.total, v.count) if isinstance(v, Histogram) else v for k, v in d.items()}
+            return {
+                'routes': copy(self._routes),
+                'route_status': dict(self._route_status),
+                'calls': copy(self._calls),
+                'call_status': dict(self._call_status),
+                'call_bytes': dict(self._call_bytes),
+                'operations': dict(self._operations),
+                'operation_calls': dict(self._operation_calls),
+                'throttled': dict(self._throttled),
+                'retried': dict(self._retried),
+            }
+
+
+def _labels(**labels):
+    escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _histogram_lines(name, data, label_names):
+    lines = [f'# TYPE {name} histogram']
+    for key, (counts, total, count) in sorted(data.items()):
+        labels = dict(zip(label_names, key))
+        cumulative = 0
+        for bound, n in zip(BUCKETS_MS + ('+Inf',), counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{_labels(**labels, le=bound)} {cumulative}')
+        lines.append(f'{name}_sum{_labels(**labels)} {total:.3f}')
+        lines.append(f'{name}_count{_labels(**labels)} {count}')
+    return lines
+
+
+def render_prometheus(metrics, scheduler_stats=None):
+    """Return all metrics in the Prometheus text exposition format."""
+    snap = metrics.snapshot()
+    lines = ['# HELP http_request_duration_ms Wall time of Flask requests by route template.']
+    lines += _histogram_lines('http_request_duration_ms', snap['routes'], ('route', 'method'))
+    lines += ['# HELP http_requests_total Flask requests by route template and status.',
+              '# TYPE http_requests_total counter']
+    for (route, method, status), n in sorted(snap['route_status'].items()):
+        lines.append(f'http_requests_total{_labels(route=route, method=method, status=status)} {n}')
+    lines.append('# HELP spotify_api_call_duration_ms Latency of Spotify Web API calls by endpoint.')
+    lines += _histogram_lines('spotify_api_call_duration_ms', snap['calls'], ('endpoint', 'method'))
+    lines += ['# HELP spotify_api_calls_total Spotify Web API calls by endpoint and status.',
+              '# TYPE spotify_api_calls_total counter']
+    for (endpoint, method, status), n in sorted(snap['call_status'].items()):
+        lines.append(f'spotify_api_calls_total{_labels(endpoint=endpoint, method=method, status=status)} {n}')
+    lines += ['# HELP spotify_api_response_bytes_total Response bytes received from the Spotify Web API.',
+              '# TYPE spotify_api_response_bytes_total counter']
+    for endpoint, n in sorted(snap['call_bytes'].items()):
+        lines.append(f'spotify_api_response_bytes_total{_labels(endpoint=endpoint)} {n}')
+    lines += ['# HELP spotify_operations_total Runs of each high-level operation (clean, merge, ...).',
+              '# TYPE spotify_operations_total counter']
+    for op, n in sorted(snap['operations'].items()):
+        lines.append(f'spotify_operations_total{_labels(operation=op)} {n}')
+    lines += ['# HELP spotify_operation_calls_total Spotify Web API calls made by each operation, by endpoint.',
+              '# TYPE spotify_operation_calls_total counter']
+    for (op, endpoint), n in sorted(snap['operation_calls'].items()):
+        lines.append(f'spotify_operation_calls_total{_labels(operation=op, endpoint=endpoint)} {n}')
+    lines += ['# HELP spotify_api_throttled_total 429 responses handled by the request scheduler, by endpoint.',
+              '# TYPE spotify_api_throttled_total counter']
+    for (endpoint, method), n in sorted(snap['throttled'].items()):
+        lines.append(f'spotify_api_throttled_total{_labels(endpoint=endpoint, method=method)} {n}')
+    lines += ['# HELP spotify_api_retries_total Calls retried by the request scheduler after a 429, by endpoint.',
+              '# TYPE spotify_api_retries_total counter']
+    for (endpoint, method), n in sorted(snap['retried'].items()):
+        lines.append(f'spotify_api_retries_total{_labels(endpoint=endpoint, method=method)} {n}')
+    if scheduler_stats:
+        lines += ['# HELP spotify_scheduler_events_total Request scheduler counters (calls, throttled, retried, failed, waited_ms).',
+                  '# TYPE spotify_scheduler_events_total counter']
+        for name, n in sorted(scheduler_stats.items()):
+            lines.append(f'spotify_scheduler_events_total{_labels(event=name)} {n}')
+    return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry.
+METRICS = Metrics()
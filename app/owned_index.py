@@ -0,0 +1,145 @@
+"""Persistent per-user index of which sources own each track.
+
+For one user, `OwnedIndex` maps every track id to the set of sources
+(playlist ids, plus `LIKED` for liked songs) that contain it. Each source is
+stored with the version it was indexed at (a playlist's `snapshot_id`, a
+checksum of the liked-songs ids), so refreshing the index only re-reads the
+sources whose version changed. "Is this track saved anywhere except X and Y"
+is then a dict lookup instead of a library scan.
+
+Indexes are kept in memory for recently active users and persisted to the
+track store, so they survive restarts.
+"""
+import threading
+import zlib
+from collections import OrderedDict
+
+from app.track_store import TRACKS
+
+
+LIKED = '__liked__'
+_MAX_USERS = 32
+
+_INDEXES = OrderedDict()
+_lock = threading.Lock()
+
+
+def ids_version(ids):
+    """Return a stable checksum of a sequence of track ids."""
+    return '%d:%08x' % (len(ids), zlib.crc32('\n'.join(ids).encode()))
+
+
+class OwnedIndex:
+    def __init__(self):
+        # source id -> (version, tuple of track ids)
+        self.sources = {}
+        # track id -> set of source ids containing it
+        self.owners = {}
+        # held while the index is being refreshed
+        self.lock = threading.Lock()
+
+    def version(self, source_id):
+        entry = self.sources.get(source_id)
+        return entry[0] if entry else None
+
+    def set_source(self, source_id, version, track_ids):
+        """Index `track_ids` under `source_id` at `version`, replacing any previous contents."""
+        self.drop_source(source_id)
+        ids = tuple(dict.fromkeys(t for t in track_ids if t))
+        self.sources[source_id] = (version, ids)
+        owners = self.owners
+        for tid in ids:
+            s = owners.get(tid)
+            if s is None:
+                owners[tid] = {source_id}
+            else:
+                s.add(source_id)
+
+    def drop_source(self, source_id):
+        entry = self.sources.pop(source_id, None)
+        if entry is None:
+            return
+        owners = self.owners
+        for tid in entry[1]:
+            s = owners.get(tid)
+            if s is None:
+                continue
+            s.discard(source_id)
+            if not s:
+                del owners[tid]
+
+    def owned(self, track_id, exclude=()):
+        """True if `track_id` is in any indexed source other than those in `exclude`."""
+        s = self.owners.get(track_id)
+        if not s:
+            return False
+        if not exclude:
+            return True
+        return any(sid not in exclude for sid in s)
+
+    def prune(self, listing):
+        """Drop playlists missing from `listing` (the user's current playlists).
+
+        Returns (changed, ids of the listed playlists whose snapshot id differs
+        from the version they were indexed at).
+        """
+        live = {p['id'] for p in listing}
+        gone = [sid for sid in self.sources if sid != LIKED and sid not in live]
+        for sid in gone:
+            self.drop_source(sid)
+        stale = [p['id'] for p in listing if not p.get('snapshot_id') or self.version(p['id']) != p['snapshot_id']]
+        return bool(gone), stale
+
+    def refresh(self, playlist_tracks, snapshot_id, saved_ids=None):
+        """Index freshly read sources and return True if anything changed.
+
+        `playlist_tracks` yields (playlist id, [Track] or None); None marks a
+        failed read, which keeps the previous contents until the next refresh.
+        `snapshot_id(pid)` gives the version to store. `saved_ids` are the
+        liked-song ids, or None when they could not be read.
+        """
+        changed = False
+        for pid, tracks in playlist_tracks:
+            if tracks is None:
+                continue
+            self.set_source(pid, snapshot_id(pid), [t.id for t in tracks])
+            changed = True
+        if saved_ids is not None:
+            version = ids_version(saved_ids)
+            if self.version(LIKED) != version:
+                self.set_source(LIKED, version, saved_ids)
+                changed = True
+        return changed
+
+    def to_state(self):
+        return {sid: [version, list(ids)] for sid, (version, ids) in self.sources.items()}
+
+    @classmethod
+    def from_state(cls, state):
+        index = cls()
+        for sid, (version, ids) in (state or {}).items():
+            index.set_source(sid, version, ids)
+        return index
+
+
+def get_owned_index(user_id):
+    """Return the user's index (from memory, the track store, or empty)."""
+    with _lock:
+        index = _INDEXES.get(user_id)
+        if index is not None:
+            _INDEXES.move_to_end(user_id)
+            return index
+    try:
+        index = OwnedIndex.from_state(TRACKS.get_owned(user_id))
+    except (TypeError, ValueError):
+        index = OwnedIndex()
+    with _lock:
+        index = _INDEXES.setdefault(user_id, index)
+        _INDEXES.move_to_end(user_id)
+        while len(_INDEXES) > _MAX_USERS:
+            _INDEXES.popitem(last=False)
+    return index
+
+
+def save_owned_index(user_id, index):
+    TRACKS.put_owned(user_id, index.to_state())
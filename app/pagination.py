@@ -0,0 +1,86 @@
+"""Concurrent fetching of paginated Spotify endpoints.
+
+Spotify paging objects report `total` on the first page, so every remaining
+offset is known up front. Instead of walking `next` one request at a time,
+`iter_pages` requests the first page, then fetches the rest in parallel on a
+small bounded thread pool and yields the pages in offset order as soon as
+each one (and every page before it) has arrived. Only a bounded window of
+pages is in flight at once, so callers can process a large library in
+bounded memory. Worker threads run in a copy of the caller's context, so
+per-request timing follows the calls onto them. `fetch_pages` / `fetch_items` collect the results.
+"""
+import contextvars
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+MAX_WORKERS = int(os.getenv('SPOTIFY_PAGE_WORKERS', '8'))
+
+
+def iter_pages(fetch, limit, next_page=None, max_workers=None, first=None):
+    """Yield every page of a paginated endpoint, in order.
+
+    Parameters:
+        fetch: callable taking an offset and returning the page at that offset
+        limit: page size passed to `fetch` (used to compute the offsets)
+        next_page: optional callable used to walk `next` serially when the
+            first page does not report `total`
+        max_workers: thread pool size (defaults to SPOTIFY_PAGE_WORKERS)
+        first: the first page, when the caller already has it (e.g. the
+            `tracks` object embedded in a full playlist object)
+    """
+    if first is None:
+        first = fetch(0)
+    if not first:
+        return
+    yield first
+    total = first.get('total')
+    if total is None:
+        page = first
+        while page and page.get('next') and next_page:
+            page = next_page(page)
+            if page:
+                yield page
+        return
+
+    offsets = list(range(first.get('limit') or limit, total, limit))
+    if not offsets:
+        return
+    workers = max(1, min(max_workers or MAX_WORKERS, len(offsets)))
+    if workers == 1:
+        for o in offsets:
+            page = fetch(o)
+            if page:
+                yield page
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        remaining = iter(offsets)
+        for o in remaining:
+            pending.append(pool.submit(contextvars.copy_context().run, fetch, o))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            page = pending.popleft().result()
+            nxt = next(remaining, None)
+            if nxt is not None:
+                pending.append(pool.submit(contextvars.copy_context().run, fetch, nxt))
+            if page:
+                yield page
+
+
+def iter_items(fetch, limit, next_page=None, max_workers=None, first=None):
+    """Yield the `items` of every page of a paginated endpoint, page by page."""
+    for page in iter_pages(fetch, limit, next_page=next_page, max_workers=max_workers, first=first):
+        yield from page.get('items') or []
+
+
+def fetch_pages(fetch, limit, next_page=None, max_workers=None):
+    """Return every page of a paginated endpoint, in order."""
+    return list(iter_pages(fetch, limit, next_page=next_page, max_workers=max_workers))
+
+
+def fetch_items(fetch, limit, next_page=None, max_workers=None, first=None):
+    """Return the concatenated `items` of every page of a paginated endpoint."""
+    return list(iter_items(fetch, limit, next_page=next_page, max_workers=max_workers, first=first))
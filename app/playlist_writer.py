@@ -0,0 +1,140 @@
+"""Delta writer that brings a playlist to an exact target track list.
+
+Instead of emptying a playlist and re-adding every track, `sync_playlist`
+diffs the current contents against the target and applies only:
+
+- removals of tracks that no longer belong (or whose occurrences/order
+  changed), batched 100 per call with a snapshot-id precondition,
+- insertions of the missing tracks at their final positions, one call per
+  contiguous run of up to 100 tracks.
+
+Tracks that stay are never touched, so the playlist is never empty
+mid-operation. Items that cannot be written through the API (local files,
+unavailable tracks) appear as None in the current contents: they are never
+removed, but they still occupy positions, so insertions land where
+intended. If the delta would cost more calls than rewriting the whole
+playlist, and the playlist holds no such items (a replace would delete
+them), it falls back to replacing the contents (first 100 tracks in the
+replace call itself, the rest appended).
+"""
+import difflib
+from collections import Counter
+
+from app.pagination import fetch_items
+
+
+BATCH = 100
+
+
+def _chunks(items, n=BATCH):
+    for i in range(0, len(items), n):
+        yield items[i:i + n]
+
+
+def _writable(uri):
+    return uri if uri and not uri.startswith('spotify:local:') else None
+
+
+def fetch_playlist_uris(sp, playlist_id):
+    """Return (every item's uri in order, None for unwritable items, snapshot id) for a playlist."""
+    snapshot = (sp.playlist(playlist_id, fields='snapshot_id') or {}).get('snapshot_id')
+    items = fetch_items(
+        lambda offset: sp.playlist_items(playlist_id, fields='items.track.uri,next,total', limit=BATCH, offset=offset),
+        BATCH, sp.next)
+    return [_writable((item.get('track') or {}).get('uri')) for item in items], snapshot
+
+
+def plan_sync(current, target):
+    """Return (uris to remove, [(position, uris), ...] to insert) turning `current` into `target`.
+
+    Removal is by URI (all occurrences), so any URI whose occurrence count
+    differs, or that is out of order relative to the kept tracks, is removed
+    and re-inserted at its final position(s). None entries in `current` stay
+    in place; insert positions count them.
+    """
+    cur_counts, tgt_counts = Counter(u for u in current if u is not None), Counter(target)
+    remove = {u for u in cur_counts if cur_counts[u] != tgt_counts.get(u, 0)}
+    kept = [u for u in current if u is not None and u not in remove]
+    kept_target = [u for u in target if u not in remove and u in cur_counts]
+    if kept != kept_target:
+        # Keep the longest common subsequence; everything else moves.
+        matcher = difflib.SequenceMatcher(None, kept, kept_target, autojunk=False)
+        in_order = [False] * len(kept)
+        for block in matcher.get_matching_blocks():
+            for i in range(block.a, block.a + block.size):
+                in_order[i] = True
+        remove.update(u for u, ok in zip(kept, in_order) if not ok)
+    kept = [u for u in current if u is None or u not in remove]
+
+    # `k` walks the kept items (placeholders included), `added` counts the
+    # tracks inserted so far: together they give a run's final position.
+    inserts, run_start, run = [], None, []
+    k = added = 0
+    for u in target:
+        j = k
+        while j < len(kept) and kept[j] is None:
+            j += 1
+        if j < len(kept) and kept[j] == u:
+            k = j + 1
+            if run:
+                inserts.append((run_start, run))
+                run = []
+            continue
+        if not run:
+            run_start = k + added
+        run.append(u)
+        added += 1
+    if run:
+        inserts.append((run_start, run))
+    return sorted(remove), inserts
+
+
+def sync_playlist(sp, playlist_id, target_uris, current_uris=None, snapshot_id=None):
+    """Make `playlist_id` contain exactly `target_uris` (in order) with minimal writes.
+
+    `current_uris`/`snapshot_id` may be passed when the caller already knows
+    the playlist contents (every item, None for unwritable ones, as from
+    `fetch_playlist_uris`); otherwise they are fetched. Returns a dict with
+    'removed', 'added', 'calls', the resulting 'snapshot_id' and 'uris', the
+    playlist's contents after the writes (in the same form).
+    """
+    target = list(target_uris)
+    if current_uris is None:
+        current, snapshot_id = fetch_playlist_uris(sp, playlist_id)
+    else:
+        current = list(current_uris)
+
+    remove, inserts = plan_sync(current, target)
+    delta_calls = -(-len(remove) // BATCH) + sum(-(-len(run) // BATCH) for _, run in inserts)
+    replace_calls = max(1, -(-len(target) // BATCH))
+    stats = {'removed': 0, 'added': 0, 'calls': 0, 'snapshot_id': snapshot_id}
+
+    # replacing would drop the unwritable items, so only replace without them
+    if delta_calls > replace_calls and None not in current:
+        chunks = list(_chunks(target)) or [[]]
+        res = sp.playlist_replace_items(playlist_id, chunks[0])
+        stats['calls'] += 1
+        for chunk in chunks[1:]:
+            res = sp.playlist_add_items(playlist_id, chunk)
+            stats['calls'] += 1
+        stats.update(removed=len(current), added=len(target), snapshot_id=(res or {}).get('snapshot_id'),
+                     uris=target)
+        return stats
+
+    snap = snapshot_id
+    for chunk in _chunks(remove):
+        res = sp.playlist_remove_all_occurrences_of_items(playlist_id, chunk, snapshot_id=snap)
+        snap = (res or {}).get('snapshot_id') or snap
+        stats['calls'] += 1
+    removed = set(remove)
+    stats['removed'] = sum(1 for u in current if u in removed)
+    final = [u for u in current if u not in removed]
+    for position, run in inserts:
+        for offset, chunk in enumerate(_chunks(run)):
+            res = sp.playlist_add_items(playlist_id, chunk, position=position + offset * BATCH)
+            snap = (res or {}).get('snapshot_id') or snap
+            stats['calls'] += 1
+            stats['added'] += len(chunk)
+        final[position:position] = run
+    stats.update(snapshot_id=snap, uris=final)
+    return stats
@@ -0,0 +1,209 @@
+"""Bounded stores for generated compare results.
+
+`/compare_fetch` results hold full track lists for every compared playlist,
+so they are kept in a store with:
+
+- a total byte budget (size measured as the JSON encoding of a result),
+- LRU eviction once the budget is exceeded,
+- a TTL after which results expire,
+- a per-user quota on the number of stored results.
+
+Two backends share the same `get` / `put` / `delete` interface:
+`MemoryResultStore` (default, per worker) and `SQLiteResultStore`, which
+keeps results in a local SQLite file so they survive restarts and can be
+served by any worker on the same machine. Pick one with RESULT_STORE
+(`memory` or `sqlite`) and RESULT_STORE_PATH.
+
+A result that is published repeatedly while it grows (a running compare)
+is built with `GrowingResult`, which encodes each appended item once and
+hands the store a ready-made payload, so a publish costs the new items
+rather than a fresh encoding of the whole result.
+"""
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+MAX_BYTES = int(os.getenv('RESULT_STORE_MAX_BYTES', str(64 * 1024 * 1024)))
+TTL = float(os.getenv('RESULT_STORE_TTL', str(6 * 3600)))
+PER_USER = int(os.getenv('RESULT_STORE_PER_USER', '5'))
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), 'spotify-webserver-results.sqlite3')
+
+
+def _encode(result):
+    return json.dumps(result, separators=(',', ':'))
+
+
+class GrowingResult:
+    """A result whose list fields only grow, with their JSON kept per item.
+
+    `snapshot()` returns a new dict (so readers of an earlier snapshot never
+    see it change) together with its JSON encoding, assembled from the
+    cached item encodings; pass both to a store's `put`.
+    """
+
+    def __init__(self, base, lists=('playlists', 'tracks')):
+        self.fields = {k: v for k, v in base.items() if k not in lists}
+        self.lists = {k: list(base.get(k) or ()) for k in lists}
+        self._encoded = {k: [_encode(v) for v in items] for k, items in self.lists.items()}
+
+    def extend(self, key, items):
+        items = list(items)
+        self.lists[key].extend(items)
+        self._encoded[key].extend(_encode(v) for v in items)
+
+    def update(self, **fields):
+        self.fields.update(fields)
+
+    def snapshot(self, **fields):
+        scalars = dict(self.fields, **fields)
+        result = dict(scalars, **{k: list(v) for k, v in self.lists.items()})
+        lists = ','.join(f'{_encode(k)}:[{",".join(v)}]' for k, v in self._encoded.items())
+        head = _encode(scalars)[:-1]
+        return result, head + (',' if scalars else '') + lists + '}'
+
+
+class MemoryResultStore:
+    def __init__(self, max_bytes=MAX_BYTES, ttl=TTL, per_user=PER_USER):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.per_user = per_user
+        self._lock = threading.Lock()
+        # gid -> (result, owner, size, created_at)
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def _drop(self, gid):
+        entry = self._entries.pop(gid, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _evict(self, owner):
+        now = time.time()
+        for gid in [g for g, e in self._entries.items() if now - e[3] > self.ttl]:
+            self._drop(gid)
+        if owner is not None and self.per_user:
+            owned = [g for g, e in self._entries.items() if e[1] == owner]
+            for gid in owned[:max(0, len(owned) - self.per_user)]:
+                self._drop(gid)
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            self._drop(next(iter(self._entries)))
+
+    def get(self, gid):
+        with self._lock:
+            entry = self._entries.get(gid)
+            if entry is None:
+                return None
+            if time.time() - entry[3] > self.ttl:
+                self._drop(gid)
+                return None
+            self._entries.move_to_end(gid)
+            return entry[0]
+
+    def put(self, gid, result, owner=None, payload=None):
+        size = len(payload or _encode(result))
+        with self._lock:
+            created = self._entries[gid][3] if gid in self._entries else time.time()
+            self._drop(gid)
+            self._entries[gid] = (result, owner, size, created)
+            self._bytes += size
+            self._evict(owner)
+
+    def delete(self, gid):
+        with self._lock:
+            self._drop(gid)
+
+    def __contains__(self, gid):
+        return self.get(gid) is not None
+
+
+class SQLiteResultStore:
+    def __init__(self, path=None, max_bytes=MAX_BYTES, ttl=TTL, per_user=PER_USER):
+        self.path = path or os.getenv('RESULT_STORE_PATH') or DEFAULT_PATH
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.per_user = per_user
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            ' gid TEXT PRIMARY KEY,'
+            ' owner TEXT,'
+            ' size INTEGER NOT NULL,'
+            ' created_at REAL NOT NULL,'
+            ' accessed_at REAL NOT NULL,'
+            ' payload TEXT NOT NULL)'
+        )
+        self._conn.commit()
+
+    def _evict(self, owner):
+        now = time.time()
+        c = self._conn
+        c.execute('DELETE FROM results WHERE created_at < ?', (now - self.ttl,))
+        if owner is not None and self.per_user:
+            c.execute(
+                'DELETE FROM results WHERE owner = ? AND gid NOT IN ('
+                ' SELECT gid FROM results WHERE owner = ? ORDER BY created_at DESC LIMIT ?)',
+                (owner, owner, self.per_user),
+            )
+        total = c.execute('SELECT COALESCE(SUM(size), 0), COUNT(*) FROM results').fetchone()
+        used, count = total
+        if used > self.max_bytes and count > 1:
+            for gid, size in c.execute('SELECT gid, size FROM results ORDER BY accessed_at ASC').fetchall():
+                if used <= self.max_bytes or count <= 1:
+                    break
+                c.execute('DELETE FROM results WHERE gid = ?', (gid,))
+                used -= size
+                count -= 1
+
+    def get(self, gid):
+        with self._lock:
+            row = self._conn.execute('SELECT payload, created_at FROM results WHERE gid = ?', (gid,)).fetchone()
+            if not row:
+                return None
+            if time.time() - row[1] > self.ttl:
+                self._conn.execute('DELETE FROM results WHERE gid = ?', (gid,))
+                self._conn.commit()
+                return None
+            self._conn.execute('UPDATE results SET accessed_at = ? WHERE gid = ?', (time.time(), gid))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, gid, result, owner=None, payload=None):
+        payload = payload or _encode(result)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT created_at FROM results WHERE gid = ?', (gid,)).fetchone()
+            created = row[0] if row else now
+            self._conn.execute(
+                'INSERT OR REPLACE INTO results (gid, owner, size, created_at, accessed_at, payload)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                (gid, owner, len(payload), created, now, payload),
+            )
+            self._evict(owner)
+            self._conn.commit()
+
+    def delete(self, gid):
+        with self._lock:
+            self._conn.execute('DELETE FROM results WHERE gid = ?', (gid,))
+            self._conn.commit()
+
+    def __contains__(self, gid):
+        return self.get(gid) is not None
+
+
+def make_result_store(kind=None):
+    """Build the result store selected by RESULT_STORE (default: memory)."""
+    kind = (kind or os.getenv('RESULT_STORE') or 'memory').strip().lower()
+    if kind == 'sqlite':
+        try:
+            return SQLiteResultStore()
+        except Exception:
+            logging.getLogger(__name__).exception('SQLite result store unavailable; falling back to memory')
+    return MemoryResultStore()
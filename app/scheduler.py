@@ -0,0 +1,169 @@
+"""Central scheduler for outgoing Spotify Web API requests.
+
+Every HTTP call made by `SpotifyClient` goes through `SCHEDULER.call`, which
+
+- takes a token from a per-access-token token bucket (smooths bursts from
+  the concurrent paginators and background tasks),
+- caps the number of in-flight requests process-wide,
+- on a 429 honours `Retry-After` (pausing every caller, since Spotify rate
+  limits per application) and retries with jittered exponential backoff,
+- keeps counters of calls, throttled responses, retries and failures
+  (throttles and retries are also recorded per endpoint in `METRICS`).
+
+`SCHEDULER.acall` applies the same limits (sharing the buckets, the global
+pause and the counters) to coroutines issued by the asyncio backend.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from app.metrics import METRICS
+
+
+RATE = float(os.getenv('SPOTIFY_RATE', '10'))
+BURST = float(os.getenv('SPOTIFY_BURST', '20'))
+MAX_CONCURRENCY = int(os.getenv('SPOTIFY_MAX_CONCURRENCY', '16'))
+MAX_RETRIES = int(os.getenv('SPOTIFY_MAX_RETRIES', '5'))
+BASE_BACKOFF = float(os.getenv('SPOTIFY_BASE_BACKOFF', '0.5'))
+MAX_BACKOFF = float(os.getenv('SPOTIFY_MAX_BACKOFF', '30'))
+MAX_BUCKETS = 256
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        """Take one token and return how many seconds the caller must wait for it."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+def _status(exc):
+    return getattr(exc, 'http_status', None) or getattr(getattr(exc, 'response', None), 'status_code', None)
+
+
+def _retry_after(exc):
+    headers = getattr(exc, 'headers', None) or getattr(getattr(exc, 'response', None), 'headers', None) or {}
+    try:
+        value = headers.get('Retry-After') or headers.get('retry-after')
+    except AttributeError:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestScheduler:
+    def __init__(self, rate=RATE, burst=BURST, max_concurrency=MAX_CONCURRENCY,
+                 max_retries=MAX_RETRIES, base_backoff=BASE_BACKOFF, max_backoff=MAX_BACKOFF):
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._async_slots = None
+        self._paused_until = 0.0
+        self._counters = {'calls': 0, 'throttled': 0, 'retried': 0, 'failed': 0, 'waited_ms': 0}
+
+    def _bucket_wait(self, key):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+                while len(self._buckets) > MAX_BUCKETS:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            wait = bucket.reserve()
+            wait = max(wait, self._paused_until - time.monotonic())
+            return wait
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+
+    def call(self, key, fn, *args, **kwargs):
+        """Run `fn(*args, **kwargs)` under the rate limit for `key`, retrying 429s."""
+        attempt = 0
+        while True:
+            wait = self._bucket_wait(key)
+            if wait > 0:
+                self._count('waited_ms', int(wait * 1000))
+                time.sleep(wait)
+            self._count('calls')
+            try:
+                with self._slots:
+                    return fn(*args, **kwargs)
+            except Exception as exc:
+                if _status(exc) != 429:
+                    raise
+                self._on_throttled(exc, attempt)
+                attempt += 1
+
+    def _on_throttled(self, exc, attempt):
+        """Record a 429 and return the delay before the next attempt (re-raises when out of retries)."""
+        self._count('throttled')
+        if attempt >= self.max_retries:
+            self._count('failed')
+            METRICS.observe_throttle(retried=False)
+            raise exc
+        retry_after = _retry_after(exc)
+        delay = (retry_after + random.uniform(0, 1)) if retry_after is not None else self._backoff(attempt)
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        logging.getLogger(__name__).warning('Spotify rate limited; retrying in %.1fs (attempt %d)', delay, attempt + 1)
+        self._count('retried')
+        METRICS.observe_throttle(retried=True)
+        return delay
+
+    async def acall(self, key, fn, *args, **kwargs):
+        """Await `fn(*args, **kwargs)` under the rate limit for `key`, retrying 429s.
+
+        Must always be awaited on the same event loop (the async backend's).
+        """
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.max_concurrency)
+        attempt = 0
+        while True:
+            wait = self._bucket_wait(key)
+            if wait > 0:
+                self._count('waited_ms', int(wait * 1000))
+                await asyncio.sleep(wait)
+            self._count('calls')
+            try:
+                async with self._async_slots:
+                    return await fn(*args, **kwargs)
+            except Exception as exc:
+                if _status(exc) != 429:
+                    raise
+                self._on_throttled(exc, attempt)
+                attempt += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+
+# Process-wide scheduler shared by every Spotify client.
+SCHEDULER = RequestScheduler()
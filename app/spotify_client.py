@@ -1,16 +1,123 @@
+import contextvars
 import os
+import threading
 import time
-from flask import session
-import spotipy
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from flask import g, session
 import logging
-from spotipy.oauth2 import SpotifyOAuth, SpotifyOauthError
-from dotenv import load_dotenv
-load_dotenv()
+from app.http_pool import get_session
+from app.library_cache import LIBRARY
+from app.liked_sync import sync_saved_tracks
+from app.metrics import counted
+from app.owned_index import get_owned_index, save_owned_index
+from app.pagination import MAX_WORKERS, fetch_items, iter_items
+from app.playlist_writer import sync_playlist
+from app.scheduler import SCHEDULER
+from app.tracks import Track
+
+# How long the /me profile is reused from the session before refetching.
+CURRENT_USER_TTL = float(os.getenv('CURRENT_USER_TTL', '60'))
+# Web API base URL; pointed at bench/fake_spotify.py for offline benchmarks.
+API_URL = os.getenv('SPOTIFY_API_URL', 'https://api.spotify.com/v1/')
+
+
+_scheduled_spotify = None
+
+
+def _scheduled_spotify_class():
+    """Return the ScheduledSpotify class, importing spotipy on first use.
+
+    spotipy (and requests under it) is only imported once a client is
+    actually needed, keeping it out of the cold-start import path.
+    """
+    global _scheduled_spotify
+    if _scheduled_spotify is not None:
+        return _scheduled_spotify
+    import spotipy
+
+    class ScheduledSpotify(spotipy.Spotify):
+        """spotipy client whose HTTP calls all go through the request scheduler.
+
+        429s are left to the scheduler (which honours Retry-After) instead of
+        urllib3's blocking status retries.
+        """
+
+        def __init__(self, *args, **kwargs):
+            kwargs.setdefault('status_forcelist', (500, 502, 503, 504))
+            super().__init__(*args, **kwargs)
+            self.prefix = API_URL
+
+        def _internal_call(self, method, url, payload, params):
+            key = self._auth or 'app'
+            return SCHEDULER.call(key, super()._internal_call, method, url, payload, params)
+
+        def __del__(self):
+            # spotipy closes its session on garbage collection; ours is the
+            # shared connection pool, so leave it open for the other clients.
+            pass
+
+    _scheduled_spotify = ScheduledSpotify
+    return ScheduledSpotify
+
+
+# access token -> ScheduledSpotify, so warm requests reuse the same client.
+_CLIENTS = OrderedDict()
+_CLIENTS_LOCK = threading.Lock()
+MAX_CACHED_CLIENTS = int(os.getenv('SPOTIFY_MAX_CACHED_CLIENTS', '128'))
+
+
+def spotify_for_token(access_token):
+    """Return a scheduled spotipy client authenticated with `access_token`.
+
+    Clients are cached per token and share the process-wide connection pool.
+    """
+    with _CLIENTS_LOCK:
+        sp = _CLIENTS.get(access_token)
+        if sp is not None:
+            _CLIENTS.move_to_end(access_token)
+            return sp
+    sp = _scheduled_spotify_class()(auth=access_token, requests_session=get_session())
+    with _CLIENTS_LOCK:
+        _CLIENTS[access_token] = sp
+        while len(_CLIENTS) > MAX_CACHED_CLIENTS:
+            _CLIENTS.popitem(last=False)
+    return sp
+
+
+def write_playlist_tracks(sp, user_id, playlist_id, tracks):
+    """Bring an existing playlist to exactly `tracks` with a minimal set of writes.
+
+    Diffs against the contents this process last wrote when they are still
+    at the playlist's known snapshot id (sent as the precondition for
+    removals); otherwise, or if that precondition fails, the contents are
+    read first, local and unavailable items included. The written state is
+    cached, so an unchanged playlist costs no calls next time.
+    """
+    from spotipy import SpotifyException
+    uris = [t.uri for t in tracks]
+    known = LIBRARY.get_contents(user_id, playlist_id)
+    try:
+        if known is None:
+            stats = sync_playlist(sp, playlist_id, uris)
+        else:
+            stats = sync_playlist(sp, playlist_id, uris, current_uris=known[1], snapshot_id=known[0])
+    except SpotifyException:
+        LIBRARY.invalidate_playlist(user_id, playlist_id)
+        if known is None:
+            raise
+        stats = sync_playlist(sp, playlist_id, uris)
+    LIBRARY.put_written(user_id, playlist_id, stats['snapshot_id'], stats['uris'], list(tracks))
+    logging.getLogger(__name__).info("synced playlist %s: removed=%d added=%d calls=%d",
+                                     playlist_id, stats['removed'], stats['added'], stats['calls'])
+    return stats
 
 
 class SpotifyClient:
     def __init__(self):
         self.sp = None
+        # Set explicitly for clients used outside a request (background tasks)
+        self.user_id = None
         self.scope = (
             "user-library-read playlist-read-private playlist-read-collaborative "
             "playlist-modify-private playlist-modify-public user-library-modify "
@@ -29,18 +136,42 @@ class SpotifyClient:
         }
 
     def _ensure_token(self):
-        self._ensure_oauth()
         token_info = session.get("token_info")
         if not token_info:
             return None
-        if self.sp_oauth.is_token_expired(token_info):
+        # Same rule as SpotifyOAuth.is_token_expired, without building the
+        # OAuth helper (and importing spotipy) on every request.
+        if token_info.get("expires_at", 0) - int(time.time()) < 60:
+            self._ensure_oauth()
             refreshed = self.sp_oauth.refresh_access_token(token_info.get("refresh_token"))
             # refresh_access_token returns a dict with new access_token and expires_at
             token_info.update(refreshed)
             session["token_info"] = token_info
-        self.sp = spotipy.Spotify(auth=session["token_info"]["access_token"])
+        self.sp = spotify_for_token(session["token_info"]["access_token"])
+        self._load_current_user()
         return self.sp
 
+    def _load_current_user(self):
+        """Copy a still-fresh profile from the session into the request cache."""
+        if g.get("current_user") is not None:
+            return g.current_user
+        cached = session.get("current_user")
+        if cached and time.time() - cached.get("at", 0) <= CURRENT_USER_TTL:
+            g.current_user = cached.get("profile")
+            return g.current_user
+        return None
+
+    def _remember_current_user(self, user):
+        profile = {
+            "id": user.get("id"),
+            "display_name": user.get("display_name"),
+            "images": (user.get("images") or [])[:1],
+        }
+        g.current_user = profile
+        session["current_user"] = {"profile": profile, "at": time.time()}
+        session["spotify_user_id"] = profile["id"]
+        return profile
+
     def get_authorize_url(self):
         self._ensure_oauth()
         return self.sp_oauth.get_authorize_url()
@@ -50,6 +181,7 @@ class SpotifyClient:
         if not code:
             return None
         self._ensure_oauth()
+        from spotipy.oauth2 import SpotifyOauthError
         try:
             token_info = self.sp_oauth.get_access_token(code)
         except SpotifyOauthError as e:
@@ -68,13 +200,17 @@ class SpotifyClient:
             session["token_info"] = token_info
         else:
             session["token_info"] = dict(token_info)
-        self.sp = spotipy.Spotify(auth=session["token_info"]["access_token"]) 
+        session.pop("spotify_user_id", None)
+        session.pop("current_user", None)
+        g.pop("current_user", None)
+        self.sp = spotify_for_token(session["token_info"]["access_token"]) 
         return self.sp
 
 
     def _ensure_oauth(self):
         """Create the SpotifyOAuth helper lazily."""
         if self.sp_oauth is None:
+            from spotipy.oauth2 import SpotifyOAuth
             cfg = self._oauth_config
             self.sp_oauth = SpotifyOAuth(
                 client_id=cfg['client_id'],
@@ -85,22 +221,74 @@ class SpotifyClient:
             )
 
     def get_current_user(self):
+        """Return the current user's profile (id, display_name, images).
+
+        Cached per request and, for CURRENT_USER_TTL seconds, in the session,
+        so a page render makes at most one /me call.
+        """
         if not self._ensure_token():
             return None
-        return self.sp.current_user()
+        cached = self._load_current_user()
+        if cached is not None:
+            return cached
+        user = self.sp.current_user()
+        if not user:
+            return None
+        return self._remember_current_user(user)
 
-    def get_playlists(self):
+    def _current_user_id(self):
+        """Return the id of the authenticated user, used to key the library cache.
+
+        The id is remembered in the session so it costs at most one profile
+        call per login.
+        """
+        if self.user_id:
+            return self.user_id
+        try:
+            uid = session.get("spotify_user_id")
+        except RuntimeError:
+            uid = None
+        if uid:
+            return uid
+        try:
+            user = self.sp.current_user() or {}
+        except Exception:
+            return None
+        try:
+            self._remember_current_user(user)
+        except RuntimeError:
+            pass
+        return user.get("id")
+
+    def iter_playlists(self):
+        """Yield the current user's playlists (id, name, tracks, snapshot_id) page by page.
+
+        Served from the cached listing when it is fresh; otherwise pages are
+        yielded as they arrive and the complete listing is cached once the
+        iteration finishes.
+        """
         if not self._ensure_token():
-            return []
+            return
+        uid = self._current_user_id()
+        cached = LIBRARY.get_listing(uid)
+        if cached is not None:
+            yield from cached
+            return
         playlists = []
-        results = self.sp.current_user_playlists(limit=50)
-        while results:
-            for p in results.get("items", []):
-                playlists.append({"id": p["id"], "name": p["name"], "tracks": p["tracks"]["total"]})
-            if results.get("next"):
-                results = self.sp.next(results)
-            else:
-                break
+        for p in iter_items(lambda offset: self.sp.current_user_playlists(limit=50, offset=offset), 50, self.sp.next):
+            entry = {
+                "id": p["id"],
+                "name": p["name"],
+                "tracks": p["tracks"]["total"],
+                "snapshot_id": p.get("snapshot_id"),
+            }
+            playlists.append(entry)
+            yield entry
+        playlists.sort(key=lambda p: (p.get('name') or '').lower())
+        LIBRARY.put_listing(uid, playlists)
+
+    def get_playlists(self):
+        playlists = list(self.iter_playlists())
         playlists.sort(key=lambda p: (p.get('name') or '').lower())
         return playlists
 
@@ -112,21 +300,18 @@ class SpotifyClient:
             return []
         playlists = []
         try:
-            results = self.sp.user_playlists(user_id, limit=50)
+            items = fetch_items(lambda offset: self.sp.user_playlists(user_id, limit=50, offset=offset), 50, self.sp.next)
         except Exception:
             return []
-        while results:
-            for p in results.get('items', []):
-                playlists.append({
-                    'id': p['id'],
-                    'name': p['name'],
-                    'tracks': p['tracks']['total'],
-                    'images': p.get('images', []),
-                })
-            if results.get('next'):
-                results = self.sp.next(results)
-            else:
-                break
+        for p in items:
+            playlists.append({
+                'id': p['id'],
+                'name': p['name'],
+                'tracks': p['tracks']['total'],
+                'images': p.get('images', []),
+                'snapshot_id': p.get('snapshot_id'),
+            })
+        LIBRARY.note_snapshots(self._current_user_id(), playlists)
         return playlists
 
     def get_user_profile(self, user_id):
@@ -158,11 +343,12 @@ class SpotifyClient:
         if not self._ensure_token():
             return None
         try:
-            user = self.sp.current_user()['id']
+            user = self._current_user_id()
             playlist = self.sp.user_playlist_create(user, name, public=public)
             pid = playlist['id']
             for i in range(0, len(track_uris), 100):
                 self.sp.playlist_add_items(pid, track_uris[i:i+100])
+            LIBRARY.invalidate_listing(self._current_user_id())
             # fetch fresh playlist object
             return self.sp.playlist(pid)
         except Exception:
@@ -177,19 +363,12 @@ class SpotifyClient:
         if not self._ensure_token():
             return None
 
-        ids = []
-        results = self.sp.current_user_saved_tracks(limit=50)
-        while results:
-            for item in results.get('items', []):
-                track = item.get('track')
-                if track and track.get('id'):
-                    ids.append(track['id'])
-            if results.get('next'):
-                results = self.sp.next(results)
-            else:
-                break
+        # Incremental sync: pages from the newest like down to the stored
+        # watermark, with a periodic full reconcile.
+        user = self._current_user_id()
+        saved = sync_saved_tracks(self.sp, user)
+        LIBRARY.put_saved(user, saved)
 
-        user = self.sp.current_user()['id']
         existing = None
         pls = self.get_playlists()
         for p in pls:
@@ -197,67 +376,113 @@ class SpotifyClient:
                 existing = p['id']
                 break
 
+        pid = None
         if existing:
-            pid = existing
             try:
-                self.sp.playlist_replace_items(pid, [])
+                self._sync_playlist(existing, saved)
+                pid = existing
             except Exception:
-                pid = self.sp.user_playlist_create(user, playlist_name, public=False)['id']
-        else:
-            pid = self.sp.user_playlist_create(user, playlist_name, public=False)['id']
-
-        for i in range(0, len(ids), 100):
-            self.sp.playlist_add_items(pid, ids[i:i+100])
+                logging.getLogger(__name__).exception('Failed to update liked playlist %s in place', existing)
+        if pid is None:
+            uris = [t.uri for t in saved]
+            created = self.sp.user_playlist_create(user, playlist_name, public=False)
+            pid, snap = created['id'], created.get('snapshot_id')
+            for i in range(0, len(uris), 100):
+                snap = (self.sp.playlist_add_items(pid, uris[i:i+100]) or {}).get('snapshot_id') or snap
+            LIBRARY.put_written(user, pid, snap, uris, saved)
 
         return self.sp.playlist(pid)
 
-    def _get_playlist_tracks(self, playlist_id):
+    def _sync_playlist(self, playlist_id, tracks):
+        """Bring an existing playlist to exactly `tracks` (see `write_playlist_tracks`)."""
+        return write_playlist_tracks(self.sp, self._current_user_id(), playlist_id, tracks)
+
+    def iter_playlist_tracks(self, playlist_id):
+        """Yield the tracks of a playlist as `Track` records.
+
+        Served from the library cache while the playlist's snapshot id is
+        unchanged. Otherwise tracks are yielded page by page as they are
+        downloaded, and the full list is cached once iteration completes.
+        """
         if not self._ensure_token():
-            return []
+            return
+        yield from self._stream_playlist_tracks(self.sp, self._current_user_id(), playlist_id)
+
+    @staticmethod
+    def _stream_playlist_tracks(sp, uid, playlist_id):
+        # Session-free body of iter_playlist_tracks, safe to run on worker threads.
+        cached = LIBRARY.get_tracks(uid, playlist_id)
+        if cached is not None:
+            yield from cached
+            return
         tracks = []
-        results = self.sp.playlist_items(playlist_id, fields="items.track.id,items.track.uri,items.track.name,next", limit=100)
-        while results:
-            for item in results.get("items", []):
-                t = item.get("track")
-                if t and t.get("id"):
-                    tracks.append({
-                        "id": t["id"],
-                        "uri": t.get("uri"),
-                        "name": t.get("name"),
-                    })
-            if results.get("next"):
-                results = self.sp.next(results)
-            else:
-                break
-        return tracks
+        items = iter_items(
+            lambda offset: sp.playlist_items(playlist_id, fields="items.track(id,uri,name,artists,album),next,total",
+                                             limit=100, offset=offset),
+            100, sp.next)
+        for item in items:
+            t = Track.from_api(item.get('track'))
+            if t is None:
+                continue
+            tracks.append(t)
+            yield t
+        LIBRARY.put_tracks(uid, playlist_id, tracks)
+
+    def iter_many_playlist_tracks(self, playlist_ids, skip_errors=False):
+        """Yield (playlist id, [Track]) for each id, in order, fetching the playlists concurrently.
+
+        Each pair is yielded as soon as that playlist and every one before
+        it have arrived, so callers can start consuming the first source
+        while the rest are still downloading. With `skip_errors`, a playlist
+        that fails to load is logged and yielded as (playlist id, None).
+
+        Cached tracks are trusted by snapshot id, so the playlist listing is
+        revalidated first (a no-op while it is younger than LISTING_TTL).
+        """
+        if not self._ensure_token():
+            return
+        self.get_playlists()
+        ids = list(playlist_ids)
+        sp, uid = self.sp, self._current_user_id()
+
+        def fetch(pid):
+            try:
+                return list(self._stream_playlist_tracks(sp, uid, pid))
+            except Exception:
+                if not skip_errors:
+                    raise
+                logging.getLogger(__name__).exception('Failed to fetch tracks for playlist %s', pid)
+                return None
+
+        if len(ids) <= 1:
+            for pid in ids:
+                yield pid, fetch(pid)
+            return
+        # Like iter_pages, only a bounded window of playlists is in flight, and
+        # closing the generator (a cancelled compare) drops the ones not yet
+        # started instead of waiting for every download to finish.
+        workers = min(len(ids), MAX_WORKERS)
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            pending = deque()
+            remaining = iter(ids)
+            for pid in remaining:
+                pending.append((pid, pool.submit(contextvars.copy_context().run, fetch, pid)))
+                if len(pending) >= workers * 2:
+                    break
+            while pending:
+                pid, future = pending.popleft()
+                tracks = future.result()
+                nxt = next(remaining, None)
+                if nxt is not None:
+                    pending.append((nxt, pool.submit(contextvars.copy_context().run, fetch, nxt)))
+                yield pid, tracks
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
 
     def get_playlist_tracks_meta(self, playlist_id):
-        """Return track metadata for a playlist: id, uri, name, artists (string), album_image."""
-        if not self._ensure_token():
-            return []
-        tracks = []
-        results = self.sp.playlist_items(playlist_id, fields="items.track(id,uri,name,artists,album),next", limit=100)
-        while results:
-            for item in results.get('items', []):
-                t = item.get('track')
-                if not t or not t.get('id'):
-                    continue
-                artists = ', '.join([a.get('name') for a in (t.get('artists') or []) if a.get('name')])
-                album = t.get('album') or {}
-                images = album.get('images') or []
-                album_img = images[0]['url'] if images else None
-                tracks.append({
-                    'id': t['id'],
-                    'uri': t.get('uri'),
-                    'name': t.get('name'),
-                    'artists': artists,
-                    'album_image': album_img,
-                })
-            if results.get('next'):
-                results = self.sp.next(results)
-            else:
-                break
-        return tracks
+        """Return the tracks of a playlist as a list of `Track` (see `iter_playlist_tracks`)."""
+        return list(self.iter_playlist_tracks(playlist_id))
 
     def save_tracks_to_library(self, track_ids):
         """Save the given list of track IDs to the current user's library.
@@ -272,123 +497,146 @@ class SpotifyClient:
             return True
         except Exception:
             return False
+        finally:
+            LIBRARY.invalidate_saved(self._current_user_id())
 
     def get_saved_track_ids(self):
         """Return a set of track IDs that the current user has saved (liked).
         Useful for comparing another user's tracks against the current user's library.
         """
+        return {t.id for t in self.get_saved_tracks_meta()}
+
+    def iter_saved_tracks(self):
+        """Yield the current user's saved tracks (newest first) as `Track` records.
+
+        Synced incrementally from the stored added_at watermark (see app.liked_sync).
+        """
         if not self._ensure_token():
-            return set()
-        ids = []
-        try:
-            results = self.sp.current_user_saved_tracks(limit=50)
-            while results:
-                for item in results.get('items', []):
-                    t = item.get('track')
-                    if t and t.get('id'):
-                        ids.append(t['id'])
-                if results.get('next'):
-                    results = self.sp.next(results)
-                else:
-                    break
-        except Exception:
-            return set()
-        return set(ids)
+            return
+        uid = self._current_user_id()
+        cached = LIBRARY.get_saved(uid)
+        if cached is None:
+            try:
+                cached = sync_saved_tracks(self.sp, uid)
+            except Exception:
+                logging.getLogger(__name__).exception('Failed to sync liked songs')
+                return
+            LIBRARY.put_saved(uid, cached)
+        yield from cached
 
     def get_saved_tracks_meta(self):
-        """Return metadata for current user's saved tracks: list of dicts with id, name, artists (string), uri."""
+        """Return the current user's saved tracks as a list of `Track` (see `iter_saved_tracks`)."""
+        return list(self.iter_saved_tracks())
+
+    def get_library_snapshot(self, exclude_ids=()):
+        """Return the user's library as {'saved': [...], 'playlists': [(playlist, tracks), ...]}.
+
+        `saved` is the liked-songs metadata and `playlists` pairs every playlist
+        in the user's listing (minus `exclude_ids`) with its track metadata.
+        Everything is read through the library cache, so each playlist is
+        fetched at most once per snapshot version.
+        """
         if not self._ensure_token():
-            return []
-        tracks = []
-        try:
-            results = self.sp.current_user_saved_tracks(limit=50)
-            while results:
-                for item in results.get('items', []):
-                    t = item.get('track')
-                    if not t or not t.get('id'):
-                        continue
-                    artists = ', '.join([a.get('name') for a in (t.get('artists') or []) if a.get('name')])
-                    tracks.append({
-                        'id': t.get('id'),
-                        'uri': t.get('uri'),
-                        'name': t.get('name'),
-                        'artists': artists,
-                    })
-                if results.get('next'):
-                    results = self.sp.next(results)
-                else:
-                    break
-        except Exception:
-            return []
-        return tracks
+            return {'saved': [], 'playlists': []}
+        exclude = {pid for pid in exclude_ids if pid}
+        saved = self.get_saved_tracks_meta()
+        playlists = []
+        for p in self.get_playlists():
+            pid = p.get('id')
+            if not pid or pid in exclude:
+                continue
+            try:
+                tracks = self.get_playlist_tracks_meta(pid)
+            except Exception:
+                logging.getLogger(__name__).exception('Failed to fetch tracks for playlist %s', pid)
+                tracks = []
+            playlists.append((p, tracks))
+        return {'saved': saved, 'playlists': playlists}
+
+    def get_owned_index(self):
+        """Return the user's owned-tracks index, brought up to date with the library.
 
+        Only playlists whose snapshot id changed since they were indexed
+        (and liked songs, when their ids changed) are re-read; those reads
+        go through the library cache and are fetched concurrently.
+        """
+        if not self._ensure_token():
+            return None
+        uid = self._current_user_id()
+        index = get_owned_index(uid)
+        logger = logging.getLogger(__name__)
+        with index.lock:
+            changed, stale = index.prune(self.get_playlists())
+            try:
+                saved_ids = [t.id for t in self.iter_saved_tracks()]
+            except Exception:
+                logger.exception('Failed to refresh liked songs in the owned-tracks index')
+                saved_ids = None
+            fetched = self.iter_many_playlist_tracks(stale, skip_errors=True)
+            changed = index.refresh(fetched, lambda pid: LIBRARY.snapshot_id(uid, pid), saved_ids) or changed
+            if changed:
+                save_owned_index(uid, index)
+        logger.info("owned index for %s: sources=%d tracks=%d refreshed=%d",
+                    uid, len(index.sources), len(index.owners), len(stale))
+        return index
+
+    @counted('merge_playlists')
     def merge_playlists(self, playlist_ids, new_name="Merged Playlist"):
         if not self._ensure_token():
             return None
+        # All sources download concurrently; dedup streams through them in
+        # the order given, so the first occurrence of a track wins.
         seen = set()
         uris = []
-        for pid in playlist_ids:
-            for t in self._get_playlist_tracks(pid):
-                if t["uri"] not in seen:
-                    seen.add(t["uri"])
-                    uris.append(t["uri"])
-        user = self.sp.current_user()["id"]
+        for _, tracks in self.iter_many_playlist_tracks(playlist_ids):
+            for t in tracks:
+                if t.uri not in seen:
+                    seen.add(t.uri)
+                    uris.append(t.uri)
+        user = self._current_user_id()
         playlist = self.sp.user_playlist_create(user, new_name, public=False)
         pid = playlist["id"]
         for i in range(0, len(uris), 100):
             self.sp.playlist_add_items(pid, uris[i:i+100])
+        LIBRARY.invalidate_listing(self._current_user_id())
         return playlist
 
+    @counted('clean_out_playlist')
     def clean_out_playlist(self, playlist_id, new_name=None, overwrite_playlist_id=None, progress_cb=None):
         if not self._ensure_token():
             return None
-        tracks = self._get_playlist_tracks(playlist_id)
         logger = logging.getLogger(__name__)
-        logger.info("clean_out_playlist called for playlist_id=%s (tracks=%s) overwrite_target=%s", playlist_id, len(tracks), overwrite_playlist_id)
-        # Build a set of track ids that are considered "saved" for the user.
-        # This includes tracks in the user's liked songs AND tracks appearing in
-        # any of the user's playlists (except the playlist being cleaned).
-        saved_ids = set()
-        try:
-            saved_ids = set(self.get_saved_track_ids())
-        except Exception:
-            saved_ids = set()
-
-        # Collect track ids from other user playlists (excluding the target playlist)
+        logger.info("clean_out_playlist called for playlist_id=%s overwrite_target=%s", playlist_id, overwrite_playlist_id)
+        # A track counts as "saved" when it is in the user's liked songs or
+        # in any of the user's playlists other than the playlist being
+        # cleaned and the playlist that will be overwritten (if provided).
+        # Including the overwrite target would incorrectly mark its tracks as
+        # "already saved" and produce an empty cleaned result when updating
+        # in-place. The owned-tracks index answers this per track; refreshing
+        # it only re-reads playlists whose snapshot changed.
+        exclude = {playlist_id, overwrite_playlist_id} - {None}
         try:
-            user_playlists = self.get_playlists()
-            for p in user_playlists:
-                pid = p.get('id')
-                # Skip the playlist being cleaned and also skip the playlist
-                # that will be overwritten (if provided) so we don't treat it
-                # as a saved source. Including the overwrite target would
-                # incorrectly mark its tracks as "already saved" and produce
-                # an empty cleaned result when updating in-place.
-                if not pid or pid == playlist_id or (overwrite_playlist_id and pid == overwrite_playlist_id):
-                    continue
-                for t in self._get_playlist_tracks(pid):
-                    tid = t.get('id')
-                    if tid:
-                        saved_ids.add(tid)
+            owned = self.get_owned_index()
         except Exception:
-            # If anything goes wrong here, we gracefully fall back to using
-            # only the liked-songs set collected above.
-            logger.exception('Failed to collect tracks from user playlists for saved_ids')
-            pass
-
-        # Keep URIs whose track id is NOT present in saved_ids
-        keep_uris = []
-        total_tracks = len(tracks)
+            # Fall back to keeping every track rather than failing the clean.
+            logger.exception('Failed to refresh the owned-tracks index')
+            owned = None
+        listing = {p['id']: p for p in self.get_playlists()}
+
+        # Stream the playlist being cleaned, keeping URIs whose track id is
+        # not owned by any other source. The listing's track count is the progress
+        # total (it may include local/unavailable items that are skipped).
+        keep = []
+        total_tracks = (listing.get(playlist_id) or {}).get('tracks') or 0
         processed = 0
-        for t in tracks:
-            tid = t.get('id')
-            if not tid or tid not in saved_ids:
-                keep_uris.append(t.get('uri'))
+        for t in self.iter_playlist_tracks(playlist_id):
+            if owned is None or not owned.owned(t.id, exclude):
+                keep.append(t)
             processed += 1
             # call progress callback if provided (processed, total)
             try:
                 if progress_cb:
-                    progress_cb(processed, total_tracks)
+                    progress_cb(processed, max(total_tracks, processed))
             except Exception:
                 # never let progress reporting break the operation
                 pass
@@ -396,31 +644,28 @@ class SpotifyClient:
         # overwrite, replace its items. Otherwise create a new playlist
         # with the requested name.
         try:
-            original_count = len(tracks)
-            removed_count = original_count - len(keep_uris)
-            logger.info("clean_out_playlist summary: original=%d saved_ids=%d keep=%d removed=%d", original_count, len(saved_ids), len(keep_uris), removed_count)
+            original_count = processed
+            removed_count = original_count - len(keep)
+            logger.info("clean_out_playlist summary: original=%d keep=%d removed=%d", original_count, len(keep), removed_count)
 
+            LIBRARY.invalidate_listing(self._current_user_id())
             if overwrite_playlist_id:
-                # Replace items in the existing playlist
-                try:
-                    self.sp.playlist_replace_items(overwrite_playlist_id, [])
-                except Exception:
-                    # If replace fails, attempt to continue by adding items
-                    pass
-                for i in range(0, len(keep_uris), 100):
-                    self.sp.playlist_add_items(overwrite_playlist_id, keep_uris[i:i+100])
+                # Patch the existing playlist to exactly the kept tracks
+                self._sync_playlist(overwrite_playlist_id, keep)
                 pl = self.sp.playlist(overwrite_playlist_id)
                 return (pl, removed_count)
 
             name = new_name or f"Cleaned - {time.strftime('%Y-%m-%d %H:%M')}"
-            user = self.sp.current_user()["id"]
+            user = self._current_user_id()
             playlist = self.sp.user_playlist_create(user, name, public=False)
             pid = playlist["id"]
+            keep_uris = [t.uri for t in keep]
             for i in range(0, len(keep_uris), 100):
                 self.sp.playlist_add_items(pid, keep_uris[i:i+100])
             pl = self.sp.playlist(pid)
             return (pl, removed_count)
         except Exception:
+            logger.exception('clean_out_playlist failed to write cleaned playlist (scheduler stats: %s)', SCHEDULER.stats())
             return None
 
     def _get_current_track_id(self):
@@ -429,6 +674,7 @@ class SpotifyClient:
             return None
         return cp["item"]["id"]
 
+    @counted('save_queue')
     def save_queue(self, queue_uris=None, new_name=None):
         """
         If `queue_uris` is provided (list of spotify:track:... URIs), create a playlist from them.
@@ -441,11 +687,12 @@ class SpotifyClient:
         # If explicit URIs provided, just create playlist from them
         if queue_uris:
             name = new_name or f"Saved Queue - {time.strftime('%Y-%m-%d %H:%M')}"
-            user = self.sp.current_user()["id"]
+            user = self._current_user_id()
             playlist = self.sp.user_playlist_create(user, name, public=False)
             pid = playlist["id"]
             for i in range(0, len(queue_uris), 100):
                 self.sp.playlist_add_items(pid, queue_uris[i:i+100])
+            LIBRARY.invalidate_listing(self._current_user_id())
             return (playlist, None)
 
         # Automated queue-reading flow
@@ -531,11 +778,12 @@ class SpotifyClient:
                 return (None, 'empty')
 
             name = new_name or f"Saved Queue - {time.strftime('%Y-%m-%d %H:%M')}"
-            user = self.sp.current_user()["id"]
+            user = self._current_user_id()
             playlist = self.sp.user_playlist_create(user, name, public=False)
             pid = playlist["id"]
             for i in range(0, len(q), 100):
                 self.sp.playlist_add_items(pid, q[i:i+100])
+            LIBRARY.invalidate_listing(self._current_user_id())
             return (playlist, None)
         except Exception:
             try:
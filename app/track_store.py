@@ -0,0 +1,162 @@
+"""Persistent store of playlist track lists keyed by snapshot id.
+
+A playlist's contents never change without its `snapshot_id` changing, so a
+track list downloaded for a given (playlist id, snapshot id) pair can be
+reused across requests, workers and restarts. Only the latest snapshot of
+each playlist is kept.
+
+It also keeps each user's liked-songs list and sync watermark (see
+`app.liked_sync`) and each user's owned-tracks index (see `app.owned_index`).
+
+Backed by a local SQLite file; if the file cannot be opened (read-only
+filesystem, disabled via env) the store silently turns into a no-op.
+"""
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+
+from app.tracks import decode_tracks, encode_tracks
+
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), 'spotify-webserver-tracks.sqlite3')
+
+
+class TrackStore:
+    def __init__(self, path=None):
+        self.path = path or os.getenv('TRACK_STORE_PATH') or DEFAULT_PATH
+        self._lock = threading.Lock()
+        self._conn = None
+        self._disabled = self.path in ('', '0', 'off', 'none')
+
+    def _connect(self):
+        if self._conn is not None or self._disabled:
+            return self._conn
+        try:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS playlist_tracks ('
+                ' playlist_id TEXT PRIMARY KEY,'
+                ' snapshot_id TEXT NOT NULL,'
+                ' tracks TEXT NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS saved_tracks ('
+                ' user_id TEXT PRIMARY KEY,'
+                ' state TEXT NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS owned_index ('
+                ' user_id TEXT PRIMARY KEY,'
+                ' state TEXT NOT NULL)'
+            )
+            conn.commit()
+            self._conn = conn
+        except Exception:
+            logging.getLogger(__name__).warning('Track store unavailable at %s; persistence disabled', self.path)
+            self._disabled = True
+        return self._conn
+
+    def get(self, playlist_id, snapshot_id):
+        """Return the stored `Track` list for `playlist_id` at `snapshot_id`, or None."""
+        if not playlist_id or not snapshot_id:
+            return None
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            try:
+                row = conn.execute(
+                    'SELECT tracks FROM playlist_tracks WHERE playlist_id = ? AND snapshot_id = ?',
+                    (playlist_id, snapshot_id),
+                ).fetchone()
+            except Exception:
+                logging.getLogger(__name__).exception('Track store read failed')
+                return None
+        if not row:
+            return None
+        try:
+            return decode_tracks(json.loads(row[0]))
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def put(self, playlist_id, snapshot_id, tracks):
+        """Store `tracks` (a list of `Track`) as the contents of `playlist_id` at `snapshot_id`."""
+        if not playlist_id or not snapshot_id:
+            return
+        payload = json.dumps(encode_tracks(tracks), separators=(',', ':'))
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                conn.execute(
+                    'INSERT OR REPLACE INTO playlist_tracks (playlist_id, snapshot_id, tracks) VALUES (?, ?, ?)',
+                    (playlist_id, snapshot_id, payload),
+                )
+                conn.commit()
+            except Exception:
+                logging.getLogger(__name__).exception('Track store write failed')
+
+    def delete(self, playlist_id):
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                conn.execute('DELETE FROM playlist_tracks WHERE playlist_id = ?', (playlist_id,))
+                conn.commit()
+            except Exception:
+                logging.getLogger(__name__).exception('Track store delete failed')
+
+    def _get_user_state(self, table, user_id):
+        if not user_id:
+            return None
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            try:
+                row = conn.execute(f'SELECT state FROM {table} WHERE user_id = ?', (user_id,)).fetchone()
+            except Exception:
+                logging.getLogger(__name__).exception('Track store read failed')
+                return None
+        if not row:
+            return None
+        try:
+            return json.loads(row[0])
+        except ValueError:
+            return None
+
+    def _put_user_state(self, table, user_id, state):
+        if not user_id:
+            return
+        payload = json.dumps(state, separators=(',', ':'))
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                conn.execute(f'INSERT OR REPLACE INTO {table} (user_id, state) VALUES (?, ?)', (user_id, payload))
+                conn.commit()
+            except Exception:
+                logging.getLogger(__name__).exception('Track store write failed')
+
+    def get_saved(self, user_id):
+        """Return the stored liked-songs sync state for `user_id`, or None."""
+        return self._get_user_state('saved_tracks', user_id)
+
+    def put_saved(self, user_id, state):
+        self._put_user_state('saved_tracks', user_id, state)
+
+    def get_owned(self, user_id):
+        """Return the stored owned-tracks index state for `user_id`, or None."""
+        return self._get_user_state('owned_index', user_id)
+
+    def put_owned(self, user_id, state):
+        self._put_user_state('owned_index', user_id, state)
+
+
+TRACKS = TrackStore()
@@ -0,0 +1,145 @@
+"""Compact, immutable track record shared by the web app and the CLI.
+
+A `Track` holds only what the app shows or matches on: id, title, the
+comma-joined artist names, the primary artist and the album cover URL.
+Artist strings and cover URLs repeat across a library, so they are interned
+and every track by the same artist (or on the same album) shares one string.
+The URI is derived from the id; it is only stored for the rare item whose
+URI does not follow the `spotify:track:<id>` form (e.g. podcast episodes).
+
+`TrackTable` dedups tracks by id into one list so that several track lists
+(e.g. all / unique / similar per compared playlist) can be stored as lists
+of integer references into it instead of copies.
+"""
+import sys
+
+from app.matching import primary_artist
+
+
+def _intern(s):
+    return sys.intern(s) if s else ''
+
+
+class Track:
+    """Immutable track record; see the module docstring."""
+
+    __slots__ = ('id', 'name', 'artists', 'artist', 'album_image', '_uri')
+
+    def __init__(self, id, name='', artists='', album_image=None, artist=None, uri=None):
+        artists = artists or ''
+        if artist is None:
+            artist = primary_artist(artists)
+        init = object.__setattr__
+        init(self, 'id', id)
+        init(self, 'name', name or '')
+        init(self, 'artists', _intern(artists))
+        init(self, 'artist', _intern(artist))
+        init(self, 'album_image', _intern(album_image) or None)
+        init(self, '_uri', uri if uri and uri != 'spotify:track:' + id else None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Track is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('Track is immutable')
+
+    def __reduce__(self):
+        return (Track, (self.id, self.name, self.artists, self.album_image, self.artist, self._uri))
+
+    @property
+    def uri(self):
+        return self._uri or 'spotify:track:' + self.id
+
+    def __eq__(self, other):
+        if not isinstance(other, Track):
+            return NotImplemented
+        return self.to_row() == other.to_row()
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f'Track({self.id!r}, {self.name!r}, {self.artists!r})'
+
+    @classmethod
+    def from_api(cls, t):
+        """Build a Track from a Spotify track object; None for local/unavailable items."""
+        if not t or not t.get('id'):
+            return None
+        names = [a.get('name') for a in (t.get('artists') or []) if a.get('name')]
+        images = (t.get('album') or {}).get('images') or []
+        return cls(
+            t['id'],
+            (t.get('name') or '').strip(),
+            ', '.join(names),
+            images[0].get('url') if images else None,
+            artist=names[0] if names else '',
+            uri=t.get('uri'),
+        )
+
+    def to_row(self):
+        """Return a compact JSON-friendly list (see `from_row`)."""
+        artist = self.artist if self.artist != primary_artist(self.artists) else None
+        return [self.id, self.name, self.artists, self.album_image, artist, self._uri]
+
+    @classmethod
+    def from_row(cls, row):
+        """Inverse of `to_row`; also accepts the older track dicts."""
+        if isinstance(row, dict):
+            return cls(row['id'], row.get('name'), row.get('artists'), row.get('album_image'),
+                       artist=row.get('artist'), uri=row.get('uri'))
+        return cls(*row)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'uri': self.uri,
+            'name': self.name,
+            'artists': self.artists,
+            'album_image': self.album_image,
+        }
+
+
+def encode_tracks(tracks):
+    return [t.to_row() for t in tracks]
+
+
+def decode_tracks(rows):
+    return [Track.from_row(r) for r in rows or ()]
+
+
+class TrackTable:
+    """Append-only table of distinct tracks addressed by integer reference."""
+
+    def __init__(self, tracks=()):
+        self.tracks = []
+        self._refs = {}
+        for t in tracks:
+            self.add(t)
+
+    def add(self, track):
+        """Return the reference of `track`, adding it if its id is new."""
+        ref = self._refs.get(track.id)
+        if ref is None:
+            ref = self._refs[track.id] = len(self.tracks)
+            self.tracks.append(track)
+        return ref
+
+    def __getitem__(self, ref):
+        return self.tracks[ref]
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def resolve(self, refs):
+        return [self.tracks[r] for r in refs]
+
+    def to_rows(self):
+        return encode_tracks(self.tracks)
+
+    @classmethod
+    def from_rows(cls, rows):
+        table = cls()
+        table.tracks = decode_tracks(rows)
+        table._refs = {t.id: i for i, t in enumerate(table.tracks)}
+        return table
@@ -0,0 +1,283 @@
+"""Offline analyzer for Vercel request-log exports.
+
+Reads exports in either format Vercel produces: a JSON array
+(`logs_result.json`) or JSON lines (`requests.jsonl`). Both are streamed
+record by record, so exports much larger than memory can be analyzed.
+Records that belong to the same request (a traceback line and the request
+summary share a `requestId`) are merged before they are counted.
+
+The report covers:
+
+- per-route latency percentiles (`durationMs`) and error counts,
+- cold-start vs warm requests, where a request counts as cold when its
+  logs show module initialisation (a traceback through the handler's
+  `<module>`, an `Init Duration`, or the "cold start:" line logged by
+  api/app.py),
+- memory high-water marks (`maxMemoryUsed` against `memorySize`),
+- errors clustered by traceback signature (the exception line with numbers
+  normalised, plus the innermost application frame).
+
+    python bench/analyze_logs.py logs_result.json [more files...] [--json]
+"""
+import argparse
+import json
+import re
+import sys
+from collections import OrderedDict
+
+
+PERCENTILES = (50, 90, 95, 99)
+PENDING_REQUESTS = 2048
+COLD_MARKERS = ('Init Duration', 'INIT_START', 'cold start:', 'exec_module(__vc_module)')
+
+_ID_SEGMENT = re.compile(r'^(?:[0-9A-Za-z]{22}|[0-9a-f]{8}-[0-9a-f-]{27,}|\d+)$')
+_FRAME = re.compile(r'File "([^"]+)", line \d+, in (\S+)')
+_VOLATILE = re.compile(r'0x[0-9a-f]+|\b\d+\b')
+
+
+def iter_records(path, chunk_size=1 << 16):
+    """Yield the JSON objects of a log export (a JSON array or JSON lines) one at a time."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        buf = f.read(chunk_size)
+        while buf and not buf.strip():
+            # leading whitespace can fill the first chunk; read on to the first token
+            more = f.read(chunk_size)
+            if not more:
+                break
+            buf += more
+        stripped = buf.lstrip()
+        if not stripped.startswith('['):
+            # JSON lines
+            rest = buf
+            while True:
+                *lines, rest = rest.split('\n')
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line)
+                more = f.read(chunk_size)
+                if not more:
+                    break
+                rest += more
+            if rest.strip():
+                yield json.loads(rest)
+            return
+        # JSON array: decode one element at a time from a sliding buffer
+        buf = stripped[1:]
+        pos = 0
+        while True:
+            while True:
+                while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                    pos += 1
+                if pos < len(buf):
+                    break
+                more = f.read(chunk_size)
+                if not more:
+                    return
+                buf, pos = buf[pos:] + more, 0
+            if buf[pos] == ']':
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                more = f.read(chunk_size)
+                if not more:
+                    raise
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield obj
+            buf, pos = buf[end:], 0
+
+
+def route_of(record):
+    """Return the request path without host and query, with id-like segments collapsed."""
+    path = record.get('requestPath') or ''
+    host = record.get('host')
+    if host and path.startswith(host):
+        path = path[len(host):]
+    elif '/' in path and '.' in path.split('/', 1)[0]:
+        path = path.split('/', 1)[1]
+    path = path.split('?', 1)[0].strip('/')
+    segments = ['<id>' if _ID_SEGMENT.match(s) else s for s in path.split('/') if s]
+    return '/' + '/'.join(segments)
+
+
+def error_signature(message):
+    """Return a stable signature for a traceback, or None if `message` holds none."""
+    if not message or 'Traceback' not in message and 'Error' not in message:
+        return None
+    lines = [l.strip() for l in message.strip().splitlines() if l.strip()]
+    exc = next((l for l in reversed(lines) if re.match(r'^[\w.]+(Error|Exception|Exit|Interrupt)\b', l)), None)
+    if exc is None:
+        exc = next((l for l in reversed(lines) if 'Error' in l), lines[-1] if lines else '')
+    frames = _FRAME.findall(message)
+    app_frames = [f for f in frames if '/_vendor/' not in f[0] and 'site-packages' not in f[0] and not f[0].startswith('<')]
+    frame = app_frames[-1] if app_frames else (frames[-1] if frames else None)
+    where = f" @ {frame[0].rsplit('/', 1)[-1]}:{frame[1]}" if frame else ''
+    return _VOLATILE.sub('_', exc)[:200] + where
+
+
+class _Request:
+    __slots__ = ('route', 'duration', 'memory', 'memory_size', 'status', 'cold', 'signature', 'time')
+
+    def __init__(self):
+        self.route = None
+        self.duration = None
+        self.memory = None
+        self.memory_size = None
+        self.status = None
+        self.cold = False
+        self.signature = None
+        self.time = None
+
+
+def _positive(value):
+    return value if isinstance(value, (int, float)) and value >= 0 else None
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of already sorted `values`."""
+    if not values:
+        return None
+    k = max(0, min(len(values) - 1, -(-p * len(values) // 100) - 1))
+    return values[int(k)]
+
+
+def _latency(values):
+    values = sorted(values)
+    out = {'count': len(values)}
+    for p in PERCENTILES:
+        out[f'p{p}'] = percentile(values, p)
+    out['max'] = values[-1] if values else None
+    return out
+
+
+class LogAnalyzer:
+    def __init__(self):
+        self._pending = OrderedDict()
+        self.records = 0
+        self.requests = 0
+        self.routes = {}
+        self.cold = {'cold': [], 'warm': []}
+        self.cold_counts = {'cold': 0, 'warm': 0}
+        self.memory = {'max_used_mb': None, 'memory_size_mb': None, 'by_route': {}}
+        self.errors = {}
+
+    def add(self, record):
+        self.records += 1
+        key = record.get('requestId') or record.get('invocationId') or f'#{self.records}'
+        req = self._pending.get(key)
+        if req is None:
+            req = self._pending[key] = _Request()
+            while len(self._pending) > PENDING_REQUESTS:
+                self._finish(self._pending.popitem(last=False)[1])
+        else:
+            self._pending.move_to_end(key)
+        req.route = req.route or route_of(record)
+        req.time = req.time or record.get('TimeUTC')
+        req.duration = _positive(record.get('durationMs')) if req.duration is None else req.duration
+        req.memory = max(filter(None, (req.memory, _positive(record.get('maxMemoryUsed')))), default=None)
+        req.memory_size = req.memory_size or _positive(record.get('memorySize'))
+        status = record.get('responseStatusCode')
+        if isinstance(status, int) and status > 0:
+            req.status = status
+        message = record.get('message') or ''
+        if any(m in message for m in COLD_MARKERS):
+            req.cold = True
+        sig = error_signature(message)
+        if sig and not req.signature:
+            req.signature = sig
+
+    def _finish(self, req):
+        self.requests += 1
+        route = self.routes.setdefault(req.route, {'durations': [], 'count': 0, 'errors': 0, 'cold': 0})
+        route['count'] += 1
+        failed = req.signature is not None or (req.status or 0) >= 500
+        route['errors'] += failed
+        route['cold'] += req.cold
+        kind = 'cold' if req.cold else 'warm'
+        self.cold_counts[kind] += 1
+        if req.duration is not None:
+            route['durations'].append(req.duration)
+            self.cold[kind].append(req.duration)
+        if req.memory is not None:
+            mem = self.memory
+            mem['max_used_mb'] = max(mem['max_used_mb'] or 0, req.memory)
+            mem['by_route'][req.route] = max(mem['by_route'].get(req.route, 0), req.memory)
+        if req.memory_size:
+            self.memory['memory_size_mb'] = max(self.memory['memory_size_mb'] or 0, req.memory_size)
+        if req.signature:
+            cluster = self.errors.setdefault(req.signature, {'count': 0, 'cold': 0, 'routes': {}, 'first': req.time, 'last': req.time})
+            cluster['count'] += 1
+            cluster['cold'] += req.cold
+            cluster['routes'][req.route] = cluster['routes'].get(req.route, 0) + 1
+            cluster['first'] = min(filter(None, (cluster['first'], req.time)), default=None)
+            cluster['last'] = max(filter(None, (cluster['last'], req.time)), default=None)
+
+    def report(self):
+        while self._pending:
+            self._finish(self._pending.popitem(last=False)[1])
+        routes = {}
+        for name, r in sorted(self.routes.items(), key=lambda kv: -kv[1]['count']):
+            routes[name] = dict(_latency(r['durations']), requests=r['count'], errors=r['errors'], cold=r['cold'])
+        memory = dict(self.memory)
+        if memory['max_used_mb'] and memory['memory_size_mb']:
+            memory['max_used_pct'] = round(100.0 * memory['max_used_mb'] / memory['memory_size_mb'], 1)
+        errors = [dict(signature=sig, **c) for sig, c in sorted(self.errors.items(), key=lambda kv: -kv[1]['count'])]
+        return {
+            'records': self.records,
+            'requests': self.requests,
+            'routes': routes,
+            'cold_start': {kind: dict(_latency(self.cold[kind]), requests=self.cold_counts[kind]) for kind in ('cold', 'warm')},
+            'memory': memory,
+            'errors': errors,
+        }
+
+
+def _fmt(v):
+    if v is None:
+        return '-'
+    return f'{v:.0f}' if isinstance(v, float) else str(v)
+
+
+def format_report(report):
+    lines = [f"{report['records']} records, {report['requests']} requests", '', 'Latency by route (ms)']
+    header = ['route', 'requests', 'errors', 'cold'] + [f'p{p}' for p in PERCENTILES] + ['max']
+    rows = [[name, r['requests'], r['errors'], r['cold']] + [r[f'p{p}'] for p in PERCENTILES] + [r['max']]
+            for name, r in report['routes'].items()]
+    rows.append([])
+    for kind, r in report['cold_start'].items():
+        rows.append([f'[{kind}]', r['requests'], '', ''] + [r[f'p{p}'] for p in PERCENTILES] + [r['max']])
+    widths = [max(len(_fmt(c)) for c in col) for col in zip(header, *[r for r in rows if r])]
+    for row in [header] + rows:
+        lines.append('  '.join(_fmt(c).ljust(w) for c, w in zip(row, widths)) if row else '')
+    mem = report['memory']
+    lines += ['', f"Memory high-water: {_fmt(mem['max_used_mb'])} MB of {_fmt(mem['memory_size_mb'])} MB"
+              + (f" ({mem['max_used_pct']}%)" if 'max_used_pct' in mem else '')]
+    for route, used in sorted(mem['by_route'].items(), key=lambda kv: -kv[1]):
+        lines.append(f'  {route}: {used} MB')
+    lines += ['', 'Errors by signature']
+    for e in report['errors']:
+        routes = ', '.join(f'{r} x{n}' for r, n in e['routes'].items())
+        lines.append(f"  {e['count']:>5}  (cold {e['cold']})  {e['signature']}")
+        lines.append(f"         routes: {routes}; first {e['first']}, last {e['last']}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('paths', nargs='+', help='log exports (.json array or .jsonl)')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+    analyzer = LogAnalyzer()
+    for path in args.paths:
+        for record in iter_records(path):
+            if isinstance(record, dict):
+                analyzer.add(record)
+    report = analyzer.report()
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""Cold-start benchmark for the Vercel entrypoint (api/app.py).
+
+Each run starts a fresh interpreter, imports `api.app` and serves one
+request through the Flask test client, reporting:
+
+- `process_ms`: wall time of the whole child process (interpreter start
+  included),
+- `import_ms`: time to import the entrypoint,
+- `first_request_ms`: the first request (includes compiling its template),
+- `eager_heavy`: heavy modules (spotipy, requests, httpx, ...) already
+  imported after the entrypoint import, which should stay empty.
+
+One extra run under `python -X importtime` produces the import-time
+profile: the slowest modules by cumulative and by self time.
+
+Results are printed as JSON. The exit status is 1 when the median import
+time exceeds the budget or a heavy module is imported eagerly, so this can
+guard against cold-start regressions in CI:
+
+    python bench/cold_start.py --runs 10 --budget-ms 400
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ('spotipy', 'requests', 'httpx')
+
+CHILD = r'''
+import json, sys, time
+t0 = time.perf_counter()
+import api.app as entry
+t1 = time.perf_counter()
+resp = entry.app.test_client().get(sys.argv[1])
+t2 = time.perf_counter()
+heavy = sorted(m for m in sys.argv[2].split(',') if m in sys.modules)
+print(json.dumps({
+    'import_ms': (t1 - t0) * 1000,
+    'first_request_ms': (t2 - t1) * 1000,
+    'status': resp.status_code,
+    'modules': len(sys.modules),
+    'eager_heavy': heavy,
+}))
+'''
+
+
+def _child_env():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    return env
+
+
+def run_once(path, heavy):
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-c', CHILD, path, ','.join(heavy)], cwd=ROOT,
+                          env=_child_env(), capture_output=True, text=True)
+    elapsed = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f'cold start run failed:\n{proc.stderr}')
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['process_ms'] = elapsed
+    return result
+
+
+def import_profile(top):
+    """Return the slowest imports of api.app as reported by `-X importtime`."""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import api.app'], cwd=ROOT,
+                          env=_child_env(), capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cum_us, name = line[len('import time:'):].split('|')
+            rows.append((name.rstrip(), int(self_us), int(cum_us)))
+        except ValueError:
+            continue
+    # Top-level imports are the least indented entries.
+    depth = lambda name: len(name) - len(name.lstrip())
+    min_depth = min((depth(n) for n, _, _ in rows), default=0)
+    top_level = [r for r in rows if depth(r[0]) == min_depth]
+    fmt = lambda r: {'module': r[0].strip(), 'self_ms': r[1] / 1000, 'cumulative_ms': r[2] / 1000}
+    return {
+        'total_ms': sum(r[2] for r in top_level) / 1000,
+        'by_cumulative': [fmt(r) for r in sorted(top_level, key=lambda r: -r[2])[:top]],
+        'by_self': [fmt(r) for r in sorted(rows, key=lambda r: -r[1])[:top]],
+    }
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        'min': values[0],
+        'median': statistics.median(values),
+        'p90': values[min(len(values) - 1, int(round(0.9 * (len(values) - 1))))],
+        'max': values[-1],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/', help='request served after the import')
+    parser.add_argument('--budget-ms', type=float, default=float(os.getenv('COLD_START_BUDGET_MS', '500')),
+                        help='maximum median import time')
+    parser.add_argument('--top', type=int, default=15, help='modules listed in the import profile')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    runs = [run_once(args.path, HEAVY) for _ in range(max(1, args.runs))]
+    eager = sorted({m for r in runs for m in r['eager_heavy']})
+    report = {
+        'runs': len(runs),
+        'status': sorted({r['status'] for r in runs}),
+        'modules': runs[-1]['modules'],
+        'process_ms': summarize([r['process_ms'] for r in runs]),
+        'import_ms': summarize([r['import_ms'] for r in runs]),
+        'first_request_ms': summarize([r['first_request_ms'] for r in runs]),
+        'eager_heavy': eager,
+        'budget_ms': args.budget_ms,
+        'import_profile': import_profile(args.top),
+    }
+    report['ok'] = report['import_ms']['median'] <= args.budget_ms and not eager
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    return 0 if report['ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,293 @@
+"""End-to-end benchmark of the web app and the CLI against the fake Spotify API.
+
+Starts bench/fake_spotify.py in-process, points the app at it
+(SPOTIFY_API_URL) with its stores in a fresh temporary directory, logs a
+Flask test client in, and times each scenario `--runs` times:
+
+- web: /playlists, /compare_fetch, /clean, /merge, /update_liked (and
+  /save_queue when asked for); the job routes (all but /playlists) are
+  submitted the way the page does (AJAX) and timed until the background job
+  finishes,
+- CLI: `Cleaner.clean_out_playlist`, `Cleaner.merge_playlists` and
+  `Cleaner.get_tracks(everything=True)` from PlaylistManager.py.
+
+The first run of a scenario is cold (empty caches and stores), the rest
+are warm. For every run the report has the wall time and the Spotify API
+calls it made, per endpoint, as counted by the fake server.
+
+Every run is also checked against the scenario's API-call budget, computed
+from the size of the library at the time: reading each part of the library
+(the playlist listing, every playlist's pages, the liked pages) a bounded
+number of times, plus a few constant calls. Anything that scales with the
+number of tracks or repeats a per-playlist read inside a loop (an N+1
+pattern) goes over it. The per-operation counts the app itself keeps
+(`app.metrics.count_calls`) are included for comparison.
+
+The report is printed as JSON; with `--baseline` it also gives each
+scenario's time relative to a previous report. The exit status is 1 if any
+run failed or went over its budget.
+
+    python bench/e2e.py --playlists 50 --tracks 200 --latency-ms 30 --runs 3 --output bench.json
+"""
+import argparse
+import builtins
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from fake_spotify import OTHER_USER_ID, USER_ID, add_library_arguments, pages, server_from_args
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEB_SCENARIOS = ('playlists', 'compare_fetch', 'clean', 'merge', 'update_liked')
+CLI_SCENARIOS = ('cli_clean', 'cli_merge', 'cli_library')
+OPTIONAL_SCENARIOS = ('save_queue',)
+TOKEN = 'bench-token'
+AJAX = {'X-Requested-With': 'XMLHttpRequest'}
+JOB_TIMEOUT = 600
+
+# Scenario -> budget(page_counts, library, scenarios) in API calls. See the
+# module docstring; `page_counts` is FakeLibrary.page_counts().
+BUDGETS = {
+    'playlists': lambda m, lib, s: m['listing'] + 2,
+    'compare_fetch': lambda m, lib, s: (m['other_listing'] + m['listing'] + m['liked'] + m['playlist_tracks']
+                                        + m['other_tracks'] + 3),
+    'clean': lambda m, lib, s: 2 * m['listing'] + m['liked'] + m['playlist_tracks'] + 4 * lib.track_pages(s.mine[0]) + 6,
+    'merge': lambda m, lib, s: m['listing'] + 2 * sum(lib.track_pages(p) for p in s.mine[:3]) + 4,
+    'update_liked': lambda m, lib, s: m['listing'] + m['liked'] + 3 * m['liked_100'] + 5,
+    'save_queue': lambda m, lib, s: 3 * len(lib.initial_queue) + pages(len(lib.initial_queue), 100) + 14,
+    'cli_clean': lambda m, lib, s: 4 * m['listing'] + m['liked'] + m['owned_tracks'] + 2 * lib.track_pages(s.mine[1]) + 4,
+    'cli_merge': lambda m, lib, s: 2 * m['listing'] + 2 * sum(lib.track_pages(p) for p in s.mine[:3]) + 4,
+    'cli_library': lambda m, lib, s: 2 * m['listing'] + m['liked'] + m['owned_tracks'] + 2,
+}
+# Per-endpoint caps that hold for every scenario.
+ENDPOINT_BUDGETS = {'GET /me': 2, 'GET /users/{id}': 1}
+
+
+def configure_app(api, backend, client_rate=None):
+    """Point the app at the fake API; must run before any `app` module is imported."""
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    os.environ['SPOTIFY_API_URL'] = api.api_url
+    os.environ['SPOTIFY_BACKEND'] = backend
+    if client_rate:
+        os.environ['SPOTIFY_RATE'] = str(client_rate)
+        os.environ['SPOTIFY_BURST'] = str(client_rate)
+    # Cold stores: the track, result and job databases live in the temp dir.
+    tempfile.tempdir = tempfile.mkdtemp(prefix='spotify-bench-')
+
+
+@contextmanager
+def _answers():
+    """Answer the CLI's prompts: confirm overwrites, decline backups."""
+    original = builtins.input
+    builtins.input = lambda prompt='': 'y' if 'already exists' in prompt else 'n'
+    try:
+        yield
+    finally:
+        builtins.input = original
+
+
+class WebScenarios:
+    def __init__(self, api):
+        import app.main as main
+        self.api = api
+        self.main = main
+        self.client = main.app.test_client()
+        with self.client.session_transaction() as s:
+            s['token_info'] = {'access_token': TOKEN, 'refresh_token': TOKEN,
+                               'expires_at': int(time.time()) + 86400, 'token_type': 'Bearer'}
+        self.mine = api.library.owned_playlists(USER_ID)
+
+    def _job(self, resp):
+        data = resp.get_json(silent=True) or {}
+        if not data.get('ok'):
+            return False, data.get('error') or f'HTTP {resp.status_code}'
+        started = time.monotonic()
+        while time.monotonic() - started < JOB_TIMEOUT:
+            job = self.main.JOBS.get(data['task_id']) or {}
+            if job.get('status') in self.main.FINISHED:
+                return job['status'] == 'done', job.get('message')
+            time.sleep(0.005)
+        return False, 'job timed out'
+
+    def playlists(self):
+        resp = self.client.get('/playlists')
+        return resp.status_code == 200, f'HTTP {resp.status_code}'
+
+    def compare_fetch(self):
+        return self._job(self.client.post('/compare_fetch', json={'compare_user': OTHER_USER_ID}))
+
+    def clean(self):
+        return self._job(self.client.post('/clean', data={'clean_playlist': self.mine[0], 'overwrite': '1'},
+                                          headers=AJAX))
+
+    def merge(self):
+        return self._job(self.client.post('/merge', data={'playlist': self.mine[:3], 'name': 'Bench merge'},
+                                          headers=AJAX))
+
+    def update_liked(self):
+        return self._job(self.client.post('/update_liked', data={'liked_name': 'Bench liked'}, headers=AJAX))
+
+    def save_queue(self):
+        self.api.library.reset_queue()
+        return self._job(self.client.post('/save_queue', data={'queue_name': 'Bench queue'}, headers=AJAX))
+
+
+class CliScenarios:
+    def __init__(self, api):
+        import spotipy
+        from PlaylistManager import Cleaner
+        from app.http_pool import instrument
+        sp = instrument(spotipy.Spotify(auth=TOKEN))
+        sp.prefix = api.api_url
+        # Skip Cleaner.__init__, which starts the interactive OAuth flow.
+        self.cleaner = Cleaner.__new__(Cleaner)
+        self.cleaner.sp = sp
+        self.cleaner.user_id = USER_ID
+        self.mine = api.library.owned_playlists(USER_ID)
+
+    def cli_clean(self):
+        with _answers():
+            name = self.cleaner.clean_out_playlist(self.mine[1], to_return=[])
+        return name is not None, name
+
+    def cli_merge(self):
+        with _answers():
+            name = self.cleaner.merge_playlists(self.mine[:3])
+        return name is not None, name
+
+    def cli_library(self):
+        tracks = self.cleaner.get_tracks(everything=True)
+        return bool(tracks), f'{len(tracks)} tracks'
+
+
+def check_budget(name, budget, stats):
+    """Return None, or why the calls in `stats` (fake server counts) are over `budget`.
+
+    Each injected 429 adds one retry to the allowance.
+    """
+    from app.metrics import CallBudgetExceeded, CallCounter
+    counter = CallCounter(name)
+    counter.by_endpoint = dict(stats['by_endpoint'])
+    slack = stats['throttled']
+    try:
+        counter.assert_within(total=budget + slack,
+                              endpoints={k: v + slack for k, v in ENDPOINT_BUDGETS.items()})
+    except CallBudgetExceeded as e:
+        return str(e)
+    return None
+
+
+def run_scenario(api, name, suite, fn, runs, budgets=True):
+    results = []
+    for _ in range(runs):
+        budget = BUDGETS[name](api.library.page_counts(), api.library, suite) if budgets else None
+        api.reset_stats()
+        start = time.perf_counter()
+        try:
+            ok, detail = fn()
+        except Exception as e:
+            ok, detail = False, f'{type(e).__name__}: {e}'
+        ms = (time.perf_counter() - start) * 1000
+        stats = api.stats()
+        run = {'ms': round(ms, 1), 'ok': ok, 'calls': stats['calls'], 'throttled': stats['throttled'],
+               'by_endpoint': stats['by_endpoint']}
+        if not ok:
+            run['error'] = detail
+        if budget is not None:
+            run['budget'] = budget
+            over = check_budget(name, budget, stats)
+            if over:
+                run['ok'] = False
+                run['over_budget'] = over
+        results.append(run)
+    warm = [r['ms'] for r in results[1:]]
+    return {
+        'ok': all(r['ok'] for r in results),
+        'cold_ms': results[0]['ms'],
+        'warm_ms': statistics.median(warm) if warm else None,
+        'cold_calls': results[0]['calls'],
+        'warm_calls': results[-1]['calls'] if warm else None,
+        'runs': results,
+    }
+
+
+def compare_to_baseline(report, baseline):
+    """Add each scenario's time relative to the same scenario in `baseline` (1.0 = unchanged)."""
+    for name, s in report['scenarios'].items():
+        base = (baseline.get('scenarios') or {}).get(name)
+        if not base:
+            continue
+        s['vs_baseline'] = {
+            key: round(s[key] / base[key], 3)
+            for key in ('cold_ms', 'warm_ms', 'cold_calls', 'warm_calls')
+            if s.get(key) is not None and base.get(key)
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_library_arguments(parser)
+    parser.add_argument('--runs', type=int, default=3, help='runs per scenario (the first is cold)')
+    parser.add_argument('--backend', choices=('sync', 'async'), default=os.getenv('SPOTIFY_BACKEND', 'sync'))
+    parser.add_argument('--client-rate', type=float, help="override the app's request rate limit (requests/s)")
+    parser.add_argument('--scenarios', default=','.join(WEB_SCENARIOS + CLI_SCENARIOS),
+                        help='comma-separated, from: ' + ', '.join(WEB_SCENARIOS + CLI_SCENARIOS + OPTIONAL_SCENARIOS))
+    parser.add_argument('--no-budgets', action='store_true', help='do not check API-call budgets')
+    parser.add_argument('--baseline', help='previous JSON report to compare against')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.scenarios.split(',') if n.strip()]
+    unknown = set(names) - set(WEB_SCENARIOS + CLI_SCENARIOS + OPTIONAL_SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    api = server_from_args(args).start()
+    try:
+        configure_app(api, args.backend, args.client_rate)
+        suites = {}
+        report = {
+            'config': {k: v for k, v in vars(args).items() if k not in ('baseline', 'output', 'scenarios', 'no_budgets')},
+            'scenarios': {},
+        }
+        for name in names:
+            kind = CliScenarios if name.startswith('cli_') else WebScenarios
+            try:
+                if kind not in suites:
+                    suites[kind] = kind(api)
+                fn = getattr(suites[kind], name)
+            except Exception as e:
+                report['scenarios'][name] = {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+                continue
+            report['scenarios'][name] = run_scenario(api, name, suites[kind], fn, max(1, args.runs),
+                                                     budgets=not args.no_budgets)
+        if suites:
+            from app.metrics import METRICS
+            calls = METRICS.snapshot()['operation_calls']
+            report['operations'] = {f'{op} {endpoint}': n for (op, endpoint), n in sorted(calls.items())}
+        if WebScenarios in suites:
+            from app.scheduler import SCHEDULER
+            report['scheduler'] = SCHEDULER.stats()
+    finally:
+        api.stop()
+
+    report['ok'] = all(s['ok'] for s in report['scenarios'].values())
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare_to_baseline(report, json.load(f))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    return 0 if report['ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
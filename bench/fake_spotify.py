@@ -0,0 +1,452 @@
+"""Local stand-in for the Spotify Web API.
+
+Serves a deterministic synthetic library so the app and the CLI can be
+exercised (and timed) without a Spotify account:
+
+- one user (`bench-user`) with `--playlists` playlists of `--tracks`
+  tracks each and `--liked` liked songs, all drawn from a shared catalog so
+  playlists overlap the way real libraries do,
+- a second user (`bench-other`) with `--other-playlists` public playlists,
+  the target of /compare_fetch,
+- a player with `--queue` queued tracks, for save_queue.
+
+Responses follow the real API's shapes and paging (`limit`/`offset`/
+`next`/`total`, playlist objects embedding their first 100 tracks,
+`snapshot_id` bumped on every write), so every client path runs unchanged.
+Each request can be delayed (`--latency-ms` plus up to `--jitter-ms`) and
+answered with a 429 + Retry-After at rate `--throttle-rate`.
+
+Requests are counted per endpoint; GET /_bench/stats returns the counts and
+POST /_bench/reset clears them. Point the app at the server with
+SPOTIFY_API_URL=http://127.0.0.1:<port>/v1/ (any bearer token is accepted):
+
+    python bench/fake_spotify.py --port 8765 --playlists 50 --tracks 200
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+USER_ID = 'bench-user'
+OTHER_USER_ID = 'bench-other'
+PAGE_LIMITS = {'playlists': 50, 'tracks': 100, 'saved': 50}
+_ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+
+def make_id(kind, n):
+    """Return a deterministic 22-character base62 id for the `n`th object of `kind`."""
+    x = (zlib.crc32(kind.encode()) << 32) + n
+    out = []
+    for _ in range(22):
+        x, r = divmod(x, 62)
+        out.append(_ALPHABET[r])
+    return ''.join(reversed(out))
+
+
+class FakeLibrary:
+    """Mutable synthetic Spotify state for both users."""
+
+    def __init__(self, playlists=20, tracks=100, liked=1000, other_playlists=5, queue=5,
+                 catalog=None, artists=None, seed=0):
+        rng = random.Random(seed)
+        self.lock = threading.Lock()
+        n_catalog = catalog or max(100, (playlists * tracks + liked) // 2)
+        n_artists = artists or max(10, n_catalog // 8)
+        self.tracks = {}
+        catalog_ids = []
+        for i in range(n_catalog):
+            tid = make_id('track', i)
+            a = rng.randrange(n_artists)
+            self.tracks[tid] = {
+                'id': tid,
+                'uri': f'spotify:track:{tid}',
+                'type': 'track',
+                'is_local': False,
+                'name': f'Song {i % (n_catalog // 3 or 1)}',
+                'duration_ms': 180000,
+                'artists': [{'id': make_id('artist', a), 'name': f'Artist {a}'}],
+                'album': {'id': make_id('album', i // 10), 'name': f'Album {i // 10}',
+                          'images': [{'url': f'https://i.example/{i // 10}.jpg', 'height': 300, 'width': 300}]},
+            }
+            catalog_ids.append(tid)
+        self.users = {
+            USER_ID: {'id': USER_ID, 'display_name': 'Bench User', 'images': []},
+            OTHER_USER_ID: {'id': OTHER_USER_ID, 'display_name': 'Other User', 'images': []},
+        }
+        self.playlists = {}
+        self.order = []
+        for i in range(playlists):
+            self._add_playlist(f'Playlist {i}', USER_ID, rng.sample(catalog_ids, min(tracks, n_catalog)))
+        for i in range(other_playlists):
+            self._add_playlist(f'Shared {i}', OTHER_USER_ID, rng.sample(catalog_ids, min(tracks, n_catalog)))
+        self.saved = [{'added_at': '2024-01-01T00:00:00Z', 'track': tid}
+                      for tid in rng.sample(catalog_ids, min(liked, n_catalog))]
+        self.initial_queue = rng.sample(catalog_ids, min(queue, n_catalog))
+        self.queue = list(self.initial_queue)
+        self.current = rng.choice(catalog_ids)
+        self.volume = 50
+
+    def _add_playlist(self, name, owner, track_ids):
+        pid = make_id('playlist', len(self.order))
+        self.playlists[pid] = {'id': pid, 'name': name, 'owner': owner, 'items': list(track_ids), 'version': 1}
+        self.order.append(pid)
+        return pid
+
+    def create_playlist(self, owner, name):
+        with self.lock:
+            return self._add_playlist(name, owner, [])
+
+    def owned_playlists(self, user_id):
+        return [pid for pid in self.order if self.playlists[pid]['owner'] == user_id]
+
+    def reset_queue(self):
+        """Refill the player queue (reading it with save_queue consumes it)."""
+        with self.lock:
+            self.queue = list(self.initial_queue)
+
+    def track_pages(self, playlist_id):
+        return pages(len(self.playlists[playlist_id]['items']), PAGE_LIMITS['tracks'])
+
+    def page_counts(self):
+        """Return how many page reads each part of the current user's library takes.
+
+        'listing' is the playlist listing, 'playlist_tracks' every listed
+        playlist's tracks, 'owned_tracks' only those the user owns, 'liked'
+        the liked songs; 'other_*' are the same for the compared user.
+        """
+        listing = list(self.order)
+        owned = self.owned_playlists(USER_ID)
+        other = self.owned_playlists(OTHER_USER_ID)
+        return {
+            'listing': pages(len(listing), PAGE_LIMITS['playlists']),
+            'playlist_tracks': sum(self.track_pages(p) for p in listing),
+            'owned_tracks': sum(self.track_pages(p) for p in owned),
+            'liked': pages(len(self.saved), PAGE_LIMITS['saved']),
+            'liked_100': pages(len(self.saved), PAGE_LIMITS['tracks']),
+            'other_listing': pages(len(other), PAGE_LIMITS['playlists']),
+            'other_tracks': sum(self.track_pages(p) for p in other),
+        }
+
+
+def pages(n, size):
+    """Calls needed to read `n` items `size` at a time (an empty list still takes one)."""
+    return max(1, -(-n // size))
+
+
+def _paging(url, items, offset, limit, total):
+    base = url.split('?', 1)[0]
+    nxt = f'{base}?offset={offset + limit}&limit={limit}' if offset + limit < total else None
+    prev = f'{base}?offset={max(0, offset - limit)}&limit={limit}' if offset > 0 else None
+    return {'href': url, 'items': items, 'limit': limit, 'next': nxt, 'offset': offset,
+            'previous': prev, 'total': total}
+
+
+def _uri_id(uri):
+    return uri.rsplit(':', 1)[-1].rsplit('/', 1)[-1]
+
+
+class FakeSpotify:
+    """The fake API: a threaded HTTP server around a `FakeLibrary`."""
+
+    def __init__(self, library=None, host='127.0.0.1', port=0, latency_ms=0.0, jitter_ms=0.0,
+                 throttle_rate=0.0, retry_after=1, seed=0):
+        self.library = library or FakeLibrary(seed=seed)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+        self._stats_lock = threading.Lock()
+        self._counts = {}
+        self._throttled = 0
+        self._server = ThreadingHTTPServer((host, port), _handler_for(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def api_url(self):
+        return self.base_url + '/v1/'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-spotify', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self):
+        """Return {'calls': total, 'throttled': n, 'by_endpoint': {'GET /me': n, ...}}."""
+        with self._stats_lock:
+            by_endpoint = dict(sorted(self._counts.items()))
+            return {'calls': sum(by_endpoint.values()), 'throttled': self._throttled, 'by_endpoint': by_endpoint}
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._counts.clear()
+            self._throttled = 0
+
+    def _delay_and_throttle(self):
+        """Apply the injected latency; return True if this request should get a 429."""
+        with self._stats_lock:
+            jitter = self._rng.random() * self.jitter_ms if self.jitter_ms else 0.0
+            throttle = self.throttle_rate and self._rng.random() < self.throttle_rate
+            if throttle:
+                self._throttled += 1
+        if self.latency_ms or jitter:
+            time.sleep((self.latency_ms + jitter) / 1000)
+        return throttle
+
+    def _count(self, label):
+        with self._stats_lock:
+            self._counts[label] = self._counts.get(label, 0) + 1
+
+    # -- endpoints ---------------------------------------------------------
+
+    def _track(self, tid):
+        track = self.library.tracks.get(tid)
+        if track is None:
+            # e.g. the marker track save_queue queues; not in the catalog
+            track = {'id': tid, 'uri': f'spotify:track:{tid}', 'type': 'track', 'is_local': False,
+                     'name': tid, 'duration_ms': 180000, 'artists': [], 'album': {'images': []}}
+        return track
+
+    def _playlist_simple(self, pid):
+        p = self.library.playlists[pid]
+        return {'id': pid, 'name': p['name'], 'type': 'playlist', 'uri': f'spotify:playlist:{pid}',
+                'owner': {'id': p['owner'], 'display_name': self.library.users[p['owner']]['display_name']},
+                'public': True, 'collaborative': False, 'images': [],
+                'snapshot_id': f"{pid}-{p['version']}", 'tracks': {'total': len(p['items'])},
+                'external_urls': {'spotify': f'https://open.spotify.com/playlist/{pid}'}}
+
+    def _playlist_items(self, url, pid, offset, limit):
+        items = self.library.playlists[pid]['items']
+        page = [{'added_at': '2024-01-01T00:00:00Z', 'is_local': False, 'track': self._track(t)}
+                for t in items[offset:offset + limit]]
+        return _paging(url, page, offset, limit, len(items))
+
+    def _playlist_full(self, pid):
+        out = self._playlist_simple(pid)
+        out['tracks'] = self._playlist_items(f'{self.api_url}playlists/{pid}/tracks', pid, 0, PAGE_LIMITS['tracks'])
+        return out
+
+    def handle(self, method, path, query, body):
+        """Return (status, payload) for one API request."""
+        lib = self.library
+        offset = int(query.get('offset', 0))
+        url = self.api_url + path
+
+        def limit(kind):
+            return max(1, min(int(query.get('limit', PAGE_LIMITS[kind])), PAGE_LIMITS[kind]))
+
+        def owner_of(user):
+            return USER_ID if user in ('me', USER_ID) else user
+
+        if method == 'GET' and path == 'me':
+            return 200, lib.users[USER_ID]
+        if m := re.fullmatch(r'users/([^/]+)', path):
+            user = lib.users.get(m.group(1))
+            return (200, user) if user else (404, None)
+        if m := re.fullmatch(r'(?:users/([^/]+)|me)/playlists', path):
+            owner = owner_of(m.group(1) or 'me')
+            if method == 'POST':
+                pid = lib.create_playlist(owner, (body or {}).get('name') or 'New Playlist')
+                return 201, self._playlist_full(pid)
+            n = limit('playlists')
+            if owner == USER_ID:
+                # The current user's listing includes followed playlists.
+                ids = list(lib.order)
+            else:
+                ids = lib.owned_playlists(owner)
+            return 200, _paging(url, [self._playlist_simple(p) for p in ids[offset:offset + n]], offset, n, len(ids))
+        if m := re.fullmatch(r'playlists/([^/]+)', path):
+            pid = m.group(1)
+            if pid not in lib.playlists:
+                return 404, None
+            return 200, self._playlist_full(pid)
+        if m := re.fullmatch(r'playlists/([^/]+)/(?:tracks|items)', path):
+            pid = m.group(1)
+            p = lib.playlists.get(pid)
+            if p is None:
+                return 404, None
+            if method == 'GET':
+                return 200, self._playlist_items(url, pid, offset, limit('tracks'))
+            with lib.lock:
+                # spotipy sends either {"uris": [...]} or a bare list of uris
+                fields = body if isinstance(body, dict) else {}
+                if method == 'POST':
+                    uris = (body if isinstance(body, list) else fields.get('uris')) or [u for u in query.get('uris', '').split(',') if u]
+                    position = fields.get('position', query.get('position'))
+                    ids = [_uri_id(u) for u in uris if _uri_id(u) in lib.tracks]
+                    at = len(p['items']) if position is None else int(position)
+                    p['items'][at:at] = ids
+                elif method == 'PUT':
+                    uris = (body if isinstance(body, list) else fields.get('uris')) or [u for u in query.get('uris', '').split(',') if u]
+                    p['items'] = [_uri_id(u) for u in uris if _uri_id(u) in lib.tracks]
+                elif method == 'DELETE':
+                    gone = {_uri_id(t['uri'] if isinstance(t, dict) else t) for t in fields.get('tracks') or fields.get('items') or []}
+                    p['items'] = [t for t in p['items'] if t not in gone]
+                else:
+                    return 405, None
+                p['version'] += 1
+                return (201 if method == 'POST' else 200), {'snapshot_id': f"{pid}-{p['version']}"}
+        if path == 'me/tracks':
+            if method == 'GET':
+                n = limit('saved')
+                page = [{'added_at': s['added_at'], 'track': self._track(s['track'])}
+                        for s in lib.saved[offset:offset + n]]
+                return 200, _paging(url, page, offset, n, len(lib.saved))
+            ids = [i for i in (query.get('ids') or '').split(',') if i] or (body if isinstance(body, list) else (body or {}).get('ids')) or []
+            with lib.lock:
+                if method == 'PUT':
+                    have = {s['track'] for s in lib.saved}
+                    new = [{'added_at': '2024-06-01T00:00:00Z', 'track': i}
+                           for i in dict.fromkeys(ids) if i in lib.tracks and i not in have]
+                    lib.saved[:0] = new
+                elif method == 'DELETE':
+                    gone = set(ids)
+                    lib.saved = [s for s in lib.saved if s['track'] not in gone]
+            return 200, None
+        if path in ('me/player', 'me/player/currently-playing'):
+            item = self._track(lib.current) if lib.current else None
+            return 200, {'is_playing': True, 'progress_ms': 1000, 'item': item,
+                         'device': {'id': 'bench-device', 'volume_percent': lib.volume}}
+        if path == 'me/player/queue':
+            if method == 'GET':
+                return 200, {'currently_playing': self._track(lib.current),
+                             'queue': [self._track(t) for t in lib.queue]}
+            with lib.lock:
+                lib.queue.append(_uri_id(query.get('uri', '')))
+            return 204, None
+        if path == 'me/player/next':
+            with lib.lock:
+                if lib.queue:
+                    lib.current = lib.queue.pop(0)
+            return 204, None
+        if path == 'me/player/volume':
+            lib.volume = int(query.get('volume_percent', lib.volume))
+            return 204, None
+        if path in ('me/player/seek', 'me/player/play', 'me/player/pause'):
+            return 204, None
+        return 404, None
+
+
+_ID_SEGMENT = re.compile(r'^[0-9A-Za-z]{22}$')
+
+
+def endpoint_label(method, path):
+    """Return e.g. 'GET /playlists/{id}/tracks' for counting."""
+    parts = path.split('/')
+    out = ['{id}' if _ID_SEGMENT.match(p) or (i and parts[i - 1] == 'users') else p for i, p in enumerate(parts)]
+    return f"{method} /{'/'.join(out)}"
+
+
+def _handler_for(api):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, payload=None, headers=None):
+            data = b'' if payload is None else json.dumps(payload).encode()
+            self.send_response(status)
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            if data:
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            if data:
+                self.wfile.write(data)
+
+        def _dispatch(self):
+            parts = urlsplit(self.path)
+            length = int(self.headers.get('Content-Length') or 0)
+            raw = self.rfile.read(length) if length else b''
+            if parts.path.startswith('/_bench/'):
+                if parts.path == '/_bench/reset':
+                    api.reset_stats()
+                return self._send(200, api.stats())
+            if not parts.path.startswith('/v1/'):
+                return self._send(404, {'error': {'status': 404, 'message': 'Not found'}})
+            if not (self.headers.get('Authorization') or '').startswith('Bearer '):
+                return self._send(401, {'error': {'status': 401, 'message': 'No token provided'}})
+            path = parts.path[len('/v1/'):].strip('/')
+            query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+            api._count(endpoint_label(self.command, path))
+            if api._delay_and_throttle():
+                return self._send(429, {'error': {'status': 429, 'message': 'API rate limit exceeded'}},
+                                  {'Retry-After': str(api.retry_after)})
+            try:
+                body = json.loads(raw) if raw else None
+            except ValueError:
+                return self._send(400, {'error': {'status': 400, 'message': 'Invalid JSON'}})
+            status, payload = api.handle(self.command, path, query, body)
+            if status >= 400 and payload is None:
+                payload = {'error': {'status': status, 'message': 'Request failed'}}
+            self._send(status, payload)
+
+        do_GET = do_POST = do_PUT = do_DELETE = _dispatch
+
+    return Handler
+
+
+def add_library_arguments(parser):
+    """Add the synthetic library / fault injection options to `parser`."""
+    parser.add_argument('--playlists', type=int, default=20, help="current user's playlists")
+    parser.add_argument('--tracks', type=int, default=100, help='tracks per playlist')
+    parser.add_argument('--liked', type=int, default=1000, help='liked songs')
+    parser.add_argument('--other-playlists', type=int, default=5, help='playlists of the compared user')
+    parser.add_argument('--queue', type=int, default=5, help='tracks queued in the player')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='added to every response')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='random extra latency, up to this')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction of requests answered with 429')
+    parser.add_argument('--retry-after', default='1', help='Retry-After of injected 429s (seconds)')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def server_from_args(args, port=0):
+    library = FakeLibrary(playlists=args.playlists, tracks=args.tracks, liked=args.liked,
+                          other_playlists=args.other_playlists, queue=args.queue, seed=args.seed)
+    return FakeSpotify(library, port=port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                       throttle_rate=args.throttle_rate, retry_after=args.retry_after, seed=args.seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    add_library_arguments(parser)
+    args = parser.parse_args(argv)
+    api = server_from_args(args, port=args.port)
+    print(f'Fake Spotify API on {api.api_url} (user {USER_ID}, compare user {OTHER_USER_ID})', flush=True)
+    try:
+        api._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api._server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
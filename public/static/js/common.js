@@ -170,68 +170,51 @@
             });
             const text = await resp.text();
             // Prefer JSON responses for AJAX flows. If JSON contains a
-            // background task id, poll the server for progress updates and
+            // background task id, follow the job's progress stream and
             // update the percentage element in the page.
             let handled = false;
             try{
               const j = JSON.parse(text);
               if(j){
-                // If server returned a task id, poll progress endpoint.
+                // If server returned a task id, follow the job's progress.
                 if(j.task_id){
                   handled = true;
                   const taskId = j.task_id;
                   // If a simulated perc timer was running, stop it — we'll drive
-                  // the percentage from the server polling instead.
+                  // the percentage from the server's progress events instead.
                   try{
                     if(percBtn && percBtn.__percTimer){ clearInterval(percBtn.__percTimer); delete percBtn.__percTimer; }
                   }catch(e){}
-                  const poll = async ()=>{
-                    try{
-                      const r = await fetch(`/clean_progress/${taskId}`, { credentials: 'same-origin', headers: { 'X-Requested-With': 'XMLHttpRequest' }});
-                      if(!r.ok){
-                        const t = await r.text();
-                        makeToast('Progress check failed', 'error', 3000);
-                        return;
-                      }
-                      const p = await r.json();
-                      if(!p || !p.ok){
-                        makeToast(p && p.error ? p.error : 'Progress error', 'error', 3000);
-                        return;
-                      }
-                      const processed = Number(p.processed || 0);
-                      const total = Number(p.total || 0);
-                      if(percEl){
-                        let percent = 0;
-                        if(total > 0) percent = Math.floor((processed/total)*100);
-                        else if(p.status === 'running') percent = 50;
-                        else if(p.status === 'done') percent = 100;
-                        percEl.textContent = Math.min(100, Math.max(0, percent)) + '%';
-                      }
-                      if(p.status === 'done'){
-                        if(percBtn && percBtn.__percEl){
-                          const el = percBtn.__percEl;
-                          el.textContent = '100%';
-                          setTimeout(()=>{ el.remove(); delete percBtn.__percEl; delete percBtn.__percTimer; }, 700);
-                        }
-                        makeToast(p.message || 'Clean finished', 'success', 4000);
-                        return;
+                  window.UI.watchProgress(taskId, function(p){
+                    if(!p || !p.ok){
+                      makeToast(p && p.error ? p.error : 'Progress error', 'error', 3000);
+                      return;
+                    }
+                    const processed = Number(p.processed || 0);
+                    const total = Number(p.total || 0);
+                    if(percEl){
+                      let percent = 0;
+                      if(total > 0) percent = Math.floor((processed/total)*100);
+                      else if(p.status === 'running') percent = 50;
+                      else if(p.status === 'done') percent = 100;
+                      percEl.textContent = Math.min(100, Math.max(0, percent)) + '%';
+                    }
+                    if(p.status === 'done'){
+                      if(percBtn && percBtn.__percEl){
+                        const el = percBtn.__percEl;
+                        el.textContent = '100%';
+                        setTimeout(()=>{ el.remove(); delete percBtn.__percEl; delete percBtn.__percTimer; }, 700);
                       }
-                      if(p.status === 'error'){
-                        makeToast(p.message || 'Clean failed', 'error', 5000);
-                        if(percBtn && percBtn.__percEl){
-                          try{ percBtn.__percEl.remove(); delete percBtn.__percEl; delete percBtn.__percTimer; }catch(e){}
-                        }
-                        return;
+                      makeToast(p.message || 'Clean finished', 'success', 4000);
+                      return;
+                    }
+                    if(p.status === 'error' || p.status === 'cancelled'){
+                      makeToast(p.message || 'Clean failed', p.status === 'error' ? 'error' : 'info', 5000);
+                      if(percBtn && percBtn.__percEl){
+                        try{ percBtn.__percEl.remove(); delete percBtn.__percEl; delete percBtn.__percTimer; }catch(e){}
                       }
-                      // still running: poll again shortly
-                      setTimeout(poll, 900);
-                    }catch(err){
-                      console && console.error && console.error('poll progress', err);
-                      setTimeout(poll, 1500);
                     }
-                  };
-                  // start polling
-                  setTimeout(poll, 500);
+                  });
                 } else if(j.message || j.msg){
                   const m = j.message || j.msg;
                   const t = (j.ok === false) ? 'error' : 'success';
@@ -286,6 +269,50 @@
     });
   }
 
+  // Follow a background job's progress. Uses the server-sent event stream
+  // (which costs no Spotify calls) and falls back to polling
+  // /clean_progress if EventSource is unavailable or the stream drops.
+  // `onUpdate` receives each progress payload; the last one has a finished status.
+  function watchProgress(taskId, onUpdate){
+    const finished = s => s === 'done' || s === 'error' || s === 'cancelled';
+    const poll = async ()=>{
+      try{
+        const r = await fetch(`/clean_progress/${taskId}`, { credentials: 'same-origin', headers: { 'X-Requested-With': 'XMLHttpRequest' }});
+        if(!r.ok){
+          onUpdate({ ok: false, error: 'Progress check failed' });
+          return;
+        }
+        const p = await r.json();
+        onUpdate(p);
+        if(p && p.ok && !finished(p.status)) setTimeout(poll, 900);
+      }catch(err){
+        console && console.error && console.error('poll progress', err);
+        setTimeout(poll, 1500);
+      }
+    };
+    if(!window.EventSource){
+      setTimeout(poll, 500);
+      return;
+    }
+    let done = false;
+    const es = new EventSource(`/jobs/${taskId}/events`);
+    es.addEventListener('progress', function(e){
+      let p = null;
+      try{ p = JSON.parse(e.data); }catch(err){ return; }
+      onUpdate(p);
+      if(!p || !p.ok || finished(p.status)){
+        done = true;
+        es.close();
+      }
+    });
+    es.onerror = function(){
+      es.close();
+      if(done) return;
+      done = true;
+      setTimeout(poll, 500);
+    };
+  }
+
   function initFlashes(){
     const list = document.getElementById('flashes');
     if(list){
@@ -323,6 +350,7 @@
   window.UI.clearButtonWorking = clearButtonWorking;
   window.UI.setFormWorking = setFormWorking;
   window.UI.clearFormWorking = clearFormWorking;
+  window.UI.watchProgress = watchProgress;
 
   document.addEventListener('DOMContentLoaded', function(){
     initFlashes();
@@ -349,35 +349,27 @@
                         const taskId = j.task_id;
                         // stop the simulated percentage timer if present
                         try{ if(percBtn && percBtn.__percTimer){ clearInterval(percBtn.__percTimer); delete percBtn.__percTimer; } }catch(e){}
-                        const poll = async ()=>{
-                          try{
-                            const r = await fetch(`/clean_progress/${taskId}`, { credentials: 'same-origin', headers: { 'X-Requested-With': 'XMLHttpRequest' }});
-                            if(!r.ok){ window.UI && window.UI.makeToast && window.UI.makeToast('Progress check failed', 'error', 3000); return; }
-                            const p = await r.json();
-                            if(!p || !p.ok){ window.UI && window.UI.makeToast && window.UI.makeToast(p && p.error ? p.error : 'Progress error', 'error', 3000); return; }
-                            const processed = Number(p.processed || 0);
-                            const total = Number(p.total || 0);
-                            if(percEl){
-                              let percent = 0;
-                              if(total > 0) percent = Math.floor((processed/total)*100);
-                              else if(p.status === 'running') percent = 50;
-                              else if(p.status === 'done') percent = 100;
-                              percEl.textContent = Math.min(100, Math.max(0, percent)) + '%';
-                            }
-                            if(p.status === 'done'){
-                              if(percBtn && percBtn.__percEl){ const el = percBtn.__percEl; el.textContent = '100%'; setTimeout(()=>{ el.remove(); delete percBtn.__percEl; delete percBtn.__percTimer; }, 700); }
-                              window.UI && window.UI.makeToast && window.UI.makeToast(p.message || 'Clean finished', 'success', 4000);
-                              return;
-                            }
-                            if(p.status === 'error'){
-                              window.UI && window.UI.makeToast && window.UI.makeToast(p.message || 'Clean failed', 'error', 5000);
-                              if(percBtn && percBtn.__percEl){ try{ percBtn.__percEl.remove(); delete percBtn.__percEl; delete percBtn.__percTimer; }catch(e){} }
-                              return;
-                            }
-                            setTimeout(poll, 900);
-                          }catch(err){ console && console.error && console.error('poll progress', err); setTimeout(poll, 1500); }
-                        };
-                        setTimeout(poll, 500);
+                        window.UI.watchProgress(taskId, function(p){
+                          if(!p || !p.ok){ window.UI && window.UI.makeToast && window.UI.makeToast(p && p.error ? p.error : 'Progress error', 'error', 3000); return; }
+                          const processed = Number(p.processed || 0);
+                          const total = Number(p.total || 0);
+                          if(percEl){
+                            let percent = 0;
+                            if(total > 0) percent = Math.floor((processed/total)*100);
+                            else if(p.status === 'running') percent = 50;
+                            else if(p.status === 'done') percent = 100;
+                            percEl.textContent = Math.min(100, Math.max(0, percent)) + '%';
+                          }
+                          if(p.status === 'done'){
+                            if(percBtn && percBtn.__percEl){ const el = percBtn.__percEl; el.textContent = '100%'; setTimeout(()=>{ el.remove(); delete percBtn.__percEl; delete percBtn.__percTimer; }, 700); }
+                            window.UI && window.UI.makeToast && window.UI.makeToast(p.message || 'Clean finished', 'success', 4000);
+                            return;
+                          }
+                          if(p.status === 'error' || p.status === 'cancelled'){
+                            window.UI && window.UI.makeToast && window.UI.makeToast(p.message || 'Clean failed', p.status === 'error' ? 'error' : 'info', 5000);
+                            if(percBtn && percBtn.__percEl){ try{ percBtn.__percEl.remove(); delete percBtn.__percEl; delete percBtn.__percTimer; }catch(e){} }
+                          }
+                        });
                       } else if(j.message || j.msg){
                         const m = j.message || j.msg;
                         const t = (j.ok === false) ? 'error' : 'success';
@@ -471,12 +463,13 @@
           window.UI && window.UI.makeToast && window.UI.makeToast(msg, 'error', 2500);
           return;
         }
-        // Keep the same button element and label. Set it to a ready state.
+        // The comparison runs in the background and the result page fills in
+        // as playlists finish, so it can be opened right away.
         btn.textContent = 'View result';
         btn.dataset.resultUrl = data.url;
         btn.classList.add('ready');
         // add a hint toast
-        window.UI && window.UI.makeToast && window.UI.makeToast('Comparison ready — click to view', 'success', 2200);
+        window.UI && window.UI.makeToast && window.UI.makeToast('Comparison started — click to view', 'success', 2200);
       }catch(err){
         console && console.error && console.error('compare fetch error', err);
         window.UI && window.UI.makeToast && window.UI.makeToast('Network error', 'error', 1800);
@@ -0,0 +1,72 @@
+"""bench/analyze_logs.py: streaming both export formats, route and error grouping."""
+import json
+
+import pytest
+
+from bench.analyze_logs import error_signature, iter_records, route_of
+
+
+RECORDS = [
+    {'requestId': f'r{n}', 'requestPath': f'/api/compare/{n}', 'message': 'x' * (n * 7), 'nested': {'a': [n, ', ]']}}
+    for n in range(12)
+]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 16, 1 << 16])
+def test_json_array_split_across_chunks(tmp_path, chunk_size):
+    path = tmp_path / 'logs_result.json'
+    path.write_text('  [\n' + ',\n  '.join(json.dumps(r) for r in RECORDS) + '\n]\n', encoding='utf-8')
+    assert list(iter_records(str(path), chunk_size=chunk_size)) == RECORDS
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1 << 16])
+def test_json_lines(tmp_path, chunk_size):
+    path = tmp_path / 'requests.jsonl'
+    # blank lines are skipped and the last record has no trailing newline
+    path.write_text('\n'.join(json.dumps(r) for r in RECORDS[:6]) + '\n\n' +
+                    '\n'.join(json.dumps(r) for r in RECORDS[6:]), encoding='utf-8')
+    assert list(iter_records(str(path), chunk_size=chunk_size)) == RECORDS
+
+
+def test_empty_array(tmp_path):
+    path = tmp_path / 'logs_result.json'
+    path.write_text('[]', encoding='utf-8')
+    assert list(iter_records(str(path), chunk_size=1)) == []
+
+
+def test_route_of_collapses_ids():
+    host = 'playlist-manager.vercel.app'
+    assert route_of({'requestPath': f'{host}/api/compare/0123456789abcdefABCDEF/tracks?mode=all',
+                     'host': host}) == '/api/compare/<id>/tracks'
+    assert route_of({'requestPath': 'other.vercel.app/jobs/123e4567-e89b-12d3-a456-426614174000/events'}) \
+        == '/jobs/<id>/events'
+    assert route_of({'requestPath': '/playlist/42/'}) == '/playlist/<id>'
+    # ordinary words are kept, even long ones
+    assert route_of({'requestPath': '/liked_songs_snapshot'}) == '/liked_songs_snapshot'
+    assert route_of({}) == '/'
+
+
+def _traceback(exc, line=10, path='/var/task/app/main.py', func='compare'):
+    return ('Traceback (most recent call last):\n'
+            f'  File "{path}", line {line}, in {func}\n'
+            '    do_it()\n'
+            '  File "/var/task/_vendor/spotipy/client.py", line 245, in _internal_call\n'
+            '    raise SpotifyException()\n'
+            f'{exc}\n')
+
+
+def test_error_signature_clusters_tracebacks():
+    first = error_signature(_traceback('KeyError: 17', line=10))
+    second = error_signature(_traceback('KeyError: 4093', line=88))
+    assert first == second == 'KeyError: _ @ main.py:compare'
+    # vendored frames are skipped for the innermost application frame
+    assert error_signature(_traceback('ValueError: bad', func='merge')) == 'ValueError: bad @ main.py:merge'
+    assert error_signature(_traceback('KeyError: 17', path='/var/task/app/jobs.py')) != first
+    assert error_signature('requests.exceptions.ConnectionError: port 443 failed after 3 retries') \
+        == 'requests.exceptions.ConnectionError: port _ failed after _ retries'
+
+
+def test_messages_without_errors_have_no_signature():
+    assert error_signature(None) is None
+    assert error_signature('cold start: 812 ms') is None
+    assert error_signature('spotipy.exceptions.SpotifyException: http status: 429') is None
@@ -0,0 +1,78 @@
+"""Bridging the async backend to job threads: iter_async and acquire_lock."""
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+from app.async_client import AsyncSpotifyClient, acquire_lock, iter_async, submit_async
+
+
+class StubClient(AsyncSpotifyClient):
+    """Playlist `p<n>` takes n * 50ms to download; `bad` fails."""
+
+    def __init__(self):
+        super().__init__('token', user_id='me')
+        self.cancelled = []
+
+    async def get_library_snapshot(self, exclude_ids=()):
+        return {'saved': [], 'playlists': []}
+
+    async def get_playlist_tracks_meta(self, playlist_id):
+        if playlist_id == 'bad':
+            raise RuntimeError('boom')
+        try:
+            await asyncio.sleep(int(playlist_id[1:]) * 0.05)
+        except asyncio.CancelledError:
+            self.cancelled.append(playlist_id)
+            raise
+        return [playlist_id]
+
+
+def test_sources_arrive_in_order_as_each_finishes():
+    sources = iter_async(StubClient().iter_compare_sources(['p1', 'bad', 'p2', 'p10']))
+    began = time.time()
+    assert next(sources) == {'saved': [], 'playlists': []}
+    assert next(sources) == ('p1', ['p1'])
+    # the first playlist is handed over long before the slowest one is done
+    assert time.time() - began < 0.3
+    assert list(sources) == [('bad', None), ('p2', ['p2']), ('p10', ['p10'])]
+
+
+def test_closing_cancels_the_remaining_downloads():
+    client = StubClient()
+    sources = iter_async(client.iter_compare_sources(['p1', 'p20', 'p40']))
+    next(sources)
+    assert next(sources) == ('p1', ['p1'])
+    sources.close()
+    deadline = time.time() + 1
+    while len(client.cancelled) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert sorted(client.cancelled) == ['p20', 'p40']
+
+
+def test_cancelled_lock_waiter_does_not_keep_the_lock():
+    lock = threading.Lock()
+    lock.acquire()
+    waiter = submit_async(acquire_lock(lock))
+    time.sleep(0.05)
+    waiter.cancel()
+    with pytest.raises(concurrent.futures.CancelledError):
+        waiter.result(1)
+    lock.release()
+    time.sleep(0.05)
+    assert lock.acquire(blocking=False)
+    lock.release()
+
+
+def test_lock_is_acquired_once_released():
+    lock = threading.Lock()
+    lock.acquire()
+    waiter = submit_async(acquire_lock(lock))
+    time.sleep(0.05)
+    assert not waiter.done()
+    lock.release()
+    waiter.result(1)
+    assert lock.locked()
+    lock.release()
@@ -0,0 +1,32 @@
+"""Run the end-to-end benchmark on a small library and hold every scenario to
+its API-call budget (see bench/e2e.py). Each backend runs in its own process
+because the app reads SPOTIFY_API_URL at import time.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LIBRARY = ['--playlists', '6', '--tracks', '150', '--liked', '120', '--other-playlists', '2', '--queue', '3']
+
+
+@pytest.mark.parametrize('backend', ['sync', 'async'])
+def test_scenarios_stay_within_call_budgets(backend, tmp_path):
+    output = tmp_path / 'report.json'
+    proc = subprocess.run(
+        [sys.executable, os.path.join(ROOT, 'bench', 'e2e.py'), *LIBRARY, '--runs', '2',
+         '--backend', backend, '--output', str(output)],
+        cwd=ROOT, capture_output=True, text=True, timeout=600,
+    )
+    assert output.exists(), proc.stderr
+    report = json.loads(output.read_text())
+    failures = {
+        name: scenario.get('error') or [r.get('over_budget') or r.get('error') for r in scenario['runs'] if not r['ok']]
+        for name, scenario in report['scenarios'].items() if not scenario['ok']
+    }
+    assert not failures
+    assert proc.returncode == 0
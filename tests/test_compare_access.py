@@ -0,0 +1,35 @@
+"""A compare result is only readable by the user who started it."""
+import time
+
+import pytest
+
+from app.main import GENERATED, app
+
+
+RESULT = {
+    'id': 'gid-1', 'user': 'someone', 'count': 1, 'profile': None, 'status': 'done',
+    'processed': 1, 'total': 1, 'owner': 'alice',
+    'tracks': [['t1', 'Song', 'Artist', None]],
+    'playlists': [{'id': 'pl1', 'name': 'Mix', 'tracks_count': 1, 'all_refs': [0], 'unique_refs': [0], 'similar_refs': []}],
+}
+
+
+@pytest.fixture
+def signed_in():
+    GENERATED.put('gid-1', RESULT, owner='alice')
+    web = app.test_client()
+
+    def as_user(user_id):
+        with web.session_transaction() as s:
+            s['token_info'] = {'access_token': 'token', 'expires_at': int(time.time()) + 3600}
+            s['spotify_user_id'] = user_id
+        return web
+
+    yield as_user
+    GENERATED.delete('gid-1')
+
+
+@pytest.mark.parametrize('url', ['/api/compare/gid-1', '/api/compare/gid-1/pl1/tracks', '/compare/gid-1/partial'])
+def test_result_is_hidden_from_other_users(signed_in, url):
+    assert signed_in('alice').get(url).status_code == 200
+    assert signed_in('mallory').get(url).status_code == 404
@@ -0,0 +1,58 @@
+"""Conditional responses (_etag / _conditional) through a cacheable route."""
+import time
+
+import pytest
+
+from app import main
+from app.main import GENERATED, app
+
+
+URL = '/api/compare/etag-gid/pl1/tracks?mode=all'
+
+
+@pytest.fixture
+def web():
+    GENERATED.put('etag-gid', {
+        'id': 'etag-gid', 'user': 'someone', 'status': 'done', 'owner': 'alice',
+        'tracks': [['t1', 'Song', 'Artist', None]],
+        'playlists': [{'id': 'pl1', 'name': 'Mix', 'all_refs': [0], 'unique_refs': [0], 'similar_refs': []}],
+    }, owner='alice')
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s['token_info'] = {'access_token': 'token', 'expires_at': int(time.time()) + 3600}
+        s['spotify_user_id'] = 'alice'
+    yield client
+    GENERATED.delete('etag-gid')
+
+
+def test_matching_if_none_match_answers_304(web):
+    first = web.get(URL)
+    assert first.status_code == 200 and first.json['items'][0]['id'] == 't1'
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'].startswith('private, max-age=')
+    again = web.get(URL, headers={'If-None-Match': etag})
+    assert again.status_code == 304 and again.data == b''
+    assert again.headers['ETag'] == etag
+    assert web.get(URL, headers={'If-None-Match': '"something-else"'}).status_code == 200
+
+
+def test_new_source_version_changes_the_etag(web, monkeypatch):
+    etag = web.get(URL).headers['ETag']
+    monkeypatch.setattr(main, 'ETAG_VERSION', main.ETAG_VERSION + '-next')
+    response = web.get(URL, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_source_version_is_stable():
+    assert main._source_version() == main._source_version()
+
+
+def test_pending_flashes_are_never_stored(web):
+    etag = web.get(URL).headers['ETag']
+    with web.session_transaction() as s:
+        s['_flashes'] = [('info', 'Saved')]
+    response = web.get(URL, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-store'
+    assert 'ETag' not in response.headers
@@ -0,0 +1,190 @@
+"""The SQLite job store, the job queue, and the cancel / event-stream routes."""
+import json
+import threading
+import time
+
+import pytest
+
+from app import jobs, main
+from app.jobs import JobQueue, JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(path=str(tmp_path / 'jobs.sqlite3'))
+
+
+def _wait(predicate, timeout=2):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_queued_job_outlives_job_stale_while_it_waits(store, monkeypatch):
+    monkeypatch.setattr(jobs, 'JOB_STALE', 0.05)
+    release, ran = threading.Event(), []
+    q = JobQueue(store=store, workers=1)
+    q.register('block', lambda job: release.wait(5) and {})
+    q.register('work', lambda job: ran.append(job.id) or {})
+    blocker = q.submit('block')
+    waiting = q.submit('work')
+    time.sleep(0.1)
+    q.submit('work')  # purges while `waiting` is still queued behind `blocker`
+    assert q.get(waiting)['status'] == 'queued'
+    release.set()
+    assert _wait(lambda: q.get(waiting)['status'] == 'done')
+    assert waiting in ran and q.get(blocker)['status'] == 'done'
+
+
+def test_interrupted_job_is_not_restarted(store, monkeypatch):
+    monkeypatch.setattr(jobs, 'JOB_STALE', 0.05)
+    store.create('orphan', 'work', 'me')
+    time.sleep(0.1)
+    store.purge()
+    assert store.get('orphan')['status'] == 'error'
+    assert store.get('orphan')['message'] == 'Interrupted'
+    assert not store.start('orphan')
+    assert store.get('orphan')['status'] == 'error'
+
+
+def test_store_is_shared_through_the_sqlite_file(store):
+    store.create('j1', 'merge', 'me', data={'name': 'Mix'})
+    store.update('j1', status='running', processed=2, total=5, data={'removed': 1})
+    other = JobStore(path=store.path)  # e.g. another worker process
+    job = other.get('j1')
+    assert (job['status'], job['processed'], job['total'], job['owner']) == ('running', 2, 5, 'me')
+    assert job['data'] == {'name': 'Mix', 'removed': 1}
+    assert other.request_cancel('j1') and store.is_cancelled('j1')
+    store.update('j1', status='cancelled')
+    assert not store.request_cancel('j1')
+
+
+def test_finished_jobs_expire_after_job_ttl(store, monkeypatch):
+    store.create('old', 'merge', 'me')
+    store.update('old', status='done')
+    store.create('new', 'merge', 'me')
+    monkeypatch.setattr(jobs, 'JOB_TTL', -1)
+    store.purge(live=['new'])
+    assert store.get('old') is None
+    assert store.get('new')['status'] == 'queued'
+
+
+def test_queue_records_results_failures_and_cancellation(store):
+    q = JobQueue(store=store, workers=1)
+    started, release = threading.Event(), threading.Event()
+
+    def slow(job):
+        started.set()
+        release.wait(5)
+        job.check_cancelled()
+        return {'message': 'never'}
+
+    q.register('ok', lambda job: {'message': 'All good', 'count': job.params['n']})
+    q.register('fail', lambda job: 1 / 0)
+    q.register('slow', slow)
+    done = q.submit('ok', {'n': 3})
+    failed = q.submit('fail')
+    running = q.submit('slow')
+    assert started.wait(2)
+    assert q.cancel(running)
+    release.set()
+    assert _wait(lambda: q.get(running)['status'] == 'cancelled')
+    assert q.get(done)['status'] == 'done' and q.get(done)['message'] == 'All good'
+    assert q.get(done)['data'] == {'count': 3}
+    assert q.get(failed)['status'] == 'error' and 'division' in q.get(failed)['message']
+    assert not q.cancel(done)
+    with pytest.raises(ValueError):
+        q.submit('unknown')
+
+
+class FakeClock:
+    """Stands in for main.time so the event stream's cap runs instantly."""
+
+    def __init__(self):
+        self.now = time.time()
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def web(store, monkeypatch):
+    q = JobQueue(store=store, workers=1)
+    monkeypatch.setattr(main, 'JOBS', q)
+    client = main.app.test_client()
+
+    def sign_in(user_id):
+        with client.session_transaction() as s:
+            s['token_info'] = {'access_token': 'token', 'expires_at': int(time.time()) + 3600}
+            s['spotify_user_id'] = user_id
+            s['current_user'] = {'profile': {'id': user_id, 'display_name': user_id, 'images': []}, 'at': time.time()}
+        return client
+
+    return q, sign_in
+
+
+def _events(response):
+    return [json.loads(line[len('data: '):]) for line in response.get_data(as_text=True).splitlines()
+            if line.startswith('data: ')]
+
+
+def test_cancel_job_route(web):
+    q, sign_in = web
+    q.store.create('mine', 'merge', 'alice')
+    q.store.create('theirs', 'merge', 'bob')
+    q.store.create('finished', 'merge', 'alice')
+    q.store.update('finished', status='done')
+    client = sign_in('alice')
+    assert client.post('/jobs/theirs/cancel').status_code == 404
+    assert client.post('/jobs/finished/cancel').status_code == 409
+    response = client.post('/jobs/mine/cancel')
+    assert response.status_code == 200 and response.json == {'ok': True, 'task_id': 'mine'}
+    assert q.store.is_cancelled('mine')
+
+
+def test_event_stream_ends_with_the_terminal_event(web, monkeypatch):
+    q, sign_in = web
+    clock = FakeClock()
+    monkeypatch.setattr(main, 'time', clock)
+    q.store.create('job', 'merge', 'alice')
+    q.store.update('job', status='running', processed=1, total=2)
+    real_get = q.store.get
+
+    def get(job_id):
+        # the job finishes a few seconds into the stream
+        if clock.now - start > 3:
+            q.store.update(job_id, status='done', processed=2, message='Finished')
+        return real_get(job_id)
+
+    monkeypatch.setattr(q.store, 'get', get)
+    start = clock.now
+    response = sign_in('alice').get('/jobs/job/events')
+    assert response.mimetype == 'text/event-stream'
+    events = _events(response)
+    assert [e['status'] for e in events] == ['running', 'done']
+    assert events[-1]['processed'] == 2 and events[-1]['message'] == 'Finished'
+
+
+def test_event_stream_is_capped(web, monkeypatch):
+    q, sign_in = web
+    clock = FakeClock()
+    monkeypatch.setattr(main, 'time', clock)
+    q.store.create('stuck', 'merge', 'alice')
+    q.store.update('stuck', status='running')
+    start = clock.now
+    response = sign_in('alice').get('/jobs/stuck/events')
+    body = response.get_data(as_text=True)
+    assert main.SSE_MAX_SECONDS == 20
+    assert 20 <= clock.now - start <= 20 + 2 * main.SSE_POLL_INTERVAL
+    assert [e['status'] for e in _events(response)] == ['running']
+    assert ': keep-alive' in body
+
+
+def test_event_stream_requires_the_owner(web):
+    q, sign_in = web
+    q.store.create('job', 'merge', 'bob')
+    assert sign_in('alice').get('/jobs/job/events').status_code == 404
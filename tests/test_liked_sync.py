@@ -0,0 +1,108 @@
+"""Watermark sync of liked songs against a fake saved-tracks endpoint."""
+import pytest
+
+from app import liked_sync
+from app.liked_sync import sync_saved_tracks
+
+
+class FakeLiked:
+    """`current_user_saved_tracks`, newest first, over a mutable list of liked ids."""
+
+    def __init__(self, ids):
+        # (track id, added_at); the stamps only need to be unique
+        self.liked = [(i, f'old-{n}') for n, i in enumerate(ids)]
+        self.likes = 0
+        self.calls = 0
+
+    def like(self, track_id):
+        self.likes += 1
+        self.liked.insert(0, (track_id, f'new-{self.likes}'))
+
+    def unlike(self, track_id):
+        self.liked = [(i, a) for i, a in self.liked if i != track_id]
+
+    def current_user_saved_tracks(self, limit=20, offset=0):
+        self.calls += 1
+        items = [{'added_at': a, 'track': {'id': i, 'name': f'Song {i}', 'artists': [{'name': 'A'}], 'album': {}}}
+                 for i, a in self.liked[offset:offset + limit]]
+        more = offset + limit < len(self.liked)
+        return {'items': items, 'total': len(self.liked), 'limit': limit, 'offset': offset,
+                'next': 'next' if more else None}
+
+    def next(self, page):
+        return self.current_user_saved_tracks(page['limit'], page['offset'] + page['limit'])
+
+
+class MemoryTracks:
+    def __init__(self):
+        self.saved = {}
+
+    def get_saved(self, user_id):
+        return self.saved.get(user_id)
+
+    def put_saved(self, user_id, state):
+        self.saved[user_id] = state
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch):
+    monkeypatch.setattr(liked_sync, 'TRACKS', MemoryTracks())
+    monkeypatch.setattr(liked_sync, '_STATE', type(liked_sync._STATE)())
+
+
+def _ids(tracks):
+    return [t.id for t in tracks]
+
+
+def _synced(ids):
+    sp = FakeLiked(ids)
+    assert _ids(sync_saved_tracks(sp, 'me')) == ids
+    sp.calls = 0
+    return sp
+
+
+def test_unchanged_library_costs_one_call():
+    sp = _synced([f't{i}' for i in range(120)])
+    assert _ids(sync_saved_tracks(sp, 'me')) == [f't{i}' for i in range(120)]
+    assert sp.calls == 1
+
+
+def test_new_likes_stop_at_the_watermark():
+    ids = [f't{i}' for i in range(120)]
+    sp = _synced(ids)
+    for n in range(60):
+        sp.like(f'new{n}')
+    assert _ids(sync_saved_tracks(sp, 'me')) == [f'new{n}' for n in reversed(range(60))] + ids
+    # 60 new likes span two pages; the second one reaches a known item
+    assert sp.calls == 2
+
+
+def test_unlike_triggers_a_full_reconcile():
+    ids = [f't{i}' for i in range(120)]
+    sp = _synced(ids)
+    sp.unlike('t70')
+    assert _ids(sync_saved_tracks(sp, 'me')) == [i for i in ids if i != 't70']
+    assert sp.calls == 1 + 3  # the watermark page, then every page
+
+
+def test_like_plus_unlike_is_caught_by_the_count():
+    ids = [f't{i}' for i in range(120)]
+    sp = _synced(ids)
+    sp.like('fresh')
+    sp.unlike('t100')  # the total is unchanged, but one more than expected is new
+    assert _ids(sync_saved_tracks(sp, 'me')) == ['fresh'] + [i for i in ids if i != 't100']
+
+
+def test_unliking_everything_known_runs_a_full_sync():
+    sp = _synced(['a', 'b'])
+    sp.unlike('a')
+    sp.unlike('b')
+    sp.like('c')
+    assert _ids(sync_saved_tracks(sp, 'me')) == ['c']
+
+
+def test_full_sync_interval_forces_a_reconcile(monkeypatch):
+    sp = _synced([f't{i}' for i in range(120)])
+    monkeypatch.setattr(liked_sync, 'FULL_SYNC_INTERVAL', -1)
+    sync_saved_tracks(sp, 'me')
+    assert sp.calls == 3
@@ -0,0 +1,92 @@
+"""LibraryIndex and find_duplicates against the Counter/set rules they replaced.
+
+The baselines below are the pre-index code from `compare_fetch` and the CLI
+`Cleaner` (clean, merge and duplicate check), run on randomized track lists
+drawn from small alphabets so that titles and (artist, title) pairs collide.
+"""
+import random
+from collections import Counter
+
+from app.matching import LibraryIndex, find_duplicates
+
+
+ARTISTS = ['', 'A', 'B', 'C']
+TITLES = ['x', 'y', 'z', 'w', 'v']
+
+
+def _rows(rnd, n, titles=TITLES):
+    return [(rnd.choice(ARTISTS), rnd.choice(titles)) for _ in range(n)]
+
+
+def baseline_saved(candidate, library_rows):
+    """compare_fetch / Cleaner.clean_out_playlist: which candidate rows count as saved."""
+    t_counts_pl = Counter(t for _, t in candidate if t)
+    t_counts_al = Counter(t for _, t in library_rows if t)
+    potential_saved = set(t_counts_pl) & set(t_counts_al)
+    seen = {(a, t) for a, t in library_rows if t in potential_saved}
+    flags = []
+    for a, t in candidate:
+        if t in potential_saved and (a, t) in seen:
+            flags.append(True)
+        else:
+            flags.append(False)
+            seen.add((a, t))
+    return flags
+
+
+def baseline_duplicates(rows):
+    """Cleaner.check_playlist_for_duplicates."""
+    dupes, seen, t_counts = [], set(), Counter(t for _, t in rows)
+    for i, (a, t) in enumerate(rows):
+        if t_counts[t] > 1:
+            if (a, t) not in seen:
+                seen.add((a, t))
+            else:
+                dupes.append(i)
+    return dupes
+
+
+def baseline_merge(rows):
+    """Cleaner.merge_playlists: indexes of the rows kept in the merged playlist."""
+    title_counts = Counter(t for _, t in rows)
+    uniques, seen = [], set()
+    for i, (a, t) in enumerate(rows):
+        if title_counts[t] == 1 or (a, t) not in seen:
+            uniques.append(i)
+            seen.add((a, t))
+    return uniques
+
+
+def test_classify_matches_the_counter_rule():
+    rnd = random.Random(10)
+    for _ in range(2000):
+        # empty titles (local files) are never matched, as compare_fetch did
+        sources = {f's{n}': _rows(rnd, rnd.randint(0, 12), TITLES + ['']) for n in range(rnd.randint(0, 4))}
+        candidate = _rows(rnd, rnd.randint(0, 15), TITLES + [''])
+        index = LibraryIndex()
+        for sid, rows in sources.items():
+            index.add_source(sid, rows)
+        exclude = tuple(rnd.sample(sorted(sources), rnd.randint(0, len(sources))))
+        library_rows = [r for sid, rows in sources.items() if sid not in exclude for r in rows]
+        assert index.classify(candidate, exclude=exclude) == baseline_saved(candidate, library_rows)
+
+
+def test_replacing_a_source_matches_a_fresh_index():
+    rnd = random.Random(11)
+    for _ in range(500):
+        index = LibraryIndex()
+        index.add_source('a', _rows(rnd, 10))
+        other, new_rows = _rows(rnd, 10), _rows(rnd, 10)
+        index.add_source('b', other)
+        index.add_source('a', new_rows)
+        candidate = _rows(rnd, 12)
+        assert index.classify(candidate) == baseline_saved(candidate, new_rows + other)
+
+
+def test_find_duplicates_matches_the_duplicate_check_and_merge():
+    rnd = random.Random(12)
+    for _ in range(2000):
+        rows = _rows(rnd, rnd.randint(0, 20))
+        dupes = find_duplicates(rows)
+        assert dupes == baseline_duplicates(rows)
+        assert [i for i in range(len(rows)) if i not in set(dupes)] == baseline_merge(rows)
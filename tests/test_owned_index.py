@@ -0,0 +1,95 @@
+"""OwnedIndex: pruning, snapshot-driven refresh, exclusion and persistence."""
+import pytest
+
+from app import owned_index
+from app.owned_index import LIKED, OwnedIndex, get_owned_index, ids_version, save_owned_index
+from app.tracks import Track
+
+
+def _tracks(*ids):
+    return [Track(i, f'Song {i}', 'A') for i in ids]
+
+
+def _listing(**snapshots):
+    return [{'id': pid, 'snapshot_id': snap} for pid, snap in snapshots.items()]
+
+
+def _indexed():
+    index = OwnedIndex()
+    index.refresh([('p1', _tracks('a', 'b')), ('p2', _tracks('b', 'c'))],
+                  {'p1': 's1', 'p2': 's2'}.get, saved_ids=['d'])
+    return index
+
+
+def test_owned_honours_exclusions():
+    index = _indexed()
+    assert index.owned('b') and index.owned('d')
+    assert index.owned('b', exclude={'p1'})
+    assert not index.owned('a', exclude={'p1'})
+    assert not index.owned('b', exclude={'p1', 'p2'})
+    assert not index.owned('zzz')
+
+
+def test_prune_drops_playlists_no_longer_listed():
+    index = _indexed()
+    # p2 was deleted or unfollowed; liked songs are never pruned
+    changed, stale = index.prune(_listing(p1='s1'))
+    assert changed and stale == []
+    assert set(index.sources) == {'p1', LIKED}
+    assert not index.owned('c')
+    assert index.owned('b') and index.owned('d')
+
+
+def test_prune_reports_changed_and_unversioned_snapshots():
+    index = _indexed()
+    changed, stale = index.prune(_listing(p1='s1', p2='s2-new', p3='s3') + [{'id': 'p4', 'snapshot_id': None}])
+    assert not changed
+    assert stale == ['p2', 'p3', 'p4']
+
+
+def test_refresh_reindexes_changed_sources_only():
+    index = _indexed()
+    assert index.prune(_listing(p1='s1', p2='s2-new')) == (False, ['p2'])
+    assert index.refresh([('p2', _tracks('e'))], {'p2': 's2-new'}.get, saved_ids=['d'])
+    assert index.version('p2') == 's2-new'
+    assert not index.owned('c') and index.owned('e') and index.owned('b')
+    # liked songs with the same ids are not a change
+    assert not index.refresh([], {}.get, saved_ids=['d'])
+    assert index.refresh([], {}.get, saved_ids=['d', 'f'])
+    assert index.version(LIKED) == ids_version(['d', 'f'])
+
+
+def test_failed_reads_keep_the_previous_contents():
+    index = _indexed()
+    assert not index.refresh([('p1', None)], {'p1': 's1-new'}.get, saved_ids=None)
+    assert index.version('p1') == 's1' and index.owned('a') and index.owned('d')
+
+
+class MemoryTracks:
+    def __init__(self):
+        self.owned = {}
+
+    def get_owned(self, user_id):
+        return self.owned.get(user_id)
+
+    def put_owned(self, user_id, state):
+        self.owned[user_id] = state
+
+
+@pytest.fixture
+def store(monkeypatch):
+    tracks = MemoryTracks()
+    monkeypatch.setattr(owned_index, 'TRACKS', tracks)
+    monkeypatch.setattr(owned_index, '_INDEXES', type(owned_index._INDEXES)())
+    return tracks
+
+
+def test_index_survives_a_restart(store, monkeypatch):
+    index = get_owned_index('me')
+    assert get_owned_index('me') is index
+    index.refresh([('p1', _tracks('a'))], {'p1': 's1'}.get, saved_ids=['d'])
+    save_owned_index('me', index)
+    monkeypatch.setattr(owned_index, '_INDEXES', type(owned_index._INDEXES)())
+    restored = get_owned_index('me')
+    assert restored is not index
+    assert restored.sources == index.sources and restored.owners == index.owners
@@ -0,0 +1,91 @@
+"""iter_pages: ordering, the bounded window, `first=` and the serial fallback."""
+import random
+import threading
+import time
+
+from app.pagination import fetch_items, iter_items, iter_pages
+
+
+class Endpoint:
+    """A paginated endpoint over `n` items that answers in random order."""
+
+    def __init__(self, n, report_total=True, jitter=0.005):
+        self.n = n
+        self.report_total = report_total
+        self.jitter = jitter
+        self.offsets = []
+        self.in_flight = self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def page(self, offset, limit=10):
+        items = list(range(offset, min(offset + limit, self.n)))
+        nxt = offset + limit if offset + limit < self.n else None
+        page = {'items': items, 'limit': limit, 'offset': offset, 'next': nxt}
+        if self.report_total:
+            page['total'] = self.n
+        return page
+
+    def fetch(self, offset):
+        with self._lock:
+            self.offsets.append(offset)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(random.uniform(0, self.jitter))
+        with self._lock:
+            self.in_flight -= 1
+        return self.page(offset)
+
+    def next_page(self, page):
+        return self.fetch(page['next']) if page.get('next') is not None else None
+
+
+def test_pages_arrive_in_offset_order_with_a_wide_window():
+    api = Endpoint(237)
+    pages = list(iter_pages(api.fetch, 10, max_workers=6))
+    assert [p['offset'] for p in pages] == list(range(0, 237, 10))
+    assert fetch_items(api.fetch, 10, max_workers=6) == list(range(237))
+    assert api.max_in_flight > 1
+
+
+def test_in_flight_pages_stay_within_the_window():
+    api = Endpoint(1000)
+    pages = iter_pages(api.fetch, 10, max_workers=3)
+    next(pages)
+    next(pages)
+    time.sleep(0.1)
+    # the first page, plus at most 2 * workers queued ahead of the consumer
+    assert len(api.offsets) <= 1 + 1 + 2 * 3
+    assert len(list(pages)) == 98
+
+
+def test_first_page_is_not_fetched_again():
+    api = Endpoint(45)
+    first = api.page(0)
+    assert list(iter_items(api.fetch, 10, first=first)) == list(range(45))
+    assert 0 not in api.offsets
+
+
+def test_embedded_first_page_with_its_own_limit():
+    # e.g. the 100-item `tracks` page embedded in a playlist object, read on at 10
+    api = Endpoint(145)
+    first = api.page(0, limit=100)
+    assert list(iter_items(api.fetch, 10, first=first)) == list(range(145))
+    assert sorted(api.offsets) == [100, 110, 120, 130, 140]
+
+
+def test_missing_total_walks_next_serially():
+    api = Endpoint(35, report_total=False)
+    assert fetch_items(api.fetch, 10, next_page=api.next_page) == list(range(35))
+    assert api.offsets == [0, 10, 20, 30]
+    assert api.max_in_flight == 1
+
+
+def test_missing_total_without_next_page_stops_at_the_first():
+    api = Endpoint(35, report_total=False)
+    assert fetch_items(api.fetch, 10) == list(range(10))
+
+
+def test_empty_first_page_yields_nothing():
+    assert list(iter_pages(lambda offset: None, 10)) == []
+    api = Endpoint(0)
+    assert fetch_items(api.fetch, 10) == []
@@ -0,0 +1,20 @@
+"""Pickles written by the CLI, old and new, load as Track records."""
+import pickle
+
+from PlaylistManager import load_pickled_tracks
+from app.tracks import Track
+
+
+def test_legacy_tuple_pickle_loads_as_tracks(tmp_path):
+    path = tmp_path / 'others.pkl'
+    path.write_bytes(pickle.dumps([('id1', 'Artist', 'Title'), ('id2', 'Other', 'Song')]))
+    tracks = load_pickled_tracks(str(path))
+    assert [(t.id, t.artist, t.name) for t in tracks] == [('id1', 'Artist', 'Title'), ('id2', 'Other', 'Song')]
+    assert tracks[0].uri == 'spotify:track:id1'
+
+
+def test_track_pickle_round_trips(tmp_path):
+    path = tmp_path / 'others.pkl'
+    saved = [Track('id1', 'Title', 'Artist, Feat', album_image='img')]
+    path.write_bytes(pickle.dumps(saved))
+    assert load_pickled_tracks(str(path)) == saved
@@ -0,0 +1,63 @@
+"""sync_playlist must land insertions at the right positions even when the
+playlist holds items it cannot write (local files, unavailable tracks).
+"""
+import random
+
+from app.playlist_writer import plan_sync, sync_playlist
+
+
+class FakePlaylist:
+    """The write calls of spotipy that sync_playlist uses, on an in-memory playlist.
+
+    `items` holds real uris plus local/unavailable entries, which the API
+    reports as `spotify:local:...` and None and which can't be removed by uri.
+    """
+
+    def __init__(self, items):
+        self.items = list(items)
+        self.version = 0
+
+    def _snapshot(self):
+        self.version += 1
+        return {'snapshot_id': f'snap-{self.version}'}
+
+    def playlist_remove_all_occurrences_of_items(self, playlist_id, uris, snapshot_id=None):
+        gone = set(uris)
+        self.items = [u for u in self.items if u not in gone]
+        return self._snapshot()
+
+    def playlist_add_items(self, playlist_id, uris, position=None):
+        at = len(self.items) if position is None else position
+        self.items[at:at] = uris
+        return self._snapshot()
+
+    def playlist_replace_items(self, playlist_id, uris):
+        self.items = list(uris)
+        return self._snapshot()
+
+
+def _known(items):
+    # what fetch_playlist_uris reports: unwritable items as None
+    return [u if u and not u.startswith('spotify:local:') else None for u in items]
+
+
+def test_plan_keeps_placeholders_in_place():
+    current = ['a', None, 'b', 'c']
+    remove, inserts = plan_sync(current, ['a', 'x', 'b', 'c', 'y'])
+    assert remove == []
+    assert inserts == [(1, ['x']), (5, ['y'])]
+
+
+def test_sync_with_unwritable_items_reaches_target():
+    rnd = random.Random(7)
+    pool = [f'spotify:track:{i}' for i in range(10)]
+    unwritable = [None, 'spotify:local:artist:album:title:180']
+    for _ in range(500):
+        items = [rnd.choice(pool + unwritable) for _ in range(rnd.randint(0, 14))]
+        target = [rnd.choice(pool) for _ in range(rnd.randint(0, 14))]
+        sp = FakePlaylist(items)
+        stats = sync_playlist(sp, 'pl', target, current_uris=_known(items), snapshot_id='snap-0')
+        assert [u for u in sp.items if u in pool] == target
+        # local and unavailable items survive, in their original order
+        assert [u for u in sp.items if u not in pool] == [u for u in items if u not in pool]
+        assert stats['uris'] == _known(sp.items)
@@ -0,0 +1,22 @@
+"""GrowingResult payloads must decode to the result they are published with."""
+import json
+
+from app.result_store import GrowingResult, MemoryResultStore, SQLiteResultStore
+
+
+def test_growing_result_payload_matches_result(tmp_path):
+    partial = GrowingResult({'id': 'g', 'owner': 'alice', 'playlists': [], 'tracks': [['t0', 'Song', 'A', None, None, None]]})
+    stores = [MemoryResultStore(), SQLiteResultStore(path=str(tmp_path / 'results.sqlite3'))]
+    readers = []
+    for n in range(3):
+        partial.extend('playlists', [{'id': f'p{n}', 'name': f'Mix "{n}"', 'all_refs': [0, n]}])
+        partial.extend('tracks', [[f't{n + 1}', 'Söng', 'B', None, None, None]])
+        result, payload = partial.snapshot(processed=n + 1, status='running')
+        assert json.loads(payload) == result
+        for store in stores:
+            store.put('g', result, owner='alice', payload=payload)
+            assert store.get('g') == result
+        readers.append(result)
+    # earlier snapshots are not changed by later appends
+    assert [len(r['playlists']) for r in readers] == [1, 2, 3]
+    assert json.loads(GrowingResult({}, lists=()).snapshot()[1]) == {}
@@ -0,0 +1,88 @@
+"""429 handling: the pooled session must hand every 429 to the request
+scheduler, which pauses once per 429 and makes exactly one HTTP attempt per try.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import spotipy
+
+from app import scheduler
+from app.http_pool import get_session
+from app.metrics import METRICS, render_prometheus
+from app.scheduler import RequestScheduler
+
+
+class _Throttling(BaseHTTPRequestHandler):
+    """Answers the first `throttle` requests with 429 + Retry-After, then 200."""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits += 1
+            throttled = server.hits <= server.throttle
+        body = json.dumps({'error': {'status': 429, 'message': 'slow down'}} if throttled else {'id': 'me'}).encode()
+        self.send_response(429 if throttled else 200)
+        if throttled:
+            self.send_header('Retry-After', '1')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Throttling)
+    server.lock, server.hits, server.throttle = threading.Lock(), 0, 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    sp = spotipy.Spotify(auth='token', requests_session=get_session())
+    sp.prefix = f'http://127.0.0.1:{server.server_address[1]}/v1/'
+    yield server, sp
+    server.shutdown()
+    server.server_close()
+
+
+def _by_endpoint(kind):
+    return METRICS.snapshot()[kind].get(('/me', 'GET'), 0)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    calls = []
+    monkeypatch.setattr(scheduler.time, 'sleep', lambda s: calls.append(s))
+    return calls
+
+
+def test_one_429_pauses_once_and_retries_once(api, sleeps):
+    server, sp = api
+    server.throttle = 1
+    sched = RequestScheduler(max_retries=3)
+    throttled, retried = _by_endpoint('throttled'), _by_endpoint('retried')
+    assert sched.call('token', sp.current_user) == {'id': 'me'}
+    assert (_by_endpoint('throttled') - throttled, _by_endpoint('retried') - retried) == (1, 1)
+    assert 'spotify_api_retries_total{endpoint="/me",method="GET"}' in render_prometheus(METRICS)
+    assert server.hits == 2
+    assert len(sleeps) == 1 and sleeps[0] >= 1
+    stats = sched.stats()
+    assert (stats['calls'], stats['throttled'], stats['retried'], stats['failed']) == (2, 1, 1, 0)
+
+
+def test_persistent_429_makes_one_attempt_per_try(api, sleeps):
+    server, sp = api
+    server.throttle = 100
+    sched = RequestScheduler(max_retries=2)
+    throttled, retried = _by_endpoint('throttled'), _by_endpoint('retried')
+    with pytest.raises(spotipy.SpotifyException) as info:
+        sched.call('token', sp.current_user)
+    assert info.value.http_status == 429
+    assert server.hits == 3
+    assert len(sleeps) == 2
+    assert (_by_endpoint('throttled') - throttled, _by_endpoint('retried') - retried) == (3, 2)
+    stats = sched.stats()
+    assert (stats['calls'], stats['throttled'], stats['retried'], stats['failed']) == (3, 3, 2, 1)
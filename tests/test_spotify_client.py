@@ -0,0 +1,81 @@
+"""SpotifyClient.iter_many_playlist_tracks: ordered, bounded, cancellable and fresh."""
+import threading
+import time
+
+from app import library_cache, spotify_client
+from app.library_cache import LIBRARY
+from app.spotify_client import SpotifyClient
+from app.tracks import Track
+
+
+def _client(monkeypatch, started, delay=0.05):
+    lock = threading.Lock()
+
+    def stream(sp, uid, pid):
+        with lock:
+            started.append(pid)
+        time.sleep(delay)
+        return [pid]
+
+    monkeypatch.setattr(SpotifyClient, '_stream_playlist_tracks', staticmethod(stream))
+    monkeypatch.setattr(spotify_client, 'MAX_WORKERS', 4)
+    client = SpotifyClient()
+    client.user_id = 'me'
+    monkeypatch.setattr(client, '_ensure_token', lambda: True)
+    monkeypatch.setattr(client, 'get_playlists', lambda: [])
+    return client
+
+
+def test_yields_every_playlist_in_order(monkeypatch):
+    started = []
+    client = _client(monkeypatch, started, delay=0)
+    ids = [f'p{i}' for i in range(30)]
+    assert list(client.iter_many_playlist_tracks(ids)) == [(pid, [pid]) for pid in ids]
+
+
+def test_closing_the_generator_drops_queued_downloads(monkeypatch):
+    started = []
+    client = _client(monkeypatch, started)
+    sources = client.iter_many_playlist_tracks([f'p{i}' for i in range(200)])
+    assert next(sources) == ('p0', ['p0'])
+    began = time.time()
+    sources.close()
+    # no waiting for the remaining downloads, and only the window ever started
+    assert time.time() - began < 0.5
+    time.sleep(0.2)
+    assert len(started) <= 2 * 4 + 4
+
+
+class FakeSpotify:
+    """Listing and playlist pages for one playlist `pl` now at snapshot `s2`."""
+
+    def __init__(self):
+        self.item_calls = 0
+
+    def current_user_playlists(self, limit=50, offset=0):
+        return {'items': [{'id': 'pl', 'name': 'Mix', 'tracks': {'total': 1}, 'snapshot_id': 's2'}],
+                'total': 1, 'limit': limit, 'next': None}
+
+    def playlist_items(self, playlist_id, fields=None, limit=100, offset=0):
+        self.item_calls += 1
+        track = {'id': 'new', 'uri': 'spotify:track:new', 'name': 'New', 'artists': [{'name': 'A'}], 'album': {}}
+        return {'items': [{'track': track}], 'total': 1, 'limit': limit, 'next': None}
+
+    def next(self, page):
+        return None
+
+
+def test_many_playlist_tracks_revalidates_a_stale_listing(monkeypatch):
+    user = 'stale-listing-user'
+    LIBRARY.clear(user)
+    LIBRARY.put_listing(user, [{'id': 'pl', 'name': 'Mix', 'tracks': 1, 'snapshot_id': 's1'}])
+    LIBRARY.put_tracks(user, 'pl', [Track('old', 'Old', 'A')], snapshot_id='s1')
+    monkeypatch.setattr(library_cache, 'LISTING_TTL', 0)  # the listing has expired
+    client = SpotifyClient()
+    client.user_id = user
+    client.sp = FakeSpotify()
+    monkeypatch.setattr(client, '_ensure_token', lambda: True)
+    [(pid, tracks)] = client.iter_many_playlist_tracks(['pl'])
+    assert [t.id for t in tracks] == ['new']
+    assert client.sp.item_calls == 1
+    LIBRARY.clear(user)